@@ -0,0 +1,132 @@
+#batch.py
+
+import asyncio
+import time
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+
+from kb_loader import load_kb
+from logic_utils import LogicSolver
+from metrics import metrics
+from solve_cache import get_default_solve_cache, make_solve_key
+
+
+# Token bucket: allows `rate` acquisitions per second, with bursts up to `burst`
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                # Refill for the time that passed, then take a token if there is one
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# Limits LLM traffic: at most `concurrency` requests in flight, and (if `rate`
+# is set) at most `rate` new requests per second. Use as `async with throttle:`
+class LLMThrottle:
+    def __init__(self, concurrency=8, rate=None, burst=None):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate, burst) if rate else None
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        if self.bucket is not None:
+            try:
+                await self.bucket.acquire()
+            except BaseException:
+                self.semaphore.release()
+                raise
+        return self
+
+    async def __aexit__(self, *exc):
+        self.semaphore.release()
+        return False
+
+
+# Solve one program in a worker process (must be top-level so it can be pickled)
+# The KB is loaded through kb_loader, so each worker parses/maps it only once.
+def solve_program(logic_text, kb_path=None, facts_only=False):
+    kb = None
+    if kb_path is not None:
+        kb = load_kb(kb_path)
+        if facts_only:
+            kb = kb.facts_only()
+    return LogicSolver().solve_logic(logic_text, kb=kb)
+
+
+# Run CPU-bound solver work off the event loop
+async def run_solver(executor, logic_text, kb_path=None, facts_only=False):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, solve_program, logic_text, kb_path, facts_only)
+
+
+# Adapter so the compiled StateGraph can be used like the other pipelines
+# Each question holds one throttle slot for its whole graph run, since the
+# graph's nodes call the LLM themselves. The graph stops at valid rules and
+# the solve step runs on `executor` like the other pipelines' (a program the
+# graph already solved while streaming comes from the solve cache).
+class GraphPipeline:
+    async def asolve(self, question, throttle=None, executor=None):
+        from inference_graph import KB_PATH, InferenceState, get_compiled_graph
+        async with throttle or nullcontext():
+            final_state = await get_compiled_graph(solve=False).ainvoke(InferenceState(question))
+        logic_rule = final_state.get("logic_rule")
+
+        cache = get_default_solve_cache()
+        key = make_solve_key(logic_rule, load_kb(KB_PATH))
+        result = cache.get(key)
+        metrics.inc("solve_cache", result="hit" if result is not None else "miss")
+        if result is None:
+            result = cache.put(key, await run_solver(executor, logic_rule, KB_PATH))
+        return result
+
+
+# Solve many questions concurrently and yield (index, question, result) as each
+# one finishes (result is the exception if that question failed).
+#   pipeline:    anything with `async asolve(question, throttle, executor)`,
+#                e.g. LogicLMModel, LogicLMChain or GraphPipeline()
+#   concurrency: max LLM requests in flight
+#   rate:        max LLM requests started per second (None = unlimited)
+#   workers:     solver processes (None = one per CPU, 0 = threads in this process)
+async def solve_many(pipeline, questions, concurrency=8, rate=None, workers=None):
+    throttle = LLMThrottle(concurrency, rate)
+    executor = None if workers == 0 else ProcessPoolExecutor(workers)
+
+    async def run_one(index, question):
+        try:
+            result = await pipeline.asolve(question, throttle=throttle, executor=executor)
+        except Exception as e:
+            result = e
+        return index, question, result
+
+    tasks = [asyncio.create_task(run_one(i, q)) for i, q in enumerate(questions)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Blocking helper: solve all questions, return results in input order
+def run_batch(pipeline, questions, **kwargs):
+    async def collect():
+        results = [None] * len(questions)
+        async for index, _, result in solve_many(pipeline, questions, **kwargs):
+            results[index] = result
+        return results
+    return asyncio.run(collect())
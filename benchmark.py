@@ -0,0 +1,317 @@
+#benchmark.py
+#
+# Synthetic-KB benchmarks for the parser, the solver and the LLM pipelines.
+#
+#   python benchmark.py --sizes 100,1000,10000 --output bench.json
+#   python benchmark.py --sizes 1000 --compare bench.json   # flag regressions
+#
+# Pipelines run against langchain_llm.StubChatModel, so no network is needed;
+# pipelines whose dependencies are not installed are reported as skipped.
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from logic_utils import LogicSolver, check_logic_validity, parse_rule
+from metrics import metrics
+
+# Non-recursive family rules (what the graph asks the LLM for)
+FAMILY_RULES = """uncle(X, Y) :- parent(Z, Y), sibling(X, Z).
+aunt(X, Y) :- parent(Z, Y), sibling(X, Z).
+cousin(X, Y) :- parent(Z, X), parent(W, Y), sibling(Z, W).
+grandparent(X, Y) :- parent(X, Z), parent(Z, Y).
+greatgrandparent(X, Y) :- parent(X, Z), parent(Z, W), parent(W, Y)."""
+
+# Recursive rules (transitive closure)
+RECURSIVE_RULES = """ancestor(X, Y) :- parent(X, Y).
+ancestor(X, Y) :- parent(X, Z), ancestor(Z, Y).
+descendant(X, Y) :- ancestor(Y, X)."""
+
+RULE_SETS = {
+    "family": FAMILY_RULES,
+    "recursive": RECURSIVE_RULES,
+    "all": FAMILY_RULES + "\n" + RECURSIVE_RULES,
+}
+
+# A run is flagged as a regression when it is this much slower than the baseline
+REGRESSION_THRESHOLD = 1.25
+
+
+# Generate a family tree as Prolog facts
+#   people:           total number of people
+#   depth:            number of generations
+#   sibling_density:  chance that two consecutive children of a parent get a
+#                     sibling(...) fact (one direction; like kb.txt, the KB ends
+#                     with the symmetric sibling rule for the other)
+#   second_parent:    chance that a child also gets a second parent
+def generate_family_tree(people, depth=6, sibling_density=0.5, second_parent=0.3, seed=0):
+    rng = random.Random(seed)
+    depth = max(1, min(depth, people))
+
+    # Split people into generations of (roughly) equal size
+    generations = []
+    start = 0
+    for g in range(depth):
+        size = people // depth + (1 if g < people % depth else 0)
+        generations.append([f"p{i}" for i in range(start, start + size)])
+        start += size
+
+    lines = []
+    for older, younger in zip(generations, generations[1:]):
+        children_of = {}
+        for child in younger:
+            first = rng.randrange(len(older))
+            parents = [older[first]]
+            if len(older) > 1 and rng.random() < second_parent:
+                # Any other member of the older generation: skip over the first
+                other = rng.randrange(len(older) - 1)
+                parents.append(older[other + 1 if other >= first else other])
+            for parent in parents:
+                lines.append(f"parent({parent}, {child}).")
+            children_of.setdefault(parents[0], []).append(child)
+        for children in children_of.values():
+            for a, b in zip(children, children[1:]):
+                if rng.random() < sibling_density:
+                    lines.append(f"sibling({a}, {b}).")
+    lines.append("sibling(X, Y) :- sibling(Y, X).")
+    return "\n".join(lines)
+
+
+# Time a function call: (seconds, result)
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+# Peak traced memory (bytes) of a function call
+def peak_memory(function, *args):
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+# Rules needed to compute one head predicate (the rule plus everything it uses)
+def rules_for(head, rules_text):
+    rules = [line for line in rules_text.split("\n") if line.strip()]
+    compiled = {line: parse_rule(line.strip().rstrip(".")) for line in rules}
+    needed, todo = set(), [head]
+    while todo:
+        pred = todo.pop()
+        if pred in needed:
+            continue
+        needed.add(pred)
+        for line, rule in compiled.items():
+            if rule[0] == pred:
+                todo.extend(p for p, _ in rule[2])
+    return "\n".join(line for line, rule in compiled.items() if rule[0] in needed)
+
+
+# Parse / validity / solve timings for one KB size and rule set
+# engine: LogicSolver evaluation engine for the solve timings ("python" or "numpy")
+def bench_solver(kb_text, rules_text, repeat, engine="python"):
+    program = kb_text + "\n" + rules_text
+    result = {}
+
+    def solver():
+        return LogicSolver(engine=engine)
+
+    result["parse_seconds"] = min(timed(LogicSolver().parse_logic, program)[0] for _ in range(repeat))
+    result["check_validity_seconds"] = min(
+        timed(check_logic_validity, program)[0] for _ in range(repeat))
+
+    times = []
+    for _ in range(repeat):
+        seconds, derived = timed(solver().solve_logic, program)
+        times.append(seconds)
+    result["solve_seconds"] = min(times)
+    result["derived_facts"] = len(derived)
+    result["solve_peak_bytes"] = peak_memory(solver().solve_logic, program)
+
+    # Each head predicate solved on its own (with the rules it depends on)
+    per_rule = {}
+    heads = sorted({parse_rule(line.strip().rstrip("."))[0]
+                    for line in rules_text.split("\n") if line.strip()})
+    for head in heads:
+        seconds, derived = timed(solver().solve_logic, kb_text + "\n" + rules_for(head, rules_text))
+        per_rule[head] = {"seconds": seconds, "derived_facts": len(derived)}
+    result["per_rule"] = per_rule
+    return result
+
+
+# End-to-end pipeline timings against a stub LLM that returns `rules_text`
+def bench_pipelines(kb_text, rules_text, repeat):
+    from solve_cache import get_default_solve_cache
+
+    pipelines = ("LogicLMModel", "LogicLMChain", "graph")
+    try:
+        from langchain_llm import StubChatModel
+    except ImportError as e:
+        return {name: {"skipped": str(e)} for name in pipelines}
+
+    results = {}
+    stub = StubChatModel(rules_text)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        kb_path = os.path.join(tmp, "kb.txt")
+        with open(kb_path, "w") as f:
+            f.write(kb_text + "\n" + rules_text)
+
+        def run(name, build, solve):
+            try:
+                pipeline = build()
+            except ImportError as e:
+                results[name] = {"skipped": str(e)}
+                return
+            times = []
+            for _ in range(repeat):
+                get_default_solve_cache().clear()  # Every run solves for real
+                times.append(timed(solve, pipeline)[0])
+            results[name] = {"seconds": min(times)}
+
+        # Caching is turned off so every run includes the (stub) LLM call path
+        # LogicLMModel has no KB, so its "translation" returns the facts too
+        def build_model():
+            from logic_lm import LogicLMModel
+            model = LogicLMModel(llm=StubChatModel(kb_text + "\n" + rules_text))
+            model.llm.cache = False
+            return model
+        run("LogicLMModel", build_model, lambda m: m.solve(kb_text))
+
+        def build_chain():
+            from logic_lm_chain import LogicLMChain
+            chain = LogicLMChain(kb_path, llm=stub)
+            chain.llm.cache = False
+            return chain
+        run("LogicLMChain", build_chain, lambda c: c.solve("Define family relationships."))
+
+        # The graph's module settings are swapped for the run and put back after
+        graph_settings = {}
+
+        def build_graph():
+            import inference_graph
+            graph_settings.update(
+                (name, getattr(inference_graph, name)) for name in ("KB_PATH", "LLM_CACHE", "_llm"))
+            inference_graph.set_llm(stub)
+            inference_graph.KB_PATH = kb_path
+            inference_graph.LLM_CACHE = False
+            inference_graph.get_compiled_graph()  # langgraph is imported here
+            return inference_graph
+        try:
+            run("graph", build_graph, lambda g: g.compiled_graph.invoke(g.InferenceState("Define family relationships.")))
+        finally:
+            if graph_settings:
+                import inference_graph
+                for name, value in graph_settings.items():
+                    setattr(inference_graph, name, value)
+        get_default_solve_cache().clear()  # Drop results for the temporary KB
+
+    return results
+
+
+# One extra solve with metrics on: per-rule candidates, produced tuples and times
+def collect_metrics(kb_text, rules_text):
+    metrics.reset()
+    metrics.enable()
+    try:
+        LogicSolver().solve_logic(kb_text + "\n" + rules_text)
+        return metrics.snapshot()
+    finally:
+        metrics.disable()
+        metrics.reset()
+
+
+# Compare against an earlier results file; returns a list of regression messages
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    old = {(r["people"], r["rules"], r.get("engine", "python")): r for r in baseline["results"]}
+    regressions = []
+    for run in results:
+        before = old.get((run["people"], run["rules"], run.get("engine", "python")))
+        if before is None:
+            continue
+        for metric in ("parse_seconds", "check_validity_seconds", "solve_seconds"):
+            if before.get(metric) and run[metric] > before[metric] * REGRESSION_THRESHOLD:
+                regressions.append(
+                    f"{run['rules']}/{run['people']} {metric}: "
+                    f"{before[metric]:.4f}s -> {run[metric]:.4f}s"
+                )
+    return regressions
+
+
+# Current git commit, to tell result files apart
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark LogicSolver and the LLM pipelines.")
+    parser.add_argument("--sizes", default="100,1000,10000", help="comma-separated people counts")
+    parser.add_argument("--depth", type=int, default=6, help="generations in the family tree")
+    parser.add_argument("--sibling-density", type=float, default=0.5)
+    parser.add_argument("--rules", default="all", choices=sorted(RULE_SETS))
+    parser.add_argument("--repeat", type=int, default=3, help="runs per timing (best is kept)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engine", default="python", choices=["python", "numpy"],
+                        help="LogicSolver engine for the solve timings")
+    parser.add_argument("--pipelines", action="store_true", help="also time the LLM pipelines (stub LLM)")
+    parser.add_argument("--metrics", action="store_true", help="add per-rule join metrics (separate run)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="earlier results file to check for regressions")
+    args = parser.parse_args(argv)
+
+    results = []
+    for people in [int(s) for s in args.sizes.split(",") if s]:
+        kb_text = generate_family_tree(people, args.depth, args.sibling_density, seed=args.seed)
+        rules_text = RULE_SETS[args.rules]
+        run = {"people": people, "rules": args.rules, "engine": args.engine, "depth": args.depth,
+               "sibling_density": args.sibling_density,
+               "facts": kb_text.count("\n") + 1}
+        run.update(bench_solver(kb_text, rules_text, args.repeat, args.engine))
+        if args.pipelines:
+            run["pipelines"] = bench_pipelines(kb_text, rules_text, args.repeat)
+        if args.metrics:
+            run["metrics"] = collect_metrics(kb_text, rules_text)
+        results.append(run)
+        print(f"{people:>8} people  parse {run['parse_seconds']:.4f}s  "
+              f"solve {run['solve_seconds']:.4f}s  derived {run['derived_facts']}  "
+              f"peak {run['solve_peak_bytes'] / 1e6:.1f} MB")
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+#closure.py
+
+import time
+
+from fact_store import Relation
+from metrics import metrics
+
+# Dedicated operators for two rule shapes the generic joins handle poorly:
+#
+#   symmetric:          p(X, Y) :- p(Y, X).
+#   linear closure:     p(X, Y) :- e(X, Y).               (one per edge predicate,
+#                       p(X, Y) :- e(X, Z), p(Z, Y).       plus any other such rules)
+#                       (right-linear, or left-linear: p(X, Y) :- p(X, Z), e(Z, Y).)
+#
+# A symmetric rule just swaps the two columns of its input (SymmetricPlan in
+# logic_utils uses swapped_rows). A stratum made only of linear closure rules
+# (e.g. ancestor) is computed in one pass instead of one semi-naive round per
+# generation: reachable sets are built bottom-up over the strongly connected
+# components of the edge graph, so every node's set is a C-level set union of
+# its successors' sets and long chains cost no extra rounds.
+
+
+def is_var(arg):
+    return (arg[:1].isupper() or arg[:1] == '_') and arg != '_'
+
+
+# Whether a compiled rule is p(X, Y) :- p(Y, X)
+def is_symmetric(rule):
+    head_predicate, head_args, body_preds, _ = rule
+    if len(head_args) != 2 or len(body_preds) != 1:
+        return False
+    pred, args = body_preds[0]
+    x, y = head_args
+    return pred == head_predicate and is_var(x) and is_var(y) and x != y and list(args) == [y, x]
+
+
+# Rows of a binary relation with the columns swapped, optionally only those
+# whose (original) column `partition_column` falls in hash partition `part`
+def swapped_rows(source, partition=None, partition_column=0):
+    if source.dead:
+        rows = [(b, a) for a, b in source]
+    else:
+        rows = list(zip(source.columns[1], source.columns[0]))
+    if partition is not None:
+        part, parts = partition
+        swapped = 1 - partition_column
+        rows = [row for row in rows if row[swapped] % parts == part]
+    return rows
+
+
+# Strongly connected components of graph (node → successors), iteratively
+# (genealogies are far deeper than Python's recursion limit). Components come
+# out after every component they reach. Nodes without successors are skipped.
+def components(graph):
+    index, low = {}, {}
+    stack, on_stack = [], set()
+    result = []
+    for root in graph:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph[root]))]
+        while work:
+            node, successors = work[-1]
+            descended = False
+            for nxt in successors:
+                if nxt not in graph:
+                    continue
+                if nxt not in index:
+                    index[nxt] = low[nxt] = len(index)
+                    stack.append(nxt)
+                    on_stack.add(nxt)
+                    work.append((nxt, iter(graph[nxt])))
+                    descended = True
+                    break
+                if nxt in on_stack and index[nxt] < low[node]:
+                    low[node] = index[nxt]
+            if descended:
+                continue
+            work.pop()
+            if work and low[node] < low[work[-1][0]]:
+                low[work[-1][0]] = low[node]
+            if low[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                result.append(component)
+    return result
+
+
+# A stratum computed as a linear transitive closure (see the top of the file)
+class LinearClosure:
+    def __init__(self, rule_list, predicate, seeds, edges, left, filter_reflexive):
+        self.rules = rule_list
+        self.predicate = predicate
+        self.seeds = seeds            # Predicates of the non-recursive rules
+        self.edges = edges            # Predicates the recursion steps along
+        self.left = left              # Left-linear: work on the transposed graph
+        self.filter_reflexive = filter_reflexive
+
+    # A LinearClosure for a stratum, or None if it does not have that shape
+    @classmethod
+    def detect(cls, stratum_preds, stratum_rules):
+        if len(stratum_preds) != 1:
+            return None
+        (predicate,) = stratum_preds
+        seeds, edges, sides, filters = [], [], set(), set()
+        for head_predicate, head_args, body_preds, filter_reflexive in stratum_rules:
+            if len(head_args) != 2:
+                return None
+            x, y = head_args
+            if not (is_var(x) and is_var(y)) or x == y:
+                return None
+            filters.add(filter_reflexive)
+            if len(body_preds) == 1:
+                pred, args = body_preds[0]
+                if pred == predicate or list(args) != [x, y]:
+                    return None
+                seeds.append(pred)
+                continue
+            if len(body_preds) != 2:
+                return None
+            recursive = [lit for lit in body_preds if lit[0] == predicate]
+            other = [lit for lit in body_preds if lit[0] != predicate]
+            if len(recursive) != 1 or len(other) != 1:
+                return None
+            (edge, edge_args), (_, rec_args) = other[0], recursive[0]
+            if len(edge_args) != 2 or len(rec_args) != 2:
+                return None
+            if list(edge_args[:1]) == [x] and list(rec_args[1:]) == [y] and edge_args[1] == rec_args[0]:
+                z, side = edge_args[1], "right"
+            elif list(rec_args[:1]) == [x] and list(edge_args[1:]) == [y] and rec_args[1] == edge_args[0]:
+                z, side = rec_args[1], "left"
+            else:
+                return None
+            if not is_var(z) or z in (x, y):
+                return None
+            edges.append(edge)
+            sides.add(side)
+        if not edges or len(sides) != 1 or len(filters) != 1:
+            return None
+        # With X == Y results dropped, reachable sets give the same answer as
+        # the rules only when every edge is also a first step (as in ancestor):
+        # otherwise a path may need to pass through its own target
+        filter_reflexive = filters.pop()
+        if filter_reflexive and not set(edges) <= set(seeds):
+            return None
+        return cls(stratum_rules, predicate, seeds, edges, sides == {"left"}, filter_reflexive)
+
+    # Binary rows of the given predicates as node → set of nodes (transposed
+    # for left-linear rules)
+    def adjacency(self, relations, predicates, extra=None):
+        graph = {}
+        sources = [relations.get(pred) for pred in predicates]
+        if extra is not None:
+            sources.append(extra)
+        for source in sources:
+            if source is None or source.arity != 2:
+                continue  # Missing or wrong arity: matches nothing
+            rows = ((b, a) for a, b in source) if self.left else iter(source)
+            for a, b in rows:
+                targets = graph.get(a)
+                if targets is None:
+                    graph[a] = {b}
+                else:
+                    targets.add(b)
+        return graph
+
+    # Compute the closure into relations[predicate]; returns the new tuples as
+    # {predicate: Relation} (one round, like a semi-naive round) and records
+    # stored facts the rules derive again in `rederived`
+    def run(self, relations, base, rederived):
+        predicate = self.predicate
+        relation = relations.get(predicate)
+        if relation is not None and relation.arity != 2:
+            return {}  # Head arity clashes with the stored facts: rules ignored
+        started = time.perf_counter()
+
+        # Step 1: adjacency of the recursion edges, and of the first steps
+        # (non-recursive rules plus facts already in the relation)
+        graph = self.adjacency(relations, self.edges)
+        derived_seeds = self.adjacency(relations, self.seeds)
+        seeds = self.adjacency(relations, self.seeds, relation)
+
+        # Step 2: reach(n) = seeds(n) ∪ reach(m) for every edge n → m, one
+        # component at a time, successors first
+        reach = {}
+        for component in components(graph):
+            members = set(component)
+            parts = []
+            for node in component:
+                own = seeds.get(node)
+                if own:
+                    parts.append(own)
+                for nxt in graph[node]:
+                    if nxt in members:
+                        continue  # Same component: same reachable set
+                    found = reach[nxt] if nxt in graph else seeds.get(nxt)
+                    if found:
+                        parts.append(found)
+            # Sets are never changed once built, so one part can be shared
+            reached = parts[0] if len(parts) == 1 else set().union(*parts)
+            for node in component:
+                reach[node] = reached
+
+        # Step 3: write the rows (swapped back for left-linear rules)
+        if relation is None:
+            relation = relations[predicate] = Relation(2)
+        fresh = Relation(2)
+        filter_reflexive = self.filter_reflexive
+        left = self.left
+        for node in graph.keys() | seeds.keys():
+            targets = reach.get(node) if node in graph else seeds[node]
+            if not targets:
+                continue
+            for target in targets:
+                if filter_reflexive and target == node:
+                    continue  # Skip nonsense results where X == Y
+                row = (target, node) if left else (node, target)
+                if relation.add(row):
+                    fresh.add(row)
+
+        # Step 4: stored facts with a derivation (first step or one edge on)
+        # A reachable set may hold its own node (through a cycle) while the
+        # relation does not, so that one case is checked against the relation
+        def holds(node, target):
+            if node == target and filter_reflexive:
+                return (node, node) in relation
+            return target in (reach[node] if node in graph else seeds.get(node, ()))
+
+        if base is not None and base.arity == 2 and len(base):
+            again = set()
+            for row in base:
+                node, target = (row[1], row[0]) if left else row
+                if filter_reflexive and node == target:
+                    continue
+                if target in derived_seeds.get(node, ()) or any(
+                        holds(nxt, target) for nxt in graph.get(node, ())):
+                    again.add(row)
+            if again:
+                rederived.setdefault(predicate, set()).update(again)
+
+        if metrics.enabled:
+            label = f"closure {predicate}"
+            metrics.observe("rule_seconds", time.perf_counter() - started, rule=label)
+            metrics.inc("rule_produced", len(fresh), rule=label)
+        return {predicate: fresh} if len(fresh) else {}
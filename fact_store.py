@@ -0,0 +1,384 @@
+#fact_store.py
+
+import threading
+from array import array
+
+# Each constant is stored as a 32-bit id, rows are packed into one int for dedup
+ID_BITS = 32
+
+
+# Interns constant names ("john", "mary", ...) to small integer ids
+# Every relation stores ids, so each name is held in memory exactly once
+# A loaded KB's table can be read from several threads (server.py), so new
+# ids are assigned under a lock; looking up an existing name takes no lock.
+class SymbolTable:
+    __slots__ = ("ids", "names", "lock")
+
+    def __init__(self):
+        self.ids = {}     # name → id
+        self.names = []   # id → name
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    # Return the id for a name, assigning a new one if needed
+    def intern(self, name):
+        symbol_id = self.ids.get(name)
+        if symbol_id is None:
+            with self.lock:
+                symbol_id = self.ids.get(name)
+                if symbol_id is None:
+                    symbol_id = len(self.names)
+                    self.names.append(name)
+                    self.ids[name] = symbol_id
+        return symbol_id
+
+    # Id for a name without assigning one (None if never seen)
+    def lookup(self, name):
+        return self.ids.get(name)
+
+    # Turn a row of ids back into a tuple of names
+    def decode(self, row):
+        names = self.names
+        return tuple(names[v] for v in row)
+
+    # Table for a forked store: names are looked up here, new ones are kept
+    # in the fork's own overlay (see SymbolOverlay)
+    def fork(self):
+        return SymbolOverlay(self)
+
+
+# Symbol table of a forked store, layered over the table it was forked from
+# Names the base already had when the fork was made keep their ids; new names
+# get ids from len(base) up and live only in the overlay, so they go away
+# with the fork instead of growing the (long-lived) base table. Ids the base
+# assigns later are not seen here, so the two never disagree on an id.
+# One fork is used by one thread at a time: no lock.
+class SymbolOverlay:
+    __slots__ = ("base", "size", "ids", "names")
+
+    def __init__(self, base):
+        self.base = base
+        self.size = len(base)  # Base ids below this are valid here
+        self.ids = {}          # new name → id (from `size` up)
+        self.names = []        # id - size → new name
+
+    def __len__(self):
+        return self.size + len(self.names)
+
+    def intern(self, name):
+        symbol_id = self.lookup(name)
+        if symbol_id is None:
+            symbol_id = self.ids[name] = self.size + len(self.names)
+            self.names.append(name)
+        return symbol_id
+
+    def lookup(self, name):
+        symbol_id = self.base.ids.get(name)
+        if symbol_id is not None and symbol_id < self.size:
+            return symbol_id
+        return self.ids.get(name)
+
+    def decode(self, row):
+        base_names = self.base.names
+        if not self.names:
+            return tuple(base_names[v] for v in row)
+        size, names = self.size, self.names
+        return tuple(base_names[v] if v < size else names[v - size] for v in row)
+
+    # A fork of a fork: same base, its own copy of the new names so far
+    def fork(self):
+        clone = SymbolOverlay.__new__(SymbolOverlay)
+        clone.base = self.base
+        clone.size = self.size
+        clone.ids = dict(self.ids)
+        clone.names = list(self.names)
+        return clone
+
+
+# Pack a row of ids into one int (dedup key), picked once per arity
+def make_packer(arity):
+    if arity == 1:
+        return lambda row: row[0]
+    if arity == 2:
+        return lambda row: (row[0] << ID_BITS) | row[1]
+
+    def pack(row):
+        key = 0
+        for value in row:
+            key = (key << ID_BITS) | value
+        return key
+    return pack
+
+
+# A relation of fixed arity stored column-wise in int arrays
+# `keys` holds one packed int per row for O(1) membership and dedup.
+# Hash indexes on argument positions are built the first time a join asks for
+# them and are kept up to date as rows are added; they map key → row ids.
+# A relation loaded from a snapshot starts with read-only memoryview columns
+# and keys=None; both are materialised the first time they are needed.
+# Removed rows leave a tombstone (their id goes into `dead`) until more than
+# half the rows are dead, then the columns are compacted.
+class Relation:
+    __slots__ = ("arity", "columns", "keys", "indexes", "pack", "dead")
+
+    def __init__(self, arity, rows=()):
+        self.arity = arity
+        self.columns = [array('i') for _ in range(arity)]
+        self.keys = set()
+        self.indexes = {}  # positions tuple → {key → [row ids]}
+        self.pack = make_packer(arity)
+        self.dead = set()  # row ids that were removed
+        for row in rows:
+            self.add(row)
+
+    # Wrap existing int buffers (e.g. slices of a memory-mapped snapshot)
+    @classmethod
+    def from_buffers(cls, arity, columns, rows):
+        relation = cls(arity)
+        relation.columns = columns
+        relation.keys = None if rows else set()
+        return relation
+
+    def __len__(self):
+        if not self.arity:
+            return len(self.key_set())
+        return len(self.columns[0]) - len(self.dead)
+
+    def __contains__(self, row):
+        return self.pack(row) in self.key_set()
+
+    # The dedup key set, built from the columns on first use
+    def key_set(self):
+        if self.keys is None:
+            self.keys = set(map(self.pack, zip(*self.columns)))
+        return self.keys
+
+    # Iterate rows as tuples of ids
+    def __iter__(self):
+        if not self.arity:
+            return iter([()] if self.key_set() else [])
+        if self.dead:
+            return (self.row(row_id) for row_id in self.lookup((), None))
+        return zip(*self.columns)
+
+    # Copy of the live rows (arrays are copied at C speed; indexes are rebuilt lazily)
+    def copy(self):
+        if self.dead:
+            return Relation(self.arity, self)
+        clone = Relation(self.arity)
+        for target, column in zip(clone.columns, self.columns):
+            target.frombytes(memoryview(column).cast('B'))
+        clone.keys = None if self.keys is None else set(self.keys)
+        return clone
+
+    # Row number `row_id` as a tuple of ids
+    def row(self, row_id):
+        return tuple(column[row_id] for column in self.columns)
+
+    # Make snapshot-backed columns and keys writable before the first change
+    def writable(self):
+        if self.keys is None:
+            self.key_set()
+            self.columns = [array('i', column) for column in self.columns]
+        return self.keys
+
+    # Add a row of ids, returns False if it was already there
+    def add(self, row):
+        key = self.pack(row)
+        keys = self.keys
+        if keys is None:
+            keys = self.writable()
+        if key in keys:
+            return False
+        row_id = len(self.columns[0]) if self.arity else 0
+        keys.add(key)
+        for column, value in zip(self.columns, row):
+            column.append(value)
+        if not self.indexes:
+            return True
+        for positions, index in self.indexes.items():
+            index_key = row[positions[0]] if len(positions) == 1 else tuple(row[p] for p in positions)
+            bucket = index.get(index_key)
+            if bucket is None:
+                index[index_key] = [row_id]
+            else:
+                bucket.append(row_id)
+        return True
+
+    # Append `count` rows known not to be here yet, given column-wise as int
+    # arrays (e.g. rows already deduplicated by a parallel worker); the
+    # columns are appended at C speed and no row is checked
+    def extend(self, columns, count):
+        keys = self.writable()
+        if not self.arity:
+            if count:
+                keys.add(self.pack(()))
+            return
+        start = len(self.columns[0])
+        for target, column in zip(self.columns, columns):
+            target.extend(column)
+        keys.update(map(self.pack, zip(*columns)))
+        for positions, index in self.indexes.items():
+            if len(positions) == 1:
+                index_keys = columns[positions[0]]
+            else:
+                index_keys = zip(*[columns[p] for p in positions])
+            for row_id, index_key in enumerate(index_keys, start):
+                bucket = index.get(index_key)
+                if bucket is None:
+                    index[index_key] = [row_id]
+                else:
+                    bucket.append(row_id)
+
+    # Remove a row of ids, returns False if it was not there
+    def remove(self, row):
+        key = self.pack(row)
+        keys = self.writable()
+        if key not in keys:
+            return False
+        keys.discard(key)
+        if not self.arity:
+            return True
+
+        # Find the row id through the all-columns index, then tombstone it
+        everything = tuple(range(self.arity))
+        row_id = self.index_on(everything)[row[0] if self.arity == 1 else row][0]
+        self.dead.add(row_id)
+        for positions, index in self.indexes.items():
+            index_key = row[positions[0]] if len(positions) == 1 else tuple(row[p] for p in positions)
+            bucket = index[index_key]
+            bucket.remove(row_id)
+            if not bucket:
+                del index[index_key]
+
+        # Compact once tombstones outnumber live rows
+        if len(self.dead) > len(keys):
+            live = [self.row(r) for r in self.lookup((), None)]
+            self.columns = [array('i', values) for values in zip(*live)] if live else \
+                [array('i') for _ in range(self.arity)]
+            self.dead = set()
+            self.indexes = {}
+        return True
+
+    # Build (or fetch) the hash index on the given argument positions
+    # Single-position indexes are keyed by the bare id, others by a tuple
+    def index_on(self, positions):
+        index = self.indexes.get(positions)
+        if index is None:
+            index = {}
+            if len(positions) == 1:
+                keys = self.columns[positions[0]]
+            else:
+                keys = zip(*[self.columns[p] for p in positions])
+            dead = self.dead
+            for row_id, index_key in enumerate(keys):
+                if dead and row_id in dead:
+                    continue
+                bucket = index.get(index_key)
+                if bucket is None:
+                    index[index_key] = [row_id]
+                else:
+                    bucket.append(row_id)
+            self.indexes[positions] = index
+        return index
+
+    # Row ids whose values at `positions` equal `key`
+    def lookup(self, positions, key):
+        if not positions:
+            if not self.arity:
+                return range(len(self.key_set()))
+            if self.dead:
+                dead = self.dead
+                return [r for r in range(len(self.columns[0])) if r not in dead]
+            return range(len(self.columns[0]))
+        return self.index_on(positions).get(key, ())
+
+    # Expected rows per lookup on these positions (used to order joins)
+    # Exact when the index exists; otherwise guessed without building it,
+    # assuming each bound position divides the candidates evenly
+    def fanout(self, positions):
+        size = len(self)
+        if not positions or not size:
+            return size
+        index = self.indexes.get(positions)
+        if index is not None:
+            return size / len(index)
+        return size ** (1 - len(positions) / self.arity)
+
+
+# All facts of a program: one interned symbol table + one Relation per predicate
+# Iterating yields (predicate, [arg names]) like the old list of facts did.
+class FactStore:
+    __slots__ = ("symbols", "relations", "shared")
+
+    def __init__(self):
+        self.symbols = SymbolTable()
+        self.relations = {}  # predicate name → Relation
+        self.shared = set()  # predicates still borrowed from the store we forked
+
+    def __len__(self):
+        return sum(len(relation) for relation in self.relations.values())
+
+    def __iter__(self):
+        for predicate, relation in self.relations.items():
+            for row in relation:
+                yield predicate, list(self.symbols.decode(row))
+
+    def clear(self):
+        self.symbols = SymbolTable()
+        self.relations = {}
+        self.shared = set()
+
+    # Cheap copy that borrows this store's relations until they are written to
+    # Names new to the copy are interned in an overlay of this store's symbol
+    # table (SymbolTable.fork), so forking leaves this store unchanged.
+    def fork(self):
+        clone = FactStore()
+        clone.symbols = self.symbols.fork()
+        clone.relations = dict(self.relations)
+        clone.shared = set(self.relations)
+        return clone
+
+    # Encode a list of names as a row of ids
+    def encode(self, args):
+        return tuple(map(self.symbols.intern, args))
+
+    # Relation for a predicate to write to, created with the given arity if
+    # missing (a borrowed relation is copied first)
+    def relation(self, predicate, arity):
+        relation = self.relations.get(predicate)
+        if relation is None:
+            relation = self.relations[predicate] = Relation(arity)
+        elif predicate in self.shared:
+            relation = self.relations[predicate] = relation.copy()
+            self.shared.discard(predicate)
+        return relation
+
+    # Add a fact given as names, returns False if it was a duplicate
+    # (or if its arity does not match earlier facts of the same predicate)
+    def add(self, predicate, args):
+        relation = self.relation(predicate, len(args))
+        if relation.arity != len(args):
+            return False
+        return relation.add(self.encode(args))
+
+    # Remove a fact given as names, returns False if it was not stored
+    def remove(self, predicate, args):
+        if not self.contains(predicate, args):
+            return False
+        return self.relation(predicate, len(args)).remove(self.encode(args))
+
+    # O(1) membership test for a fact given as names
+    def contains(self, predicate, args):
+        relation = self.relations.get(predicate)
+        if relation is None or relation.arity != len(args):
+            return False
+        row = []
+        for arg in args:
+            symbol_id = self.symbols.lookup(arg)
+            if symbol_id is None:
+                return False
+            row.append(symbol_id)
+        return tuple(row) in relation
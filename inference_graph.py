@@ -1,32 +1,118 @@
 # inference_graph.py (UPGRADED with CoT + Self-Refinement)
 
-from langgraph.graph import StateGraph
-from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from logic_utils import LogicSolver, check_logic_validity
+# langgraph and langchain are only imported when the graph is first built or
+# an LLM node first runs, so importing this module stays cheap (see server.py)
+
+import logging
+import os
+import threading
+from logic_utils import check_logic_validity
+from kb_loader import load_kb
+from kb_context import build_kb_context
+from langchain_llm import LangChainLLM
+from llm_stream import speculative_solve, stream_solve
+from logic_repair import record_saved_round_trip
+from solve_cache import get_default_solve_cache, make_solve_key
+from metrics import metrics
 from dataclasses import dataclass
 from typing import Optional, List
 
+logger = logging.getLogger(__name__)
+
 # Define the "state" that will move through the graph
 @dataclass
 class InferenceState:
     question: str                        # Original user question
-    relevant_facts: Optional[str] = None # Knowledge base facts (Prolog text)
+    relevant_facts: Optional[str] = None # KB summary for the prompt (predicates, rules, sample facts)
     logic_rule: Optional[str] = None     # Logic rules generated by LLM
     final_solution: Optional[List] = None # The final reasoning result
     retry_count: int = 0                 # Tracks how many times refinement was tried
     errors: Optional[List[str]] = None   # Stores syntax errors from logic checking
+    truncated: bool = False              # Generation was stopped at its first error
     _next: Optional[str] = None          # Holds decision about which node to run next
 
+# Path of the knowledge base file
+KB_PATH = "kb.txt"
+
+# Max prompt tokens spent on describing the KB to the LLM
+KB_CONTEXT_TOKENS = 600
+
+# Model used by the LLM nodes (always called with temperature 0)
+LLM_MODEL = "gpt-3.5-turbo"
+LLM_PARAMS = {"temperature": 0}
+
+# LLM response cache for the graph's nodes: None = the shared default
+# (llm_cache.get_default_cache), False = off, or an LLMCache
+LLM_CACHE = None
+
+# Candidate generations run at once for every LLM step (see
+# llm_stream.speculative_solve); the first valid one is used, the rest are
+# stopped. 1 = a single generation, as before
+SPECULATIVE_CANDIDATES = int(os.getenv("LOGIC_CANDIDATES", "1"))
+
+# Valid candidates that must derive the same facts before one is used
+SPECULATIVE_QUORUM = int(os.getenv("LOGIC_CANDIDATE_QUORUM", "1"))
+
+# One chat client per process, reused across nodes and runs
+_llm = None
+
+def get_llm():
+    global _llm
+    if _llm is None:
+        from langchain_openai import ChatOpenAI
+        _llm = ChatOpenAI(model=LLM_MODEL, **LLM_PARAMS)
+    return _llm
+
+# Swap in another chat model (e.g. langchain_llm.StubChatModel for offline runs)
+def set_llm(llm):
+    global _llm
+    _llm = llm
+
+# Relations the graph asks the LLM to define
+RULES_DESCRIPTION = """Define the following relations:
+- Uncle: uncle(X, Y) :- parent(Z, Y), sibling(X, Z).
+- Aunt: aunt(X, Y) :- parent(Z, Y), sibling(X, Z).
+- Cousin: cousin(X, Y) :- parent(Z, X), parent(W, Y), sibling(Z, W).
+- Grandparent: grandparent(X, Y) :- parent(X, Z), parent(Z, Y).
+- Great-grandparent: greatgrandparent(X, Y) :- parent(X, Z), parent(Z, W), parent(W, Y)."""
+
+# Stream the LLM's reply to a prompt into a solver over the KB (see llm_stream):
+# clauses are checked and solved as they arrive, and the generation stops at
+# the first syntax error that local repair (logic_repair) cannot fix. Replies
+# are cached (temperature is fixed at 0), and a complete valid program's
+# result goes into the solve cache for solve_node; a cached reply whose
+# program is already in the solve cache is not solved again.
+# With SPECULATIVE_CANDIDATES > 1, several variants of the prompt are streamed
+# at once and the first valid reply wins.
+def generate_logic(state, prompt):
+    kb = load_kb(KB_PATH)
+    llm = LangChainLLM(LLM_MODEL, llm=get_llm(), cache=LLM_CACHE)
+    solve_cache = get_default_solve_cache()
+    if SPECULATIVE_CANDIDATES > 1:
+        session = speculative_solve(llm, prompt, SPECULATIVE_CANDIDATES, kb=kb,
+                                    quorum=SPECULATIVE_QUORUM, solve_cache=solve_cache)
+    else:
+        session = stream_solve(llm, prompt, kb=kb, solve_cache=solve_cache)
+    state.logic_rule = session.text
+    state.errors = session.errors or None
+    state.truncated = session.truncated
+    if not session.errors:
+        if session.fixes:
+            record_saved_round_trip("graph", session.fixes)
+        if session.cached_result is None:
+            solve_cache.put(make_solve_key(session.text, kb), session.result())
+    return state
+
 # First node: Load the knowledge base from file
 def load_kb_node(state):
-    with open("kb.txt", "r") as f:       # Open kb.txt file
-        kb_facts = f.read()              # Read the whole content as a string
-    state.relevant_facts = kb_facts      # Save into state
+    kb = load_kb(KB_PATH)                # Parsed once, cached, reloaded only if kb.txt changes
+    # Save a size-capped summary into state (the prompt does not need every fact)
+    state.relevant_facts = build_kb_context(kb, KB_CONTEXT_TOKENS)
     return state                         # Pass the updated state forward
 
 # Node: Generate logic rules from facts + description using LLM
 def logic_generate_node(state):
+    from langchain.prompts import PromptTemplate
     # Build a reusable prompt template
     prompt = PromptTemplate(
         input_variables=["context", "description"],
@@ -38,29 +124,23 @@ def logic_generate_node(state):
             "{description}"
         )
     )
-    # Use OpenAI LLM (GPT-3.5-turbo here)
-    llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
-
     # Fill in the template with knowledge base and description
     full_prompt = prompt.format(
         context=state.relevant_facts,
-        description="""Define the following relations:
-- Uncle: uncle(X, Y) :- parent(Z, Y), sibling(X, Z).
-- Aunt: aunt(X, Y) :- parent(Z, Y), sibling(X, Z).
-- Cousin: cousin(X, Y) :- parent(Z, X), parent(W, Y), sibling(Z, W).
-- Grandparent: grandparent(X, Y) :- parent(X, Z), parent(Z, Y).
-- Great-grandparent: greatgrandparent(X, Y) :- parent(X, Z), parent(Z, W), parent(W, Y)."""
+        description=RULES_DESCRIPTION
     )
 
-    # Call the model with the prompt
-    response = llm.invoke(full_prompt)
-    # Save the generated rules into state
-    state.logic_rule = response.content
-    return state
+    # Stream the model's rules into state (and into the solver)
+    return generate_logic(state, full_prompt)
 
 # Node: Check if the generated rules are valid syntax
 def check_validity_node(state):
-    errors = check_logic_validity(state.logic_rule)  # Run your custom syntax checker
+    # A generation stopped early already has its errors; its text is cut off
+    # mid-clause, so checking it again would add a spurious one
+    if state.truncated:
+        errors = state.errors
+    else:
+        errors = check_logic_validity(state.logic_rule)  # Run your custom syntax checker
     if not errors:
         state._next = "Solve"        # If no errors, go straight to solving
     else:
@@ -71,12 +151,11 @@ def check_validity_node(state):
 # Node: Self-refine the logic rules if syntax errors are found
 def self_refine_node(state):
     if state.retry_count >= 3:              # Stop if refinement attempted too many times
-        print("Maximum refinement attempts reached.")
+        logger.warning("Maximum refinement attempts reached.")
         return state
 
-    # New LLM instance for refinement
-    llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
     # Prompt tells the LLM to ONLY fix syntax errors
+    from langchain.prompts import PromptTemplate
     prompt = PromptTemplate(
         input_variables=["broken_logic", "errors"],
         template=(
@@ -91,44 +170,82 @@ def self_refine_node(state):
         broken_logic=state.logic_rule,
         errors="\n".join(state.errors)
     )
+    if state.truncated:
+        # Generation was stopped early: the rest still has to be written
+        full_prompt += (
+            "\n\nThe output above was cut off at the first error."
+            " Fix it, then write out the complete set of rules for:\n\n"
+            + RULES_DESCRIPTION
+        )
 
     # Call model to fix the logic
-    response = llm.invoke(full_prompt)
     # Update logic in state with corrected version
-    state.logic_rule = response.content
+    generate_logic(state, full_prompt)
     # Increment retry count
     state.retry_count += 1
+    metrics.inc("refine_retries", pipeline="graph")
     return state
 
 # Node: Actually solve the problem using the LogicSolver
 def solve_node(state):
-    logic_solver = LogicSolver()  # Create instance of your solver
-    # Combine KB facts with the generated logic rules
-    full_logic = state.relevant_facts + "\n" + state.logic_rule
-    # Solve and return result
-    solution = logic_solver.solve_logic(full_logic)
+    # Solve the generated rules on top of the already-compiled KB; a program
+    # already solved on this KB (up to formatting, clause order and variable
+    # names) is answered from the solve cache
+    solution = get_default_solve_cache().solve(state.logic_rule, kb=load_kb(KB_PATH))
     state.final_solution = solution
     return state
 
 # Build the actual state graph
-graph = StateGraph(InferenceState)       # Graph will move InferenceState objects
-graph.add_node("LoadKB", load_kb_node)   # Register node functions
-graph.add_node("GenerateLogic", logic_generate_node)
-graph.add_node("CheckValidity", check_validity_node)
-graph.add_node("SelfRefine", self_refine_node)
-graph.add_node("Solve", solve_node)
-
-# Define edges between nodes (execution order)
-graph.set_entry_point("LoadKB")                # First node to run
-graph.add_edge("LoadKB", "GenerateLogic")      # After KB -> generate logic
-graph.add_edge("GenerateLogic", "CheckValidity") # Then check validity
-# Conditional: from CheckValidity go to Solve or SelfRefine based on _next
-graph.add_conditional_edges(
-    "CheckValidity",
-    lambda state: state._next
-)
-# After self-refine, go back to check validity again
-graph.add_edge("SelfRefine", "CheckValidity")
-
-# Compile graph into runnable workflow
-compiled_graph = graph.compile()
+# Node functions are wrapped so their wall time is recorded when metrics are on
+# With solve=False the graph ends once the rules are valid, for callers that
+# solve state.logic_rule themselves (see batch.GraphPipeline)
+def build_graph(solve=True):
+    from langgraph.graph import END, StateGraph
+    graph = StateGraph(InferenceState)       # Graph will move InferenceState objects
+    graph.add_node("LoadKB", metrics.node("LoadKB", load_kb_node))   # Register node functions
+    graph.add_node("GenerateLogic", metrics.node("GenerateLogic", logic_generate_node))
+    graph.add_node("CheckValidity", metrics.node("CheckValidity", check_validity_node))
+    graph.add_node("SelfRefine", metrics.node("SelfRefine", self_refine_node))
+    if solve:
+        graph.add_node("Solve", metrics.node("Solve", solve_node))
+
+    # Define edges between nodes (execution order)
+    graph.set_entry_point("LoadKB")                # First node to run
+    graph.add_edge("LoadKB", "GenerateLogic")      # After KB -> generate logic
+    graph.add_edge("GenerateLogic", "CheckValidity") # Then check validity
+    # Conditional: from CheckValidity go to Solve or SelfRefine based on _next
+    if solve:
+        graph.add_conditional_edges(
+            "CheckValidity",
+            lambda state: state._next
+        )
+    else:
+        graph.add_conditional_edges(
+            "CheckValidity",
+            lambda state: state._next,
+            {"Solve": END, "SelfRefine": "SelfRefine"}
+        )
+    # After self-refine, go back to check validity again
+    graph.add_edge("SelfRefine", "CheckValidity")
+    return graph
+
+# Compiled graphs (with and without the Solve node), built on first use and
+# then shared (they hold no per-run state)
+_compiled_graphs = {}
+_compile_lock = threading.Lock()
+
+def get_compiled_graph(solve=True):
+    compiled = _compiled_graphs.get(solve)
+    if compiled is None:
+        with _compile_lock:
+            compiled = _compiled_graphs.get(solve)
+            if compiled is None:
+                compiled = _compiled_graphs[solve] = build_graph(solve).compile()  # Compile graph into runnable workflow
+    return compiled
+
+# `from inference_graph import compiled_graph` still works: the graph is built
+# when the name is first looked up instead of at import time
+def __getattr__(name):
+    if name == "compiled_graph":
+        return get_compiled_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,67 @@
+#kb_context.py
+
+# Rough token estimate for prompt budgeting (about 4 characters per token)
+def estimate_tokens(text):
+    return (len(text) + 3) // 4
+
+
+# Build a compact prompt context from a compiled KB (see kb_loader.CompiledKB)
+# Instead of every fact, the LLM gets what it needs to write rules:
+#   - one signature line per predicate: name/arity and how many facts it has
+#   - the KB's existing rules
+#   - a few sample facts per predicate
+# Lines are added in that order until `token_budget` is used up, so the
+# prompt stays the same size however many facts the KB holds.
+def build_kb_context(kb, token_budget=600, samples_per_predicate=3):
+    symbols = kb.facts.symbols
+    relations = [(pred, rel) for pred, rel in kb.facts.relations.items() if len(rel)]
+
+    sections = []
+    used = 0
+
+    # Add a line if it fits in the budget
+    def add(lines, line):
+        nonlocal used
+        cost = estimate_tokens(line) + 1
+        if used + cost > token_budget:
+            return False
+        lines.append(line)
+        used += cost
+        return True
+
+    # Step 1: predicate signatures (always wanted, so they go first)
+    signatures = ["% Predicates (name/arity: number of facts)"]
+    used += estimate_tokens(signatures[0]) + 1
+    for pred, relation in relations:
+        add(signatures, f"% {pred}/{relation.arity}: {len(relation)} facts")
+    sections.append(signatures)
+
+    # Step 2: existing rules
+    if kb.rules:
+        rules = []
+        if add(rules, "% Existing rules"):
+            for rule in kb.rules:
+                if not add(rules, rule.rstrip('.') + "."):
+                    break
+        if len(rules) > 1:
+            sections.append(rules)
+
+    # Step 3: sample facts, taken round-robin so every predicate gets some
+    samples = []
+    if add(samples, "% Example facts"):
+        row_ids = {pred: list(rel.lookup((), None)[:samples_per_predicate]) for pred, rel in relations}
+        full = False
+        for i in range(samples_per_predicate):
+            for pred, relation in relations:
+                if i >= len(row_ids[pred]):
+                    continue
+                args = symbols.decode(relation.row(row_ids[pred][i]))
+                if not add(samples, f"{pred}({', '.join(args)})."):
+                    full = True
+                    break
+            if full:
+                break
+        if len(samples) > 1:
+            sections.append(samples)
+
+    return "\n\n".join("\n".join(lines) for lines in sections)
@@ -0,0 +1,229 @@
+#kb_loader.py
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+
+from closure import is_symmetric
+from fact_store import FactStore, Relation, SymbolTable
+from logic_utils import LogicSolver, parse_rule
+
+logger = logging.getLogger(__name__)
+
+# Snapshot file layout:
+#   MAGIC | header length (uint32) | JSON header | padding | symbol names | columns
+# Symbol names are "\0"-separated UTF-8; each relation column is a block of
+# native int32 values. Offsets in the header are relative to the data start.
+MAGIC = b"KBSNAP01"
+SNAPSHOT_SUFFIX = ".snapshot"
+
+
+# Hash of the source file, used when the mtime changed but the content may not have
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# A parsed knowledge base, ready to hand to LogicSolver.solve_logic(..., kb=...)
+class CompiledKB:
+    def __init__(self, path, facts, rules, source_hash, stat):
+        self.path = path
+        self.facts = facts              # FactStore (shared, treat as read-only)
+        self.rules = rules              # Rule strings, as parse_logic stores them
+        self.source_hash = source_hash  # sha256 of the source file
+        self.stat = stat                # (mtime_ns, size) of the source when loaded
+        self.mapping = None             # Open mmap backing the columns, if any
+        self._text = None
+        self._solved = None             # LogicSolver with the rules materialised (on first use)
+        self._solve_lock = threading.Lock()
+
+    # Full source text (read once, for prompts that still want raw Prolog)
+    @property
+    def text(self):
+        if self._text is None:
+            with open(self.path, "r") as f:
+                self._text = f.read()
+        return self._text
+
+    # A LogicSolver with the KB's rules already solved, ready for more facts
+    # and rules (see llm_stream). The rules are materialised once per KB and
+    # every call returns a fork of that, so no caller solves the KB again.
+    def solver(self):
+        if self._solved is None:
+            with self._solve_lock:
+                if self._solved is None:
+                    solver = LogicSolver()
+                    solver.parse_logic("", self)
+                    solver.materialize()
+                    self._solved = solver
+        return self._solved.fork()
+
+    # Only the plain fact lines of the source (no comments, no rules)
+    def facts_text(self):
+        facts = []
+        for line in self.text.split("\n"):
+            line = line.strip()
+            if line and not line.startswith('%') and ':-' not in line:
+                facts.append(line)
+        return "\n".join(facts)
+
+    # Same facts without the KB's rules (for pipelines that bring their own).
+    # Symmetry rules such as sibling(X, Y) :- sibling(Y, X) are kept: they say
+    # that the facts are only listed one way, not how to derive a relation
+    def facts_only(self):
+        rules = [rule for rule in self.rules if is_symmetric(parse_rule(rule))]
+        view = CompiledKB(self.path, self.facts, rules, self.source_hash, self.stat)
+        view.mapping = self.mapping
+        view._text = self._text
+        return view
+
+
+# Write a snapshot of a compiled KB next to its source file
+def write_snapshot(kb, snapshot_path):
+    names = kb.facts.symbols.names
+    symbols_blob = "\0".join(names).encode("utf-8")
+
+    # Lay out the data section: symbols first, then every column (4-byte aligned)
+    offset = (len(symbols_blob) + 3) & ~3
+    relations = []
+    for predicate, relation in kb.facts.relations.items():
+        rows = len(relation)
+        relations.append({"name": predicate, "arity": relation.arity, "rows": rows, "offset": offset})
+        offset += relation.arity * rows * 4
+
+    header = json.dumps({
+        "source_hash": kb.source_hash,
+        "source_mtime_ns": kb.stat[0],
+        "source_size": kb.stat[1],
+        "symbol_count": len(names),
+        "symbols_bytes": len(symbols_blob),
+        "relations": relations,
+        "rules": kb.rules,
+    }).encode("utf-8")
+    data_start = (len(MAGIC) + 4 + len(header) + 7) & ~7
+
+    # Write to a temporary file and swap it in so readers never see half a file
+    tmp_path = snapshot_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        f.write(b"\0" * (data_start - f.tell()))
+        f.write(symbols_blob)
+        f.write(b"\0" * (((len(symbols_blob) + 3) & ~3) - len(symbols_blob)))
+        for predicate, relation in kb.facts.relations.items():
+            if relation.dead:
+                relation = relation.copy()  # Write live rows only
+            for column in relation.columns:
+                f.write(memoryview(column).cast('B'))
+    os.replace(tmp_path, snapshot_path)
+
+
+# Read a snapshot's header, or None if the file is missing or not a snapshot
+def read_snapshot_header(snapshot_path):
+    try:
+        with open(snapshot_path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            (header_len,) = struct.unpack("<I", f.read(4))
+            return json.loads(f.read(header_len))
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+# Memory-map a snapshot: columns stay in the page cache, nothing is re-parsed
+def load_snapshot(path, snapshot_path, header, stat):
+    with open(snapshot_path, "rb") as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    header_len = struct.unpack_from("<I", mapping, len(MAGIC))[0]
+    data_start = (len(MAGIC) + 4 + header_len + 7) & ~7
+    data = memoryview(mapping)[data_start:]
+
+    # Symbol table: names in id order
+    facts = FactStore()
+    symbols = SymbolTable()
+    if header["symbol_count"]:
+        symbols.names = bytes(data[:header["symbols_bytes"]]).decode("utf-8").split("\0")
+    symbols.ids = dict(zip(symbols.names, range(len(symbols.names))))
+    facts.symbols = symbols
+
+    # Relations: one read-only int32 view per column, straight over the mapping
+    for info in header["relations"]:
+        arity, rows, offset = info["arity"], info["rows"], info["offset"]
+        columns = []
+        for position in range(arity):
+            start = offset + position * rows * 4
+            columns.append(data[start:start + rows * 4].cast('i'))
+        facts.relations[info["name"]] = Relation.from_buffers(arity, columns, rows)
+
+    kb = CompiledKB(path, facts, header["rules"], header["source_hash"], stat)
+    kb.mapping = mapping
+    return kb
+
+
+# Parse the source file with LogicSolver's parser (streamed in chunks)
+def compile_kb(path, source_hash, stat):
+    solver = LogicSolver()
+    with open(path, "r") as f:
+        solver.parse_logic(f)
+    return CompiledKB(path, solver.facts, list(solver.rules), source_hash, stat)
+
+
+# Loaded KBs by absolute path, so repeat calls in one process are a stat() away
+_loaded = {}
+
+
+# Load a KB file, reusing (in order) the in-process copy, the on-disk snapshot,
+# or a fresh parse. The source is only re-read when its mtime/size changed and
+# its sha256 differs from what was compiled.
+def load_kb(path="kb.txt", use_snapshot=True):
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    stat = (st.st_mtime_ns, st.st_size)
+
+    # Step 1: in-process copy
+    kb = _loaded.get(path)
+    if kb is not None:
+        if kb.stat == stat:
+            return kb
+        source_hash = file_hash(path)
+        if kb.source_hash == source_hash:
+            kb.stat = stat  # Touched but unchanged
+            return kb
+    else:
+        source_hash = None
+
+    # Step 2: snapshot next to the source
+    snapshot_path = path + SNAPSHOT_SUFFIX
+    header = read_snapshot_header(snapshot_path) if use_snapshot else None
+    if header is not None:
+        fresh = (header["source_mtime_ns"], header["source_size"]) == stat
+        if not fresh:
+            source_hash = source_hash or file_hash(path)
+            fresh = header["source_hash"] == source_hash
+        if fresh:
+            kb = load_snapshot(path, snapshot_path, header, stat)
+            if (header["source_mtime_ns"], header["source_size"]) != stat:
+                try:
+                    write_snapshot(kb, snapshot_path)  # Record the new mtime
+                except OSError as e:
+                    logger.warning("Could not update KB snapshot: %s", e)
+            _loaded[path] = kb
+            return kb
+
+    # Step 3: parse the source and write a new snapshot
+    kb = compile_kb(path, source_hash or file_hash(path), stat)
+    if use_snapshot:
+        try:
+            write_snapshot(kb, snapshot_path)
+        except OSError as e:
+            logger.warning("Could not write KB snapshot: %s", e)
+    _loaded[path] = kb
+    return kb
@@ -1,22 +1,163 @@
 #langchain_llm.py
 
-from langchain_community.chat_models import ChatOpenAI
+import asyncio
 import os
+import time
+from contextlib import nullcontext
 from dotenv import load_dotenv
+from llm_cache import get_default_cache, make_key
+from llm_stream import iter_llm_stream
+from metrics import metrics
 
 # Load environment variables from .env file into the program
 load_dotenv()
 
 # Define a helper class for using LangChain's LLM easily
 class LangChainLLM:
-    def __init__(self, model_name="gpt-3.5-turbo"):
-        # Create an instance of the ChatOpenAI model
-        self.llm = ChatOpenAI(
-            model_name=model_name,
-            temperature=0,
-            openai_api_key=os.getenv("OPENAI_API_KEY")
-        )
+    # llm: an already-built chat model (e.g. StubChatModel in tests); by default
+    #      a ChatOpenAI client is created. Replies are cached under the name of
+    #      the model that gives them, so a given model's name wins over model_name
+    # cache: an LLMCache, None for the shared default, False to disable caching
+    def __init__(self, model_name="gpt-3.5-turbo", llm=None, cache=None):
+        self.params = {"temperature": 0}
+        if llm is not None:
+            model_name = getattr(llm, "model_name", None) or type(llm).__name__
+        else:
+            from langchain_community.chat_models import ChatOpenAI
+            # Create an instance of the ChatOpenAI model
+            llm = ChatOpenAI(
+                model_name=model_name,
+                temperature=0,
+                openai_api_key=os.getenv("OPENAI_API_KEY")
+            )
+        self.model_name = model_name
+        self.llm = llm
+        self.cache = get_default_cache() if cache is None else cache
 
     # Send a prompt to the LLM and return its prediction
+    # Identical prompts are answered from the cache (temperature is 0)
     def query(self, prompt):
-        return self.llm.predict(prompt)  # Calls LangChain's predict method
+        if not self.cache:
+            return self.predict(prompt)
+        return self.cache.cached(
+            self.model_name, self.params, prompt,
+            lambda: self.predict(prompt)
+        )
+
+    # One real LLM round-trip (latency and token estimates go to metrics)
+    def predict(self, prompt):
+        start = time.perf_counter()
+        response = self.llm.predict(prompt)  # Calls LangChain's predict method
+        metrics.record_llm(self.model_name, prompt, response, time.perf_counter() - start)
+        return response
+
+    # The cached reply to a prompt, or None (without calling the model)
+    def cached_reply(self, prompt):
+        if not self.cache:
+            return None
+        return self.cache.get(make_key(self.model_name, self.params, prompt))
+
+    # Stream the reply piece by piece (see llm_stream). A cached reply comes
+    # back as one piece; a reply streamed to the end is cached like query()'s,
+    # one the caller broke off early is not.
+    def stream(self, prompt):
+        key = make_key(self.model_name, self.params, prompt) if self.cache else None
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        pieces = []
+        start = time.perf_counter()
+        try:
+            for piece in iter_llm_stream(self.llm, prompt):
+                pieces.append(piece)
+                yield piece
+        finally:
+            metrics.record_llm(self.model_name, prompt, "".join(pieces), time.perf_counter() - start)
+        if key is not None:
+            self.cache.put(key, "".join(pieces))
+
+    # Async version of query; `throttle` (see batch.LLMThrottle) bounds how many
+    # requests are in flight. Cache hits never wait for the throttle.
+    async def aquery(self, prompt, throttle=None):
+        key = make_key(self.model_name, self.params, prompt) if self.cache else None
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        async with throttle or nullcontext():
+            start = time.perf_counter()
+            if hasattr(self.llm, "apredict"):
+                response = await self.llm.apredict(prompt)
+            else:
+                response = await asyncio.to_thread(self.llm.predict, prompt)
+            metrics.record_llm(self.model_name, prompt, response, time.perf_counter() - start)
+
+        if key is not None:
+            self.cache.put(key, response)
+        return response
+
+
+# Message returned by StubChatModel.invoke (mimics LangChain's AIMessage)
+class StubMessage:
+    def __init__(self, content):
+        self.content = content
+
+
+# Offline stand-in for a chat model: same predict/invoke/stream interface, no network
+# `responses` is either a fixed string or a function prompt → string.
+# `latency` (seconds) simulates the round-trip of a real model; when streaming
+# it is spread over pieces of `piece_size` characters (roughly a token each).
+class StubChatModel:
+    def __init__(self, responses="", model_name="stub", latency=0.0, piece_size=4):
+        self.responses = responses
+        self.model_name = model_name
+        self.latency = latency
+        self.piece_size = piece_size
+        self.calls = 0  # How many prompts actually reached the model
+        self.pieces_sent = 0  # How many streamed pieces were consumed
+
+    def respond(self, prompt):
+        self.calls += 1
+        if callable(self.responses):
+            return self.responses(prompt)
+        return self.responses
+
+    def predict(self, prompt):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.respond(prompt)
+
+    def invoke(self, prompt):
+        return StubMessage(self.predict(prompt))
+
+    async def apredict(self, prompt):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.respond(prompt)
+
+    async def ainvoke(self, prompt):
+        return StubMessage(await self.apredict(prompt))
+
+    def split(self, prompt):
+        text = self.respond(prompt)
+        return [text[i:i + self.piece_size] for i in range(0, len(text), self.piece_size)]
+
+    def stream(self, prompt):
+        pieces = self.split(prompt)
+        for piece in pieces:
+            if self.latency:
+                time.sleep(self.latency / len(pieces))
+            self.pieces_sent += 1
+            yield StubMessage(piece)
+
+    async def astream(self, prompt):
+        pieces = self.split(prompt)
+        for piece in pieces:
+            if self.latency:
+                await asyncio.sleep(self.latency / len(pieces))
+            self.pieces_sent += 1
+            yield StubMessage(piece)
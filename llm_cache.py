@@ -0,0 +1,139 @@
+#llm_cache.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Default on-disk location (override with the LLM_CACHE_PATH environment variable)
+DEFAULT_CACHE_PATH = ".llm_cache.sqlite"
+
+
+# Cache key = hash of (model, call parameters, prompt)
+# Only deterministic calls (temperature 0) should be cached.
+def make_key(model, params, prompt):
+    payload = json.dumps({"model": model, "params": params, "prompt": prompt}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Two-tier cache for LLM responses:
+#   - in-memory LRU of the most recent responses
+#   - SQLite table on disk, shared across runs
+# Disk entries older than max_age_seconds are ignored and purged; when the table
+# grows past max_disk_entries the least recently used rows are dropped.
+class LLMCache:
+    def __init__(self, path=None, max_memory_entries=256, max_disk_entries=10000,
+                 max_age_seconds=7 * 24 * 3600):
+        self.path = path or os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.max_age_seconds = max_age_seconds
+        self.memory = OrderedDict()  # key → response, most recent last
+        self.lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+        # path=":memory:" keeps everything in process (handy for tests)
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, response TEXT NOT NULL,"
+            " created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.db.commit()
+
+    # Cached response for a key, or None
+    def get(self, key):
+        with self.lock:
+            # Tier 1: memory
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits_memory += 1
+                return self.memory[key]
+
+            # Tier 2: disk (expired rows count as misses)
+            now = time.time()
+            row = self.db.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] <= self.max_age_seconds:
+                self.db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                self.db.commit()
+                self.remember(key, row[0])
+                self.hits_disk += 1
+                return row[0]
+
+            self.misses += 1
+            return None
+
+    # Store a response in both tiers
+    def put(self, key, response):
+        with self.lock:
+            now = time.time()
+            self.remember(key, response)
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            self.evict(now)
+            self.db.commit()
+
+    # Return the cached response, or call `compute()` and cache its result
+    def cached(self, model, params, prompt, compute):
+        key = make_key(model, params, prompt)
+        response = self.get(key)
+        if response is None:
+            response = compute()
+            self.put(key, response)
+        return response
+
+    # Add to the memory tier, dropping the least recently used entry if full
+    def remember(self, key, response):
+        self.memory[key] = response
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    # Drop expired rows, then the least recently used rows beyond the size cap
+    def evict(self, now):
+        self.db.execute("DELETE FROM responses WHERE created < ?", (now - self.max_age_seconds,))
+        (count,) = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()
+        if count > self.max_disk_entries:
+            self.db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_disk_entries,),
+            )
+
+    # Empty both tiers
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            self.db.execute("DELETE FROM responses")
+            self.db.commit()
+
+    # Hit/miss counters
+    def stats(self):
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+        }
+
+
+# One shared cache per process, created on first use
+_default_cache = None
+
+
+def get_default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = LLMCache()
+    return _default_cache
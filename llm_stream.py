@@ -0,0 +1,302 @@
+#llm_stream.py
+
+import logging
+import queue
+import threading
+import time
+
+from logic_parser import ClauseReader
+from logic_repair import RuleRepairer
+from logic_utils import LogicSolver
+from metrics import metrics
+from solve_cache import make_solve_key
+
+logger = logging.getLogger(__name__)
+
+# Extra instructions that make speculative candidates differ (candidate 0 gets
+# the prompt unchanged). Prompts differ rather than temperatures, so each
+# candidate is still a temperature-0 call and its reply stays cacheable.
+CANDIDATE_HINTS = [
+    "",
+    "\n\nWrite each clause on its own line and end every clause with a period.",
+    "\n\nOutput plain Prolog only: no markdown, no numbering, no explanations.",
+    "\n\nCheck that every parenthesis is closed before writing the period.",
+]
+
+
+# Text pieces of a completion as the model produces them
+# Chat models with .stream() (LangChain, StubChatModel) are streamed; anything
+# else is asked once and yields the whole reply.
+def iter_llm_stream(llm, prompt):
+    if hasattr(llm, "stream"):
+        for chunk in llm.stream(prompt):
+            yield getattr(chunk, "content", chunk)
+    elif hasattr(llm, "invoke"):
+        yield llm.invoke(prompt).content
+    else:
+        yield llm.predict(prompt)
+
+
+# Feeds LLM output into a solver clause by clause, as it streams in.
+# Each clause is validated as soon as its period arrives: facts are asserted
+# and rules added to the (already materialised) program straight away, so
+# derived facts are available before the completion ends. After `max_errors`
+# syntax errors the output counts as broken and feed() returns False, so the
+# caller can stop the generation and start repairing.
+# With repair on, the output first goes through logic_repair.RuleRepairer, so
+# fences, prose and missing periods never count as errors; `text` is then the
+# repaired program the solver saw and `fixes` lists what was changed.
+# The solver is a fork of the KB's materialised rules (CompiledKB.solver),
+# made on first use. With defer on, clauses are only checked and kept until
+# result() needs them, so a result found in the solve cache costs no solving.
+class StreamingSolve:
+    def __init__(self, kb=None, max_errors=1, repair=True, defer=False):
+        self.kb = kb
+        self.max_errors = max_errors
+        self.repairer = RuleRepairer() if repair else None
+        self._solver = None
+        self.deferred = [] if defer else None  # Clauses held back from the solver
+        self.cached_result = None  # Derived facts found in the solve cache
+        self.reader = ClauseReader(on_error=self.on_error)
+        self.pieces = []       # Text received so far
+        self.lines = []        # Repaired lines passed on to the reader
+        self.errors = []       # Syntax errors, as check_logic_validity reports them
+        self.clauses = 0       # Valid clauses fed to the solver
+        self.truncated = False # Stopped early because the output was broken
+        self.started = time.perf_counter()
+        self.first_derived_seconds = None  # Time from start to the first derived fact
+
+    @property
+    def solver(self):
+        if self._solver is None:
+            if self.kb is not None:
+                self._solver = self.kb.solver()
+            else:
+                self._solver = LogicSolver()
+                self._solver.materialize()
+        return self._solver
+
+    @property
+    def raw_text(self):
+        return "".join(self.pieces)
+
+    @property
+    def text(self):
+        if self.repairer is None:
+            return self.raw_text
+        return "\n".join(self.lines).strip("\n")
+
+    @property
+    def fixes(self):
+        return self.repairer.fixes if self.repairer is not None else []
+
+    @property
+    def broken(self):
+        return len(self.errors) >= self.max_errors
+
+    def on_error(self, error):
+        self.errors.append(str(error))
+
+    # Take the next piece of output; returns False once the output is broken
+    def feed(self, piece):
+        self.pieces.append(piece)
+        if self.repairer is None:
+            self.read(piece)
+        else:
+            for line in self.repairer.feed(piece):
+                self.read_line(line)
+        if self.broken:
+            self.truncated = True
+            return False
+        return True
+
+    # End of output: flush the last clause (and report a missing period)
+    def close(self):
+        if self.truncated:
+            return
+        if self.repairer is not None:
+            for line in self.repairer.close():
+                self.read_line(line)
+        for clause in self.reader.close():
+            self.add_clause(clause)
+        # Nothing at all to solve is an error, as in check_logic_validity
+        if not self.clauses and not self.errors:
+            self.errors.append("No facts or rules found.")
+
+    def read(self, text):
+        for clause in self.reader.feed(text):
+            self.add_clause(clause)
+
+    def read_line(self, line):
+        self.lines.append(line)
+        self.read(line + "\n")
+
+    def add_clause(self, clause):
+        if self.broken:
+            return  # Output already broken: the rest waits for the repair
+        self.clauses += 1
+        if self.deferred is not None:
+            self.deferred.append(clause)
+            return
+        self.solve_clause(clause)
+
+    def solve_clause(self, clause):
+        if clause[0] == "rule":
+            self.solver.add_rule(clause[1])
+        else:
+            _, predicate, args = clause
+            self.solver.assert_fact((predicate, args))
+        if self.first_derived_seconds is None and self.has_derived():
+            self.first_derived_seconds = time.perf_counter() - self.started
+
+    # Whether any rule head holds more than its stored facts yet
+    def has_derived(self):
+        relations = self.solver.relations
+        base = self.solver.facts.relations
+        for predicate in {rule[0] for rule in self.solver.compiled_rules}:
+            relation = relations.get(predicate)
+            stored = base.get(predicate)
+            if relation is not None and len(relation) > (len(stored) if stored is not None else 0):
+                return True
+        return False
+
+    # Derived facts of the program received so far
+    def result(self):
+        if self.cached_result is not None:
+            return self.cached_result
+        if self.deferred is not None:
+            clauses, self.deferred = self.deferred, None
+            for clause in clauses:
+                self.solve_clause(clause)
+        return self.solver.derived_facts()
+
+
+# A StreamingSolve over a reply the LLM cache already holds, or None if it
+# holds none (only models with cached_reply, such as LangChainLLM, have one).
+# The reply is checked as if streamed; a valid program already solved on
+# this KB takes its result from `solve_cache` instead of a solver.
+def cached_solve(llm, prompt, kb, max_errors, repair, solve_cache):
+    reply = llm.cached_reply(prompt) if hasattr(llm, "cached_reply") else None
+    if reply is None:
+        return None
+    session = StreamingSolve(kb, max_errors, repair, defer=True)
+    if session.feed(reply):
+        session.close()
+    if not session.errors:
+        session.cached_result = solve_cache.get(make_solve_key(session.text, kb))
+        metrics.inc("solve_cache", result="hit" if session.cached_result is not None else "miss")
+    return session
+
+
+# Stream `prompt` through a chat model into a StreamingSolve and return it;
+# the generation is abandoned as soon as the output is broken.
+# With a solve_cache, a reply the LLM cache holds goes through cached_solve.
+def stream_solve(llm, prompt, kb=None, max_errors=1, repair=True, solve_cache=None):
+    if solve_cache is not None:
+        session = cached_solve(llm, prompt, kb, max_errors, repair, solve_cache)
+        if session is not None:
+            return session
+    session = StreamingSolve(kb, max_errors, repair)
+    pieces = iter_llm_stream(llm, prompt)
+    try:
+        for piece in pieces:
+            if not session.feed(piece):
+                break
+        else:
+            session.close()
+    finally:
+        pieces.close()  # Stops the underlying request when broken off early
+    return session
+
+
+# Prompts for k speculative candidates
+def candidate_prompts(prompt, k):
+    prompts = []
+    for i in range(k):
+        hint = CANDIDATE_HINTS[i % len(CANDIDATE_HINTS)]
+        if i >= len(CANDIDATE_HINTS):
+            hint += f"\n\n(Attempt {i + 1}.)"  # Keep every prompt distinct
+        prompts.append(prompt + hint)
+    return prompts
+
+
+# Speculative generation: stream `candidates` variants of the prompt at once
+# (one thread each) and return the first session that is valid, without
+# waiting for the others; their generations are stopped at their next piece.
+# With quorum > 1, a valid session is only taken once that many valid sessions
+# derived the same facts. If no candidate qualifies, the valid session with
+# the most agreement is returned, or else the one with the fewest errors, so
+# the caller can refine it as usual. The sessions share one lock for their
+# solver work (they share the KB's symbol table); the LLM calls overlap.
+# With a solve_cache (and quorum 1), a valid reply already in the LLM cache
+# is taken straight away through cached_solve.
+def speculative_solve(llm, prompt, candidates=2, kb=None, max_errors=1, repair=True, quorum=1,
+                      solve_cache=None):
+    prompts = candidate_prompts(prompt, candidates)
+    if solve_cache is not None and quorum <= 1:
+        for candidate in prompts:
+            session = cached_solve(llm, candidate, kb, max_errors, repair, solve_cache)
+            if session is not None and not session.errors:
+                return session
+
+    sessions = [StreamingSolve(kb, max_errors, repair) for _ in prompts]
+    failures = [None] * len(prompts)
+    stop = threading.Event()
+    lock = threading.Lock()
+    finished = queue.Queue()
+
+    def generate(i):
+        session = sessions[i]
+        pieces = iter_llm_stream(llm, prompts[i])
+        try:
+            # Fork this candidate's solver from the KB's materialised rules
+            # here, outside the lock, so the candidates start side by side
+            session.solver
+            for piece in pieces:
+                if stop.is_set():
+                    break  # Another candidate won
+                with lock:
+                    if not session.feed(piece):
+                        break
+            else:
+                with lock:
+                    session.close()
+        except Exception as e:
+            failures[i] = e
+        finally:
+            pieces.close()  # Stops the underlying request
+            finished.put(i)
+
+    for i in range(len(prompts)):
+        threading.Thread(target=generate, args=(i,), daemon=True).start()
+
+    # Take sessions as they finish; group valid ones by what they derived
+    agreeing = {}  # derived facts → indexes of valid sessions
+    winner = None
+    for done in range(1, len(prompts) + 1):
+        i = finished.get()
+        session = sessions[i]
+        if failures[i] is not None or session.errors:
+            metrics.inc("speculative_candidates", outcome="invalid")
+            continue
+        metrics.inc("speculative_candidates", outcome="valid")
+        with lock:
+            group = agreeing.setdefault(frozenset(session.result()), [])
+        group.append(i)
+        if len(group) >= quorum:
+            winner = group[0]
+            break
+    stop.set()
+
+    if winner is not None:
+        metrics.inc("speculative_candidates", len(prompts) - done, outcome="cancelled")
+        logger.info("Speculative candidate %d of %d was taken", winner + 1, len(prompts))
+        return sessions[winner]
+
+    # Nothing qualified: best agreement, else fewest errors
+    if agreeing:
+        return sessions[max(agreeing.values(), key=len)[0]]
+    if all(failure is not None for failure in failures):
+        raise failures[0]
+    usable = [i for i in range(len(prompts)) if failures[i] is None]
+    return sessions[min(usable, key=lambda i: len(sessions[i].errors))]
@@ -1,33 +1,52 @@
 #logic_lm.py
 
+import logging
 from langchain_llm import LangChainLLM
 from logic_utils import LogicSolver, check_logic_validity
+from batch import run_solver
+from llm_stream import stream_solve
+from logic_repair import record_saved_round_trip, repair_locally
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
 
 # Define a model that uses an LLM + logic solver
 class LogicLMModel:
-    def __init__(self, model_name="gpt-3.5-turbo"):
+    def __init__(self, model_name="gpt-3.5-turbo", llm=None):
         # Initialize the LLM helper (for generating/refining logic)
-        self.llm = LangChainLLM(model_name)
+        # `llm` lets a prebuilt chat model (e.g. StubChatModel) be used instead
+        self.llm = LangChainLLM(model_name, llm=llm)
         # Initialize the custom solver (for executing logic rules)
         self.solver = LogicSolver()
 
     # Step 1: Translate natural language into Prolog-style logic
     def logic_translate(self, question):
+        # Send prompt to LLM and return result
+        return self.llm.query(self.translate_prompt(question))
+
+    # Prompt for step 1
+    def translate_prompt(self, question):
         # Prompt tells the LLM exactly how to format the output
-        prompt = (
+        return (
             "Translate the following description into symbolic Prolog-style logic facts and rules."
             " Only output facts and rules."
+            " Use the convention that sibling(X, Y) means X is a sibling of Y, and sibling relationships are symmetric"
+            " (write each sibling fact once and include the rule sibling(X, Y) :- sibling(Y, X).)."
             " Do NOT include any queries, answers, or explanations."
             " Ensure correct syntax with a period at the end of each fact and rule."
             " Do NOT use markdown formatting or code blocks."
             "\n\n"
             f"{question}"
         )
-        # Send prompt to LLM and return result
-        return self.llm.query(prompt)
 
     # Step 2 (if needed): Refine logic if errors are found
-    def refine_logic(self, broken_logic, errors):
+    # `question` is given when the output was cut off at its first error
+    def refine_logic(self, broken_logic, errors, question=None):
+        # Return refined logic from LLM
+        return self.llm.query(self.refine_prompt(broken_logic, errors, question))
+
+    # Prompt for step 2
+    def refine_prompt(self, broken_logic, errors, question=None):
         # Combine all error messages into one string
         error_message = "\n".join(errors)
         # Prompt tells the LLM to ONLY fix syntax, nothing else
@@ -40,31 +59,53 @@ class LogicLMModel:
             "\n\n"
             f"{broken_logic}"
         )
-        # Return refined logic from LLM
-        return self.llm.query(prompt)
+        if question is not None:
+            # Generation was stopped early: the rest still has to be written
+            prompt += (
+                "\n\nThe output above was cut off at the first error."
+                " Fix it, then finish translating this description:\n\n"
+                f"{question}"
+            )
+        return prompt
 
     # Step 3: Full pipeline — translate, validate, refine, solve
     def solve(self, question):
-        # Step 1: Translate natural language to logic
-        logic = self.logic_translate(question)
-
-        print("\nGenerated Logic Output:\n")
-        print(logic)
+        # Step 1+2: Stream the translation into a solver; each clause is
+        # validated when its period arrives and solved right away, and the
+        # generation stops at the first syntax error (see llm_stream).
+        # Fences, prose and missing periods are repaired locally on the way.
+        session = stream_solve(self.llm, self.translate_prompt(question))
+        logger.info("Generated logic:\n%s", session.text)
+        if not session.errors:
+            if session.fixes:
+                record_saved_round_trip("LogicLMModel", session.fixes)
+            return session.result()
 
-        # Step 2: Validate syntax of the generated logic
-        errors = check_logic_validity(logic)
-        if errors:
-            print("\nErrors Detected in Logic:")
-            for error in errors:
-                print(error)   # Print each error for debugging
-            print("\nRefining Logic...\n")
-
-            # Ask the LLM to fix the logic
-            logic = self.refine_logic(logic, errors)
+        logger.warning("Errors detected in logic, refining:\n%s", "\n".join(session.errors))
 
-            print("\nRefined Logic Output:\n")
-            print(logic)
+        # Ask the LLM to fix the logic (and finish it, if it was cut off)
+        metrics.inc("refine_retries", pipeline="LogicLMModel")
+        logic = self.refine_logic(session.text, session.errors,
+                                  question if session.truncated else None)
+        logger.info("Refined logic:\n%s", logic)
 
         # Step 3: Solve the corrected logic with LogicSolver
         solution = self.solver.solve_logic(logic)
         return solution
+
+    # Async version of solve, for running many questions at once (see batch.py)
+    # LLM calls go through `throttle`; the solver runs on `executor`
+    async def asolve(self, question, throttle=None, executor=None):
+        # Step 1: Translate natural language to logic
+        logic = await self.llm.aquery(self.translate_prompt(question), throttle)
+
+        # Step 2: Validate syntax; repair locally, ask the LLM only if that fails
+        errors = check_logic_validity(logic)
+        if errors:
+            logic, errors = repair_locally(logic, "LogicLMModel")
+        if errors:
+            metrics.inc("refine_retries", pipeline="LogicLMModel")
+            logic = await self.llm.aquery(self.refine_prompt(logic, errors), throttle)
+
+        # Step 3: Solve in the worker pool (a fresh solver per question)
+        return await run_solver(executor, logic)
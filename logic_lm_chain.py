@@ -1,16 +1,24 @@
 # logic_lm_chain.py
 
+import asyncio
+import logging
 from langchain_llm import LangChainLLM
 from logic_utils import LogicSolver, check_logic_validity
+from logic_repair import repair_locally
+from kb_loader import load_kb
+from batch import run_solver
+from metrics import metrics
 from retriever import create_retriever_from_kb
 from langchain.prompts import PromptTemplate
 from langchain.schema.runnable import RunnablePassthrough
 
+logger = logging.getLogger(__name__)
+
 # LogicLMChain = LLM + KB retriever + LogicSolver pipeline
 class LogicLMChain:
-    def __init__(self, kb_path, model_name="gpt-3.5-turbo"):
-        # Initialize LLM wrapper
-        self.llm = LangChainLLM(model_name)
+    def __init__(self, kb_path, model_name="gpt-3.5-turbo", llm=None):
+        # Initialize LLM wrapper (`llm` = optional prebuilt chat model)
+        self.llm = LangChainLLM(model_name, llm=llm)
         # Initialize symbolic solver
         self.solver = LogicSolver()
         # Build retriever over the knowledge base (KB)
@@ -26,7 +34,8 @@ class LogicLMChain:
                 "Translate the following description into general Prolog-style logic rules."
                 " Only output general rules. Do NOT output specific facts, queries, or answers."
                 " The rules should work for any entity, not just a particular example."
-                " Use the convention that sibling(X, Y) means X is a sibling of Y, and sibling relationships are symmetric."
+                " Use the convention that sibling(X, Y) means X is a sibling of Y, and sibling relationships are symmetric"
+                " (sibling facts are only listed one way, so include the rule sibling(X, Y) :- sibling(Y, X).)."
                 " Make sure to define uncle(X, Y) as: uncle(X, Y) :- parent(Z, Y), sibling(X, Z)."
                 " Ensure each rule ends with a period.\n\n"
                 "{description}"
@@ -45,10 +54,14 @@ class LogicLMChain:
 
     # Step 2 (if errors): Refine broken logic rules
     def refine_logic(self, broken_logic, errors):
+        return self.llm.query(self.refine_prompt(broken_logic, errors))
+
+    # Prompt for step 2
+    def refine_prompt(self, broken_logic, errors):
         # Combine error messages
         error_message = "\n".join(errors)
         # Ask the LLM to only fix syntax errors
-        prompt = (
+        return (
             f"The following Prolog-like logic contains syntax errors:\n"
             f"{error_message}\n\n"
             "Please correct only the syntax errors while keeping ALL the original facts and rules."
@@ -57,20 +70,11 @@ class LogicLMChain:
             "\n\n"
             f"{broken_logic}"
         )
-        return self.llm.query(prompt)
 
     # Utility: Load pure KB facts (ignores comments and rules)
+    # The KB is compiled once and cached; it is re-read only when the file changes
     def load_kb_facts(self):
-        with open(self.kb_path, 'r') as f:
-            lines = f.readlines()
-        facts = []
-        for line in lines:
-            line = line.strip()
-            # Keep only plain facts (skip comments "%" and rules ":-")
-            if line and not line.startswith('%') and ':-' not in line:
-                facts.append(line)
-        # Join into one big string
-        return "\n".join(facts)
+        return load_kb(self.kb_path).facts_text()
 
     # Step 3: Full pipeline = Retrieve → Generate → Validate → Solve
     def solve(self, description):
@@ -80,28 +84,47 @@ class LogicLMChain:
 
         # Step 2: Generate logic rules from description + context
         logic_rule = self.logic_translate(context, description)
+        logger.info("Generated logic:\n%s", logic_rule)
 
-        print("\nGenerated Logic Output:\n")
-        print(logic_rule)
-
-        # Step 3: Validate syntax
+        # Step 3: Validate syntax; repair locally, ask the LLM only if that fails
         errors = check_logic_validity(logic_rule)
         if errors:
-            print("\nErrors Detected in Logic:")
-            for error in errors:
-                print(error)
-            print("\nRefining Logic...\n")
+            logic_rule, errors = repair_locally(logic_rule, "LogicLMChain")
+        if errors:
+            logger.warning("Errors detected in logic, refining:\n%s", "\n".join(errors))
             # Ask LLM to fix rules
+            metrics.inc("refine_retries", pipeline="LogicLMChain")
             logic_rule = self.refine_logic(logic_rule, errors)
-            print("\nRefined Logic Output:\n")
-            print(logic_rule)
+            logger.info("Refined logic:\n%s", logic_rule)
 
-        # Step 4: Load complete KB facts
-        kb_facts = self.load_kb_facts()
+        # Step 4: Load complete KB facts (already parsed, rules left out)
+        kb_facts = load_kb(self.kb_path).facts_only()
 
-        # Merge KB facts with generated logic
-        full_logic = kb_facts + "\n" + logic_rule
-
-        # Step 5: Solve with symbolic LogicSolver
-        solution = self.solver.solve_logic(full_logic)
+        # Step 5: Solve generated logic on top of the KB facts with LogicSolver
+        solution = self.solver.solve_logic(logic_rule, kb=kb_facts)
         return solution
+
+    # Async version of solve, for running many questions at once (see batch.py)
+    # LLM calls go through `throttle`; the solver runs on `executor`
+    async def asolve(self, description, throttle=None, executor=None):
+        # Step 1: Retrieve relevant KB snippets
+        if hasattr(self.retriever, "ainvoke"):
+            docs = await self.retriever.ainvoke(description)
+        else:
+            docs = await asyncio.to_thread(self.retriever.invoke, description)
+        context = "\n".join([doc.page_content for doc in docs])
+
+        # Step 2: Generate logic rules from description + context
+        full_prompt = self.prompt.format(context=context, description=description)
+        logic_rule = await self.llm.aquery(full_prompt, throttle)
+
+        # Step 3: Validate syntax; repair locally, ask the LLM only if that fails
+        errors = check_logic_validity(logic_rule)
+        if errors:
+            logic_rule, errors = repair_locally(logic_rule, "LogicLMChain")
+        if errors:
+            metrics.inc("refine_retries", pipeline="LogicLMChain")
+            logic_rule = await self.llm.aquery(self.refine_prompt(logic_rule, errors), throttle)
+
+        # Step 4: Solve on top of the KB facts in the worker pool
+        return await run_solver(executor, logic_rule, self.kb_path, facts_only=True)
@@ -0,0 +1,314 @@
+#logic_parser.py
+
+import re
+
+# Text is read this many characters at a time, so memory stays bounded by
+# the parsed facts rather than by copies of the source text
+CHUNK_SIZE = 1 << 20
+
+# Fast path: a plain fact alone on its line, e.g. "parent(tom, bob)."
+SIMPLE_FACT = re.compile(r"\s*([a-z]\w*)\(\s*(\w+(?:\s*,\s*\w+)*)\s*\)\s*\.\s*")
+ARG_SEPARATOR = re.compile(r"\s*,\s*")
+
+# Plain atoms need no quotes: 'tom' and tom are the same constant
+PLAIN_ATOM = re.compile(r"[a-z]\w*")
+
+# Tokens of the general path (one line at a time; order matters)
+TOKEN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>%.*)
+  | (?P<block>/\*)
+  | (?P<quoted>'(?:[^'\\]|\\.|'')*')
+  | (?P<string>"(?:[^"\\]|\\.)*")
+  | (?P<unterminated>['"])
+  | (?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<name>[A-Za-z_]\w*)
+  | (?P<neck>:-)
+  | (?P<end>\.(?=\s|%|$))
+  | (?P<punct>[(),\[\]|])
+  | (?P<symbol>[-+*/\\^<>=~:.?@#&$]+)
+  | (?P<other>\S)
+""", re.X)
+
+
+# Syntax error in a logic program; `line` is 1-based
+class ParseError(ValueError):
+    def __init__(self, message, line=None):
+        self.message = message
+        self.line = line
+        super().__init__(f"Line {line}: {message}" if line else message)
+
+
+# Clauses come out as tuples:
+#   ("fact", predicate, [arg, ...])
+#   ("rule", text, (head_pred, head_args), [(body_pred, body_args), ...])
+# where `text` is the rule written out canonically ("h(X) :- b(X, Y)", no period).
+# Arguments are strings; compound arguments such as car(red) and lists are
+# kept as their canonical text and matched as constants.
+
+# Incremental reader: feed() text in pieces of any size, then close()
+#   on_error: called with each ParseError (reading then carries on with the
+#             next clause); if None the error is raised
+class ClauseReader:
+    def __init__(self, on_error=None):
+        self.on_error = on_error
+        self.line = 0
+        self.tokens = []         # Tokens of the clause being read: (kind, text, line)
+        self.in_comment = False  # Inside a /* ... */ comment
+        self.carry = ""          # Unfinished last line of the previous piece
+
+    # Read a piece of text and yield the clauses it completes
+    def feed(self, text):
+        lines = (self.carry + text).split("\n")
+        self.carry = lines.pop()
+        simple_fact = SIMPLE_FACT.fullmatch
+        split_args = ARG_SEPARATOR.split
+        for line in lines:
+            # Fast path (inlined: this loop is the ingest hot spot)
+            if not self.tokens and not self.in_comment:
+                match = simple_fact(line)
+                if match:
+                    self.line += 1
+                    yield ("fact", match.group(1), split_args(match.group(2)))
+                    continue
+            yield from self.read_line(line)
+
+    # End of input: yield what is left and report unfinished clauses
+    def close(self):
+        if self.carry:
+            line, self.carry = self.carry, ""
+            yield from self.read_line(line)
+        if self.in_comment:
+            self.in_comment = False
+            self.fail(ParseError("Unterminated /* comment.", self.line))
+        if self.tokens:
+            tokens, self.tokens = self.tokens, []
+            self.fail(ParseError("Missing period at end.", tokens[-1][2]))
+            yield from self.build(tokens)
+
+    def fail(self, error):
+        if self.on_error is None:
+            raise error
+        self.on_error(error)
+
+    def read_line(self, text):
+        self.line += 1
+
+        # Step 1: most KB lines are single plain facts; match those in one go
+        if not self.tokens and not self.in_comment:
+            match = SIMPLE_FACT.fullmatch(text)
+            if match:
+                yield ("fact", match.group(1), ARG_SEPARATOR.split(match.group(2)))
+                return
+
+        # Step 2: tokenize everything else; a clause may span lines
+        pos = 0
+        if self.in_comment:
+            close = text.find("*/")
+            if close < 0:
+                return
+            self.in_comment = False
+            pos = close + 2
+        while pos < len(text):
+            match = TOKEN.match(text, pos)
+            kind = match.lastgroup
+            pos = match.end()
+            if kind == "space" or kind == "comment":
+                continue
+            if kind == "block":
+                close = text.find("*/", pos)
+                if close < 0:
+                    self.in_comment = True
+                    return
+                pos = close + 2
+            elif kind == "unterminated":
+                # The rest of the line is unreadable: drop this clause
+                self.tokens = []
+                self.fail(ParseError("Unterminated quoted atom.", self.line))
+                return
+            elif kind == "end":
+                tokens, self.tokens = self.tokens, []
+                yield from self.build(tokens)
+            else:
+                self.tokens.append((kind, match.group(), self.line))
+
+    # Turn the tokens before a "." into clauses. Normally that is one clause;
+    # a clause that is complete at the end of a line and followed by more
+    # tokens has lost its period, which is reported and parsing goes on.
+    def build(self, tokens):
+        start = 0
+        while start < len(tokens):
+            try:
+                clause, start = parse_clause(tokens, start)
+            except ParseError as e:
+                self.fail(e)
+                return
+            if start < len(tokens):
+                self.fail(ParseError("Missing period at end.", tokens[start - 1][2]))
+            yield clause
+
+
+# Parse text (a string, a file object, or an iterable of text pieces such
+# as a file's lines) and yield its clauses as it goes
+def iter_clauses(source, on_error=None, chunk_size=CHUNK_SIZE):
+    reader = ClauseReader(on_error)
+    for chunk in iter_chunks(source, chunk_size):
+        yield from reader.feed(chunk)
+    yield from reader.close()
+
+
+def iter_chunks(source, chunk_size=CHUNK_SIZE):
+    if isinstance(source, str):
+        for start in range(0, len(source), chunk_size):
+            yield source[start:start + chunk_size]
+    elif hasattr(source, "read"):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        yield from source
+
+
+# Parse one clause given as text (the final period is optional)
+def parse_clause_text(text):
+    clauses = list(iter_clauses(text.strip().rstrip(".") + "."))
+    if len(clauses) != 1:
+        raise ParseError(f"Expected one clause, found {len(clauses)}.")
+    return clauses[0]
+
+
+# Parse one term like "parent(X, Y)" into ("parent", ["X", "Y"])
+def parse_term_text(text):
+    tokens = [(kind, token, 1) for kind, token in tokenize(text)]
+    term, end = parse_term(tokens, 0)
+    if end < len(tokens):
+        raise ParseError(f"Unexpected '{tokens[end][1]}'.")
+    _, functor, args = term
+    if functor is None:
+        raise ParseError(f"Expected a predicate, found '{term[0]}'.")
+    return functor, args or []
+
+
+# Tokens of a single line of text (comments and spaces dropped)
+def tokenize(text):
+    pos = 0
+    while pos < len(text):
+        match = TOKEN.match(text, pos)
+        pos = match.end()
+        if match.lastgroup not in ("space", "comment"):
+            yield match.lastgroup, match.group()
+
+
+# --- Recursive descent over token lists ---
+
+def expect(tokens, i, text):
+    if i >= len(tokens):
+        raise ParseError(f"Expected '{text}' before the end of the clause.", tokens[-1][2])
+    if tokens[i][1] != text:
+        raise ParseError(f"Expected '{text}', found '{tokens[i][1]}'.", tokens[i][2])
+    return i + 1
+
+
+# One clause starting at tokens[i]; returns (clause, index after it)
+def parse_clause(tokens, i):
+    head, i = parse_literal(tokens, i)
+    body = None
+    if i < len(tokens) and tokens[i][0] == "neck":
+        body, i = parse_body(tokens, i + 1)
+
+    if i < len(tokens) and tokens[i][2] == tokens[i - 1][2]:
+        raise ParseError(f"Unexpected '{tokens[i][1]}'.", tokens[i][2])
+
+    head_text, head_pred, head_args = head
+    if body is None:
+        return ("fact", head_pred, head_args), i
+    text = f"{head_text} :- {', '.join(literal[0] for literal in body)}"
+    return ("rule", text, (head_pred, head_args), [(pred, args) for _, pred, args in body]), i
+
+
+# Comma-separated literals; a parenthesised group is flattened into the body
+def parse_body(tokens, i):
+    body = []
+    while True:
+        if i < len(tokens) and tokens[i][1] == "(":
+            group, i = parse_body(tokens, i + 1)
+            i = expect(tokens, i, ")")
+            body.extend(group)
+        else:
+            literal, i = parse_literal(tokens, i)
+            body.append(literal)
+        if i < len(tokens) and tokens[i][1] == ",":
+            i += 1
+            continue
+        return body, i
+
+
+# A fact, rule head or body literal: must look like pred(args)
+def parse_literal(tokens, i):
+    start = i
+    (text, functor, args), i = parse_term(tokens, i)
+    line = tokens[start][2]
+    if functor is None or (tokens[start][0] == "name" and not PLAIN_ATOM.match(functor)):
+        raise ParseError(f"Expected a predicate, found '{text}'.", line)
+    if args is None:
+        raise ParseError("Missing parentheses.", line)
+    return (text, functor, args), i
+
+
+# One term; returns ((canonical text, functor or None, args or None), next index)
+def parse_term(tokens, i):
+    if i >= len(tokens):
+        line = tokens[-1][2] if tokens else None
+        raise ParseError("Unexpected end of clause.", line)
+    kind, text, line = tokens[i]
+    i += 1
+
+    if kind == "quoted":
+        inner = text[1:-1]
+        if PLAIN_ATOM.fullmatch(inner):
+            text = inner
+    elif kind == "punct" and text == "[":
+        return parse_list(tokens, i)
+    elif kind not in ("name", "number", "string"):
+        raise ParseError(f"Unexpected '{text}'.", line)
+
+    # Compound term: name(arg, ...)
+    if kind in ("name", "quoted") and i < len(tokens) and tokens[i][1] == "(":
+        args, i = parse_arguments(tokens, i + 1, ")")
+        return (f"{text}({', '.join(args)})", text, args), i
+    functor = text if kind in ("name", "quoted") else None
+    return (text, functor, None), i
+
+
+# Terms separated by commas up to the closing bracket; returns their texts
+def parse_arguments(tokens, i, close):
+    args = []
+    while True:
+        (text, _, _), i = parse_term(tokens, i)
+        args.append(text)
+        if i < len(tokens) and tokens[i][1] == ",":
+            i += 1
+            continue
+        return args, expect(tokens, i, close)
+
+
+# [a, b, c] or [H | T]
+def parse_list(tokens, i):
+    if i < len(tokens) and tokens[i][1] == "]":
+        return ("[]", None, None), i + 1
+    items = []
+    while True:
+        (text, _, _), i = parse_term(tokens, i)
+        items.append(text)
+        if i < len(tokens) and tokens[i][1] == ",":
+            i += 1
+            continue
+        break
+    tail = ""
+    if i < len(tokens) and tokens[i][1] == "|":
+        (text, _, _), i = parse_term(tokens, i + 1)
+        tail = f"|{text}"
+    i = expect(tokens, i, "]")
+    return (f"[{', '.join(items)}{tail}]", None, None), i
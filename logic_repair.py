@@ -0,0 +1,224 @@
+#logic_repair.py
+
+import logging
+import re
+
+from logic_utils import check_logic_validity
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Mechanical fixes for LLM output, tried before asking the LLM to refine:
+#   - markdown code fences and inline backticks are removed
+#   - list bullets / numbering and "Label:" prefixes are removed
+#   - prose, queries (?- ...) and other non-clause lines are dropped
+#   - missing closing parentheses are added, extra ones removed
+#   - missing periods are added (a trailing "," or ";" before a new clause
+#     becomes a period)
+
+FENCE = re.compile(r"\s*```")
+BULLET = re.compile(r"\s*(?:[-*•+]|\d+[.)])\s+")
+LABEL = re.compile(r"[A-Z][\w -]*:\s+(?=[a-z'])")
+CLAUSE_START = re.compile(r"(?:[a-z]\w*|'[^']*')\s*\(")
+
+
+# Split a line into (code, comment) at the first % outside quotes
+def split_comment(line):
+    quote = None
+    for i, ch in enumerate(line):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"":
+            quote = ch
+        elif ch == "%":
+            return line[:i], line[i:]
+    return line, ""
+
+
+# Parenthesis depth change of a piece of code (quoted text ignored)
+def paren_balance(code):
+    depth = 0
+    quote = None
+    for ch in code:
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"":
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+    return depth
+
+
+# Index of the first ')' in code that closes more than the `depth`
+# parentheses already open (quoted text ignored), or None
+def unmatched_close(code, depth=0):
+    quote = None
+    for i, ch in enumerate(code):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"":
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+            if depth < 0:
+                return i
+    return None
+
+
+# Incremental repairer: feed() text in pieces (e.g. a streamed completion),
+# get back repaired lines. Each code line is held until the next one arrives,
+# since whether it ends its clause depends on what follows.
+# `fixes` lists what was changed as "Line N: ..." strings.
+class RuleRepairer:
+    def __init__(self):
+        self.fixes = []
+        self.line = 0
+        self.carry = ""       # Unfinished last line of the previous piece
+        self.pending = None   # (line number, code, comment) waiting for the next line
+        self.held = []        # Comment lines that came after the pending line
+        self.open = False     # Inside a clause that continues on the next line
+        self.depth = 0        # Open parentheses of the current clause
+
+    def fix(self, line, message):
+        self.fixes.append(f"Line {line}: {message}")
+
+    def feed(self, text):
+        lines = (self.carry + text).split("\n")
+        self.carry = lines.pop()
+        for line in lines:
+            yield from self.read_line(line)
+
+    def close(self):
+        if self.carry:
+            line, self.carry = self.carry, ""
+            yield from self.read_line(line)
+        yield from self.flush(None)
+
+    def read_line(self, raw):
+        self.line += 1
+        line = raw.rstrip()
+
+        # Step 1: markup around the code
+        if FENCE.match(line):
+            self.fix(self.line, "removed code fence")
+            return
+        if not line.strip():
+            yield from self.flush(None)  # A blank line ends the clause
+            yield ""
+            return
+        if line.lstrip().startswith(("%", "/*")):
+            if self.pending is None:
+                yield line
+            else:
+                self.held.append(line)
+            return
+        stripped = line.strip()
+        if "`" in stripped:
+            stripped = stripped.replace("`", "")
+            self.fix(self.line, "removed backticks")
+        if not self.open:
+            bullet = BULLET.match(stripped)
+            if bullet:
+                stripped = stripped[bullet.end():]
+                self.fix(self.line, "removed list marker")
+            label = LABEL.match(stripped)
+            if label:
+                stripped = stripped[label.end():]
+                self.fix(self.line, "removed label")
+        code, comment = split_comment(stripped)
+        code = code.rstrip()
+
+        # Step 2: finish the pending line, now that we know what follows
+        yield from self.flush((code, line[:1].isspace()))
+
+        # Step 3: anything outside a clause must start like one
+        if not self.open and not CLAUSE_START.match(code):
+            if code:
+                self.fix(self.line, f"dropped non-clause line: {stripped[:40]}")
+            return
+        self.pending = (self.line, code, comment)
+
+    # Emit the pending line (and comments held behind it)
+    def flush(self, following):
+        if self.pending is not None:
+            yield self.finish(following)
+        yield from self.held
+        self.held = []
+
+    # Decide how the pending line ends. `following` is (code, indented) of the
+    # next code line, or None when the clause cannot go on (blank line, end).
+    def finish(self, following):
+        line, code, comment = self.pending
+        self.pending = None
+        open_before = self.depth
+        self.depth += paren_balance(code)
+
+        # Too many closing parentheses: drop each ')' that closes nothing,
+        # wherever it is (if none can be found the line is left as it is)
+        while self.depth < 0:
+            extra = unmatched_close(code, open_before)
+            if extra is None:
+                break
+            code = code[:extra] + code[extra + 1:]
+            self.depth += 1
+            self.fix(line, "removed extra ')'")
+
+        if code.endswith("."):
+            self.open = False
+        elif following is None:
+            self.open = False
+        elif code.endswith(":-") or following[0].startswith(":-"):
+            self.open = True
+        elif CLAUSE_START.match(following[0]) and not following[1]:
+            # An unindented clause start: a new clause, unless this line ends
+            # with "," and the next is not a rule head (then it is the body)
+            self.open = code.endswith(",") and ":-" not in following[0]
+        else:
+            self.open = self.depth > 0 or code.endswith((",", "("))
+
+        if not self.open and not code.endswith("."):
+            # The clause ends here: close parentheses and add the period
+            message = "added missing period"
+            if code.endswith((",", ";")):
+                code = code[:-1].rstrip()
+                message = "replaced trailing separator with a period"
+            if self.depth > 0:
+                code += ")" * self.depth
+                self.fix(line, "added missing ')'")
+            code += "."
+            self.fix(line, message)
+        if not self.open:
+            self.depth = 0
+        return code + (" " + comment if comment else "")
+
+
+# Repair a whole text; returns (repaired text, fixes)
+def repair_logic(logic_text):
+    repairer = RuleRepairer()
+    lines = list(repairer.feed(logic_text))
+    lines.extend(repairer.close())
+    return "\n".join(lines).strip("\n"), repairer.fixes
+
+
+# Log (and count in metrics) an LLM refine round-trip that local repair made unnecessary
+def record_saved_round_trip(pipeline, fixes):
+    metrics.inc("refine_saved", pipeline=pipeline)
+    logger.info("Local repair fixed the logic without the LLM: %s", "; ".join(fixes))
+
+
+# Try local repair on logic that failed validation. Returns (text, errors):
+# the repaired text and whatever errors are still left for the LLM to fix
+# (none means an LLM round-trip was saved)
+def repair_locally(logic_text, pipeline):
+    repaired, fixes = repair_logic(logic_text)
+    errors = check_logic_validity(repaired)
+    if not errors:
+        record_saved_round_trip(pipeline, fixes)
+    return repaired, errors
@@ -1,141 +1,859 @@
 #logic_utils.py
 
-import re
+import logging
+import time
 from collections import defaultdict
-from itertools import product
+from closure import LinearClosure, is_symmetric, swapped_rows
+from fact_store import FactStore, Relation
+from logic_parser import ParseError, iter_clauses, parse_clause_text, parse_term_text
+from metrics import metrics
+from parallel_eval import WorkerPool, parallel_workers
 
-# Check if Prolog-like logic rules have basic syntax issues
+logger = logging.getLogger(__name__)
+
+# Check Prolog-like logic for syntax errors (see logic_parser)
+# `logic_text` may also be a file object or an iterable of lines.
+# Returns messages like "Line 3: Missing period at end."; empty means valid
 def check_logic_validity(logic_text):
     errors = []
-    for line in logic_text.strip().split('\n'):   # Process each line
-        stripped = line.strip()
-        # Every rule/fact must end with a period
-        if not stripped.endswith('.'):
-            errors.append("Missing period at end.")
-        # Must have parentheses to look like a fact or rule
-        if '(' not in stripped or ')' not in stripped:
-            errors.append("Missing parentheses.")
+    clauses = 0
+    for _ in iter_clauses(logic_text, on_error=lambda e: errors.append(str(e))):
+        clauses += 1
+    # Nothing at all to solve is an error too
+    if not clauses and not errors:
+        errors.append("No facts or rules found.")
     return errors
 
 
-# Split a rule's body into separate predicates
-# Example: "parent(X,Y), sibling(X,Z)" → ["parent(X,Y)", "sibling(X,Z)"]
-# Regex makes sure commas inside (...) aren’t split
-def split_predicates(body_text):
-    return [x.strip() for x in re.split(r',\s*(?![^()]*\))', body_text)]
+# Parse a single atom like "parent(X, Y)" into ("parent", ["X", "Y"])
+def parse_atom(atom_text):
+    return parse_term_text(atom_text)
+
+
+# Accept a fact as "parent(tom, zoe)" (trailing period optional) or as
+# ("parent", ["tom", "zoe"]) and return (predicate, [args])
+def parse_fact(fact):
+    if isinstance(fact, str):
+        return parse_atom(fact.strip().rstrip('.'))
+    predicate, args = fact
+    return predicate, list(args)
+
+
+# Parse a rule string "head :- body" into
+# (head_pred, head_args, body_preds, filter_reflexive)
+# body_preds is a list of (pred_name, pred_args) in the order they were written;
+# filter_reflexive drops results like uncle(john, john) (always on for user rules)
+def parse_rule(rule):
+    clause = parse_clause_text(rule)
+    if clause[0] != "rule":
+        raise ParseError(f"Not a rule: {rule}")
+    _, _, (head_predicate, head_args), body_preds = clause
+    return head_predicate, head_args, body_preds, True
+
+
+# Order rules into strata so every predicate is fully computed before it is used
+# Predicates that depend on each other (e.g. ancestor → ancestor) share a stratum
+# Returns a list of (stratum_predicates, stratum_rules), dependencies first
+def stratify(compiled_rules):
+    # Build dependency graph: head predicate → body predicates
+    depends_on = defaultdict(set)
+    for head_pred, _, body_preds, _ in compiled_rules:
+        depends_on[head_pred].update(pred for pred, _ in body_preds)
+
+    # Tarjan's strongly connected components
+    # SCCs come out after everything they depend on, which is exactly stratum order
+    index_of, lowlink = {}, {}
+    stack, on_stack = [], set()
+    components = []
+
+    def visit(pred):
+        index_of[pred] = lowlink[pred] = len(index_of)
+        stack.append(pred)
+        on_stack.add(pred)
+        for dep in depends_on.get(pred, ()):
+            if dep not in index_of:
+                visit(dep)
+                lowlink[pred] = min(lowlink[pred], lowlink[dep])
+            elif dep in on_stack:
+                lowlink[pred] = min(lowlink[pred], index_of[dep])
+        if lowlink[pred] == index_of[pred]:
+            component = set()
+            while True:
+                member = stack.pop()
+                on_stack.discard(member)
+                component.add(member)
+                if member == pred:
+                    break
+            components.append(component)
+
+    for pred in list(depends_on):
+        if pred not in index_of:
+            visit(pred)
+
+    # Attach rules to the stratum of their head predicate
+    strata = []
+    for component in components:
+        stratum_rules = [r for r in compiled_rules if r[0] in component]
+        if stratum_rules:
+            strata.append((component, stratum_rules))
+    return strata
+
+
+# Magic-sets rewrite: specialise the rules to one goal pattern
+# `adornment` marks each goal argument as bound ('b') or free ('f').
+# Every IDB predicate reached from the goal gets an adorned copy ("uncle@fb")
+# plus a "magic@uncle@fb" relation holding the bound arguments it is asked
+# about, so bottom-up evaluation only touches facts relevant to the goal.
+# Facts stored under an IDB predicate are pulled in through the magic relation.
+def magic_rewrite(compiled_rules, goal_predicate, adornment, arities):
+    rules_for = defaultdict(list)
+    for rule in compiled_rules:
+        rules_for[rule[0]].append(rule)
+
+    rewritten = []
+    todo = [(goal_predicate, adornment)]
+    seen = set(todo)
+    while todo:
+        pred, adorn = todo.pop()
+        adorned = f"{pred}@{adorn}"
+        magic = f"magic@{pred}@{adorn}" if 'b' in adorn else None
+
+        for _, head_args, body_preds, filter_reflexive in rules_for[pred]:
+            # Variables bound on entry are the head arguments marked 'b'
+            bound = {arg for arg, a in zip(head_args, adorn) if a == 'b' and is_variable(arg)}
+            new_body = []
+            if magic:
+                new_body.append((magic, [arg for arg, a in zip(head_args, adorn) if a == 'b']))
+
+            # Sideways information passing: next literal = the one with the most
+            # bound arguments so far (ties keep the written order)
+            remaining = list(body_preds)
+            while remaining:
+                literal = max(remaining, key=lambda lit: sum(
+                    1 for arg in lit[1] if not is_variable(arg) or arg in bound))
+                remaining.remove(literal)
+                body_pred, body_args = literal
+                if body_pred in rules_for:
+                    body_adorn = ''.join(
+                        'b' if not is_variable(arg) or arg in bound else 'f' for arg in body_args)
+                    if 'b' in body_adorn:
+                        # Ask the body predicate about the values bound here
+                        magic_args = [arg for arg, a in zip(body_args, body_adorn) if a == 'b']
+                        rewritten.append((f"magic@{body_pred}@{body_adorn}", magic_args, list(new_body), False))
+                    if (body_pred, body_adorn) not in seen:
+                        seen.add((body_pred, body_adorn))
+                        todo.append((body_pred, body_adorn))
+                    new_body.append((f"{body_pred}@{body_adorn}", body_args))
+                else:
+                    new_body.append(literal)
+                bound.update(arg for arg in body_args if is_variable(arg) and arg != '_')
+
+            rewritten.append((adorned, head_args, new_body, filter_reflexive))
+
+        # Stored facts of this predicate (e.g. ancestor(susan, john))
+        if pred in arities:
+            variables = [f"V{i}" for i in range(arities[pred])]
+            body = [(pred, variables)]
+            if magic:
+                body.insert(0, (magic, [v for v, a in zip(variables, adorn) if a == 'b']))
+            rewritten.append((adorned, variables, body, False))
+
+    return rewritten
+
+
+# Prolog convention: variables start with an uppercase letter or "_"
+def is_variable(term):
+    return term[:1].isupper() or term[:1] == '_'
+
+
+# A rule compiled into an ordered list of indexed lookups
+# Body literals are ordered greedily: at each step pick the literal with the
+# fewest expected matches given the variables already bound, so constants and
+# shared variables cut down candidates before anything is combined.
+# With delta_position set, that literal reads the delta and goes first.
+# Constants are interned through `symbols`, so the plan works on integer ids.
+class JoinPlan:
+    __slots__ = ("rule", "head_predicate", "filter_reflexive", "delta_position", "steps", "head", "partition_column")
+
+    def __init__(self, rule, relations, symbols, delta_position=None):
+        head_predicate, head_args, body_preds, filter_reflexive = rule
+        self.rule = rule
+        self.head_predicate = head_predicate
+        self.filter_reflexive = filter_reflexive
+        self.delta_position = delta_position
+
+        # Step 1: choose the join order
+        order = []
+        bound = set()
+        remaining = list(range(len(body_preds)))
+        if delta_position is not None:
+            order.append(delta_position)
+            remaining.remove(delta_position)
+            bound.update(body_preds[delta_position][1])
+        while remaining:
+            best = min(remaining, key=lambda i: self.estimate(body_preds[i], bound, relations))
+            order.append(best)
+            remaining.remove(best)
+            bound.update(body_preds[best][1])
+
+        # Step 2: compile each literal into (lookup key, new bindings, checks)
+        # Bindings are tuples; `slots` maps each variable to its tuple position
+        slots = {}
+        self.steps = []
+        for i in order:
+            pred, args = body_preds[i]
+            key_positions, key_parts, new_positions, checks = [], [], [], []
+            first_seen = {}
+            for pos, arg in enumerate(args):
+                if not is_variable(arg):
+                    key_positions.append(pos)      # Constant: look it up directly
+                    key_parts.append((False, symbols.intern(arg)))
+                elif arg == '_':
+                    continue                       # Anonymous variable: matches anything
+                elif arg in slots:
+                    key_positions.append(pos)      # Already bound: join key
+                    key_parts.append((True, slots[arg]))
+                elif arg in first_seen:
+                    checks.append((pos, first_seen[arg]))  # p(X, X) style repeat
+                else:
+                    first_seen[arg] = pos
+                    new_positions.append(pos)
+            for pos in new_positions:
+                slots[args[pos]] = len(slots)
+            self.steps.append((i, pred, len(args), tuple(key_positions), key_parts, tuple(new_positions), checks))
+
+        # Column of the first literal to hash-partition on for parallel runs:
+        # the one that joins with the next literal, so partitions split on the join key
+        self.partition_column = 0
+        if self.steps:
+            first_new = self.steps[0][5]
+            if first_new:
+                self.partition_column = first_new[0]
+            if len(self.steps) > 1:
+                for is_slot, v in self.steps[1][4]:
+                    if is_slot and v < len(first_new):
+                        self.partition_column = first_new[v]
+                        break
+
+        # Step 3: how to build the head; unbound head variables become '?'
+        self.head = []
+        for arg in head_args:
+            if arg in slots:
+                self.head.append((True, slots[arg]))
+            else:
+                self.head.append((False, symbols.intern('?' if is_variable(arg) else arg)))
+
+    # Expected number of matches for a literal given the bound variables
+    @staticmethod
+    def estimate(literal, bound, relations):
+        pred, args = literal
+        relation = relations.get(pred)
+        if relation is None or relation.arity != len(args):
+            return 0  # Empty relation: join it first, nothing will match
+        positions = tuple(p for p, arg in enumerate(args) if not is_variable(arg) or arg in bound)
+        return relation.fanout(positions)
+
+    # Run the plan and return the head rows (tuples of ids) it produces
+    # partition=(part, parts) keeps only first-literal rows whose partition
+    # column hashes to `part` (used by parallel evaluation)
+    # `stats`, if given, is a one-item list that the number of rows examined
+    # is added to (for metrics)
+    def run(self, relations, delta=None, partition=None, stats=None):
+        counting = stats is not None
+        examined = 0
+        bindings = [()]
+        if partition is not None and not self.steps and partition[0]:
+            return []  # No body: partition 0 produces the single head
+        for step_number, (i, pred, arity, key_positions, key_parts, new_positions, checks) in enumerate(self.steps):
+            source = delta.get(pred) if i == self.delta_position else relations.get(pred)
+            if source is None or source.arity != arity:
+                return []  # Nothing (or nothing of this arity) to match
+            columns = source.columns
+            part_column = None
+            if partition is not None and step_number == 0:
+                part, parts = partition
+                if arity:
+                    part_column = columns[self.partition_column]
+                elif part:
+                    return []
+            new_columns = [columns[p] for p in new_positions]
+            single_key = len(key_parts) == 1
+            next_bindings = []
+            for binding in bindings:
+                if single_key:
+                    is_slot, v = key_parts[0]
+                    key = binding[v] if is_slot else v
+                else:
+                    key = tuple([binding[v] if is_slot else v for is_slot, v in key_parts])
+                row_ids = source.lookup(key_positions, key)
+                if part_column is not None:
+                    row_ids = [r for r in row_ids if part_column[r] % parts == part]
+                if counting:
+                    examined += len(row_ids)
+                for row_id in row_ids:
+                    if checks and any(columns[p][row_id] != columns[q][row_id] for p, q in checks):
+                        continue
+                    next_bindings.append(binding + tuple([column[row_id] for column in new_columns]))
+            bindings = next_bindings
+            if not bindings:
+                break
+
+        if counting:
+            stats[0] += examined
+        if not bindings:
+            return []
+        head = self.head
+        return [tuple([b[v] if is_slot else v for is_slot, v in head]) for b in bindings]
+
+
+# JoinPlan for p(X, Y) :- p(Y, X): the result is its input with the columns
+# swapped, so the rows are produced in one zip instead of one lookup each
+class SymmetricPlan(JoinPlan):
+    __slots__ = ()
+
+    def run(self, relations, delta=None, partition=None, stats=None):
+        pred = self.steps[0][1]
+        source = delta.get(pred) if self.delta_position == 0 else relations.get(pred)
+        if source is None or source.arity != 2:
+            return []
+        if stats is not None:
+            stats[0] += len(source)
+        return swapped_rows(source, partition, self.partition_column)
+
+
+# Plan for a rule, using a dedicated operator when the rule has a known shape
+def make_plan(rule, relations, symbols, delta_position=None):
+    if is_symmetric(rule):
+        return SymmetricPlan(rule, relations, symbols, delta_position)
+    return JoinPlan(rule, relations, symbols, delta_position)
+
+
+# Compiled rule → readable text, used to label per-rule metrics
+def rule_label(rule):
+    head_predicate, head_args, body_preds, _ = rule
+    body = ", ".join(f"{pred}({', '.join(args)})" for pred, args in body_preds)
+    return f"{head_predicate}({', '.join(head_args)}) :- {body}"
+
+
+# Evaluation engines LogicSolver accepts
+ENGINES = ("python", "numpy")
 
 
 # Core logic solver
 class LogicSolver:
-    def __init__(self):
-        self.facts = []  # List of parsed facts (predicate, args)
-        self.rules = []  # List of parsed rules (raw strings)
+    # workers > 1 evaluates large rounds on forked worker processes (see
+    # parallel_eval); with fewer CPUs than workers everything runs in-process
+    # engine="numpy" evaluates whole programs with vectorised joins (see
+    # numpy_engine); incremental updates still run tuple at a time
+    def __init__(self, workers=1, engine="python"):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine {engine!r}, expected one of {', '.join(ENGINES)}")
+        if engine == "numpy":
+            try:
+                import numpy_engine  # noqa: F401 (fails here, not mid-solve, without NumPy)
+            except ImportError as e:
+                raise ImportError("LogicSolver(engine='numpy') needs NumPy (pip install numpy)") from e
+        self.engine = engine
+        self.workers = parallel_workers(workers)
+        self.facts = FactStore()  # Parsed facts, interned and stored per predicate
+        self.rules = []           # List of parsed rules (raw strings)
+        self.relations = None     # Materialised facts + derived tuples (after solving)
+        self.rederived = {}       # Fact rows that rules also derive, per predicate
+        self.compiled_rules = []  # Parsed rules behind self.relations
+        self.update_plans = None  # Delta plans for incremental updates (built on demand)
 
     # Parse logic text into facts + rules
-    def parse_logic(self, logic_text):
-        # Reset stored facts and rules
-        self.facts.clear()
-        self.rules.clear()
-
-        # Process each line of logic text
-        lines = logic_text.strip().split('\n')
-        for line in lines:
-            line = line.strip().strip('.')  # Remove whitespace + trailing "."
-            if not line:
-                continue  # Skip empty lines
-            if ':-' in line:
-                # Rules go into self.rules
-                self.rules.append(line)
-            else:
-                # Facts → parse predicate + args
-                if '(' in line and ')' in line:
-                    predicate, args = line.split('(')
-                    args = args.strip(')').split(',')
-                    self.facts.append((predicate.strip(), [arg.strip() for arg in args]))
-                else:
-                    # Skip garbage lines
-                    print(f"Skipping invalid line: {line}")
-
-        # Auto-add symmetric sibling facts
-        # If sibling(A, B) exists, also add sibling(B, A)
-        new_sibling_facts = []
-        for pred, args in self.facts:
-            if pred == "sibling" and len(args) == 2:
-                reversed_fact = ("sibling", [args[1], args[0]])
-                if reversed_fact not in self.facts:
-                    new_sibling_facts.append(reversed_fact)
-        self.facts.extend(new_sibling_facts)
-
-    # Try to solve the logic program
-    def solve_logic(self, logic_text):
+    # logic_text may be a string, a file object or an iterable of lines; it is
+    # read in chunks and facts go straight into the store (see logic_parser).
+    # With a compiled KB (see kb_loader), its facts and rules are reused as
+    # they are and logic_text only adds to them
+    def parse_logic(self, logic_text, kb=None):
+        # Reset stored facts and rules (and any materialised results)
+        self.relations = None
+        self.update_plans = None
+        if kb is None:
+            self.facts.clear()
+            self.rules.clear()
+        else:
+            self.facts = kb.facts.fork()
+            self.rules = list(kb.rules)
+
+        # Read clauses as they are parsed; clauses with syntax errors are skipped
+        facts = self.facts
+        intern = facts.symbols.intern
+        writable = {}  # predicate → relation being filled (looked up once)
+        for clause in iter_clauses(logic_text, on_error=self.skip_clause):
+            if clause[0] == "rule":
+                # Rules go into self.rules (in canonical form)
+                self.rules.append(clause[1])
+                continue
+            # Facts → straight into the store
+            _, predicate, args = clause
+            relation = writable.get(predicate)
+            if relation is None:
+                relation = writable[predicate] = facts.relation(predicate, len(args))
+            if relation.arity != len(args):
+                logger.warning("Skipping fact with wrong arity: %s(%s)", predicate, ", ".join(args))
+                continue
+            relation.add(tuple(map(intern, args)))
+
+    # Parse errors in parse_logic: log and carry on with the next clause
+    @staticmethod
+    def skip_clause(error):
+        logger.warning("Skipping invalid clause: %s", error)
+
+    # Try to solve the logic program (optionally on top of a compiled KB)
+    def solve_logic(self, logic_text, kb=None):
         # Parse facts and rules
-        self.parse_logic(logic_text)
+        with metrics.timer("solver_seconds", phase="parse"):
+            self.parse_logic(logic_text, kb)
 
-        # Debug Print: Facts
-        print("\nFacts:")
-        for pred, args in self.facts:
-            print(f"{pred}({', '.join(args)})")
+        # Debug log: facts and rules (skipped entirely unless DEBUG is on)
+        if logger.isEnabledFor(logging.DEBUG):
+            for pred, args in self.facts:
+                logger.debug("Fact: %s(%s)", pred, ", ".join(args))
+            for rule in self.rules:
+                logger.debug("Rule: %s", rule)
 
-        # Debug Print: Rules
-        print("\nRules:")
-        for rule in self.rules:
-            print(rule)
+        with metrics.timer("solver_seconds", phase="evaluate"):
+            self.materialize()
+        return self.derived_facts()
 
-        # Put facts into dictionary: predicate → list of arg-lists
-        fact_dict = defaultdict(list)
-        for predicate, args in self.facts:
-            fact_dict[predicate].append(args)
+    # Evaluate all rules over the parsed facts and keep the result in
+    # self.relations, so assert_fact/retract_fact can maintain it afterwards
+    def materialize(self):
+        compiled_rules = [parse_rule(rule) for rule in self.rules]
+        # Fact rows that a rule derived again (everything else a rule derives
+        # is simply whatever ends up in a head relation beyond the facts)
+        rederived = {}
 
-        derived_facts = set()
+        if self.engine == "numpy":
+            from numpy_engine import evaluate
+            relations, rederived = evaluate(compiled_rules, self.facts)
+        else:
+            # Working set of relations; derived tuples are added to it, so only
+            # rule heads are copied (the rest are read as they are, indexes and all)
+            heads = {rule[0] for rule in compiled_rules}
+            relations = {
+                pred: relation.copy() if pred in heads else relation
+                for pred, relation in self.facts.relations.items()
+            }
+            for _ in self.evaluate(compiled_rules, relations, rederived):
+                pass
 
-        # Try to apply each rule
-        for rule in self.rules:
-            # Split into head and body
-            head, body = rule.split(':-')
-            head_predicate, head_args = head.strip().split('(')
-            head_args = [h.strip() for h in head_args.strip(')').split(',')]
-
-            # Clean body (remove wrapping parentheses if any)
-            body = body.strip()
-            if body.startswith('(') and body.endswith(')'):
-                body = body[1:-1]
-
-            # Split body into predicates
-            body_predicates = split_predicates(body)
-            body_preds = []
-            for b in body_predicates:
-                pred_name, pred_args = b.split('(')
-                pred_args = [arg.strip() for arg in pred_args.strip(')').split(',')]
-                body_preds.append((pred_name.strip(), pred_args))
-
-            # For each predicate in body, get all matching facts
-            fact_sets = []
-            for pred_name, pred_vars in body_preds:
-                fact_sets.append(fact_dict.get(pred_name, []))
-
-            # Try all combinations of facts from the body predicates
-            for fact_combo in product(*fact_sets):
-                var_bindings = {}  # Map variables → concrete values
-                match = True
-
-                # Check if variables can be consistently bound
-                for (pred_vars, fact_args) in zip([bp[1] for bp in body_preds], fact_combo):
-                    for var, val in zip(pred_vars, fact_args):
-                        if var in var_bindings:
-                            if var_bindings[var] != val:
-                                match = False  # Conflict in variable assignment
-                                break
-                        else:
-                            var_bindings[var] = val
-                    if not match:
-                        break
+        self.compiled_rules = compiled_rules
+        self.relations = relations
+        self.rederived = rederived
+        self.update_plans = None
 
-                if match:
-                    # Build result for head using variable bindings
-                    result = tuple(var_bindings.get(var.strip(), '?') for var in head_args)
+    # Independent copy of the materialised program, to add facts and rules to
+    # without solving it again (see kb_loader.CompiledKB.solver). Stored facts
+    # are shared copy-on-write (FactStore.fork); derived relations are copied.
+    def fork(self):
+        if self.relations is None:
+            self.materialize()
+        clone = LogicSolver(self.workers, self.engine)
+        clone.facts = self.facts.fork()
+        clone.rules = list(self.rules)
+        clone.compiled_rules = list(self.compiled_rules)
+        heads = {rule[0] for rule in self.compiled_rules}
+        clone.relations = {
+            pred: relation.copy() if pred in heads else relation
+            for pred, relation in self.relations.items()
+        }
+        clone.rederived = {pred: set(rows) for pred, rows in self.rederived.items()}
+        return clone
 
-                    # 🛠️ NEW: Skip nonsense results where X == Y
-                    if result[0] != result[1]:
-                        derived_facts.add((head_predicate, result))
+    # Current derived facts as {(predicate, (arg, ...)), ...}
+    def derived_facts(self):
+        if self.relations is None:
+            self.materialize()
+        symbols = self.facts.symbols
+        derived_facts = set()
 
+        # Collect derived rows per head predicate, decoded back to names
+        for pred in {rule[0] for rule in self.compiled_rules}:
+            relation = self.relations.get(pred)
+            if relation is None:
+                continue
+            base = self.facts.relations.get(pred)
+            again = self.rederived.get(pred, ())
+            for row in relation:
+                if base is None or row not in base or row in again:
+                    derived_facts.add((pred, symbols.decode(row)))
         return derived_facts
+
+    # Add one fact, e.g. "parent(tom, zoe)", and update every derived relation
+    # Only derivations that use the new fact are computed (semi-naive from a
+    # one-row delta). Returns False if the fact was already stored.
+    def assert_fact(self, fact):
+        predicate, args = parse_fact(fact)
+        if self.relations is None:
+            self.materialize()
+        if self.facts.contains(predicate, args):
+            return False
+        if not self.facts.add(predicate, args):
+            logger.warning("Skipping fact with wrong arity: %s", fact)
+            return False
+
+        row = self.facts.encode(args)
+        heads = {rule[0] for rule in self.compiled_rules}
+        if predicate not in heads:
+            # Plain fact relation: the materialised state reads it directly
+            self.relations[predicate] = self.facts.relations[predicate]
+        else:
+            target = self.relations.get(predicate)
+            if target is None:
+                target = self.relations[predicate] = Relation(len(row))
+            if not target.add(row):
+                # Already derived by a rule: now it is also a stored fact
+                self.rederived.setdefault(predicate, set()).add(row)
+                return True
+
+        self.propagate_inserts({predicate: Relation(len(row), [row])})
+        return True
+
+    # Remove one stored fact and update every derived relation (DRed):
+    #   1. over-delete everything with a derivation that used the fact
+    #   2. put back over-deleted tuples that still have another derivation
+    #   3. propagate the put-back tuples like new facts
+    # Returns False if the fact was not stored (derived facts cannot be retracted).
+    def retract_fact(self, fact):
+        predicate, args = parse_fact(fact)
+        if self.relations is None:
+            self.materialize()
+        if not self.facts.contains(predicate, args):
+            return False
+
+        row = self.facts.encode(args)
+        heads = {rule[0] for rule in self.compiled_rules}
+
+        # Step 1: over-delete, using the state from before the removal
+        deleted = self.overdelete({predicate: Relation(len(row), [row])})
+
+        # Remove the fact and every over-deleted tuple
+        self.facts.remove(predicate, args)
+        if predicate not in heads:
+            self.relations[predicate] = self.facts.relations[predicate]
+        for pred, rows in deleted.items():
+            if pred in heads:
+                target = self.relations[pred]
+                again = self.rederived.get(pred)
+                for gone in rows:
+                    target.remove(gone)
+                    if again:
+                        again.discard(gone)
+
+        # Step 2: one-step rederivation from what is left
+        restored = self.rederive(deleted)
+
+        # Step 3: re-insert and let them re-derive their dependants
+        delta = {}
+        for pred, rows in restored.items():
+            target = self.relations[pred]
+            fresh = Relation(rows.arity)
+            for back in rows:
+                if target.add(back):
+                    fresh.add(back)
+            if len(fresh):
+                delta[pred] = fresh
+        self.propagate_inserts(delta)
+        return True
+
+    # Delta plans for every rule and body literal, built once per program
+    def get_update_plans(self):
+        if self.update_plans is None:
+            symbols = self.facts.symbols
+            self.update_plans = [
+                make_plan(rule, self.relations, symbols, i)
+                for rule in self.compiled_rules
+                for i in range(len(rule[2]))
+            ]
+        return self.update_plans
+
+    # Semi-naive propagation of newly inserted tuples to a fixpoint
+    # (rules have no negation, so strata need not be respected here)
+    # Returns each round's new tuples ({predicate: Relation})
+    def propagate_inserts(self, delta):
+        plans = self.get_update_plans()
+        rounds = []
+        while delta:
+            delta = self.apply_plans(plans, self.relations, self.rederived, delta)
+            if delta:
+                rounds.append(delta)
+        return rounds
+
+    # Add one rule to the materialised program and derive what it adds.
+    # With no negation, running the new rule once over the current fixpoint
+    # and propagating its results gives the same fixpoint as a full solve.
+    # Returns the newly derived facts as {(predicate, (arg, ...)), ...}
+    def add_rule(self, rule):
+        compiled = parse_rule(rule)
+        if self.relations is None:
+            self.materialize()
+        head_predicate = compiled[0]
+
+        # A fact relation becoming a rule head gets its own copy to derive into
+        if head_predicate not in {r[0] for r in self.compiled_rules}:
+            base = self.facts.relations.get(head_predicate)
+            if base is not None and self.relations.get(head_predicate) is base:
+                self.relations[head_predicate] = base.copy()
+
+        self.rules.append(rule)
+        self.compiled_rules.append(compiled)
+        self.update_plans = None
+
+        plan = make_plan(compiled, self.relations, self.facts.symbols)
+        delta = self.apply_plans([plan], self.relations, self.rederived)
+        rounds = [delta] + self.propagate_inserts(delta) if delta else []
+
+        decode = self.facts.symbols.decode
+        return {(pred, decode(row)) for new in rounds for pred, rows in new.items() for row in rows}
+
+    # DRed step 1: every stored tuple with at least one derivation that uses a
+    # deleted tuple, found semi-naively from `deleted` ({predicate: Relation})
+    def overdelete(self, deleted):
+        plans = self.get_update_plans()
+        delta = deleted
+        while delta:
+            found = {}
+            for plan in plans:
+                if plan.steps[0][1] not in delta:
+                    continue
+                head_predicate = plan.head_predicate
+                known = self.relations.get(head_predicate)
+                if known is None:
+                    continue
+                for result in plan.run(self.relations, delta):
+                    if plan.filter_reflexive and len(result) >= 2 and result[0] == result[1]:
+                        continue
+                    if result not in known:
+                        continue
+                    gone = deleted.get(head_predicate)
+                    if gone is None:
+                        gone = deleted[head_predicate] = Relation(len(result))
+                    if gone.add(result):
+                        found.setdefault(head_predicate, Relation(len(result))).add(result)
+            delta = found
+        return deleted
+
+    # DRed step 2: which over-deleted tuples can still be derived (or are
+    # still stored facts). Each rule runs once with its head bound to the
+    # over-deleted tuples, through a "seed" literal joined first.
+    def rederive(self, deleted):
+        symbols = self.facts.symbols
+        restored = {}
+        for rule in self.compiled_rules:
+            head_predicate, head_args, body_preds, filter_reflexive = rule
+            gone = deleted.get(head_predicate)
+            if gone is None or not len(gone):
+                continue
+            seed = f"seed@{head_predicate}"
+            seeded_rule = (head_predicate, head_args, [(seed, head_args)] + body_preds, filter_reflexive)
+            plan = JoinPlan(seeded_rule, self.relations, symbols, 0)
+            for result in plan.run(self.relations, {seed: gone}):
+                if filter_reflexive and len(result) >= 2 and result[0] == result[1]:
+                    continue
+                restored.setdefault(head_predicate, Relation(len(result))).add(result)
+
+        # Stored facts come back too; remember which of them rules also derive
+        for pred, rows in deleted.items():
+            base = self.facts.relations.get(pred)
+            if base is None or pred not in {rule[0] for rule in self.compiled_rules}:
+                continue
+            back = restored.get(pred)
+            for row in rows:
+                if row in base:
+                    if back is not None and row in back:
+                        self.rederived.setdefault(pred, set()).add(row)
+                    else:
+                        restored.setdefault(pred, Relation(len(row))).add(row)
+        return restored
+
+    # Answer one goal such as "uncle(X, emma)" or "ancestor(susan, lily)"
+    # Only the part of the program relevant to the goal is evaluated (magic
+    # sets), and answers are yielded as soon as a fixpoint round finds them,
+    # as tuples of names: ("mike", "emma"), ...
+    # Uses the program from the last parse_logic/solve_logic unless
+    # logic_text is given.
+    def query(self, goal, logic_text=None):
+        if logic_text is not None:
+            self.parse_logic(logic_text)
+        goal_predicate, goal_args = parse_atom(goal.strip().rstrip('.'))
+        symbols = self.facts.symbols
+
+        # Goal pattern: constants must match, repeated variables must agree
+        constants = [(pos, symbols.intern(arg)) for pos, arg in enumerate(goal_args) if not is_variable(arg)]
+        first_pos = {}
+        same = []
+        for pos, arg in enumerate(goal_args):
+            if is_variable(arg) and arg != '_':
+                if arg in first_pos:
+                    same.append((pos, first_pos[arg]))
+                else:
+                    first_pos[arg] = pos
+
+        def matches(row):
+            return all(row[p] == v for p, v in constants) and all(row[p] == row[q] for p, q in same)
+
+        compiled_rules = [parse_rule(rule) for rule in self.rules]
+        if goal_predicate not in {rule[0] for rule in compiled_rules} or self.relations is not None:
+            # Plain facts, or a materialised program (which already holds every
+            # derived tuple, so repeated goals like ancestor(john, X) are
+            # answered from the relation's index): one lookup on the bound positions
+            source = self.relations if self.relations is not None else self.facts.relations
+            relation = source.get(goal_predicate)
+            if relation is None or relation.arity != len(goal_args):
+                return
+            positions = tuple(p for p, _ in constants)
+            key = constants[0][1] if len(constants) == 1 else tuple(v for _, v in constants)
+            for row_id in relation.lookup(positions, key):
+                row = relation.row(row_id)
+                if matches(row):
+                    yield symbols.decode(row)
+            return
+
+        # Rewrite the program for this goal pattern and seed the magic relation
+        adornment = ''.join('f' if is_variable(arg) else 'b' for arg in goal_args)
+        arities = {pred: relation.arity for pred, relation in self.facts.relations.items()}
+        magic_rules = magic_rewrite(compiled_rules, goal_predicate, adornment, arities)
+
+        # Stored relations are shared read-only: every rewritten head is a new name
+        relations = dict(self.facts.relations)
+        if 'b' in adornment:
+            seed = Relation(len(constants))
+            seed.add(tuple(v for _, v in constants))
+            relations[f"magic@{goal_predicate}@{adornment}"] = seed
+
+        # Stream answers out of each round's new tuples
+        answer_predicate = f"{goal_predicate}@{adornment}"
+        for new_tuples in self.evaluate(magic_rules, relations, {}):
+            fresh = new_tuples.get(answer_predicate)
+            if fresh is None or fresh.arity != len(goal_args):
+                continue
+            for row in fresh:
+                if matches(row):
+                    yield symbols.decode(row)
+
+    # Evaluate rules bottom-up over relations (updated in place)
+    # Strata run in dependency order, each to its own fixpoint; yields every
+    # round's new tuples ({predicate: Relation}) so callers can stream results
+    # With workers > 1, one WorkerPool serves every big round of the call
+    def evaluate(self, compiled_rules, relations, rederived):
+        pool = WorkerPool(self.workers, relations, self.facts.relations) if self.workers > 1 else None
+        try:
+            for new_tuples in self.evaluate_rounds(compiled_rules, relations, rederived, pool):
+                if pool is not None:
+                    pool.sync(new_tuples)
+                yield new_tuples
+        finally:
+            if pool is not None:
+                pool.close()
+
+    def evaluate_rounds(self, compiled_rules, relations, rederived, pool):
+        symbols = self.facts.symbols
+        for stratum_preds, stratum_rules in stratify(compiled_rules):
+            # Linear recursion (e.g. ancestor) is closed in one pass (see closure)
+            closure = LinearClosure.detect(stratum_preds, stratum_rules)
+            if closure is not None:
+                base = self.facts.relations.get(closure.predicate)
+                yield closure.run(relations, base, rederived)
+                continue
+
+            # First pass: every rule against the full relations
+            plans = [make_plan(rule, relations, symbols) for rule in stratum_rules]
+            delta = self.apply_plans(plans, relations, rederived, pool=pool)
+            yield delta
+
+            # Semi-naive loop: one plan per recursive body literal, which reads
+            # only last round's new tuples (the delta) and is joined first
+            delta_plans = [
+                make_plan(rule, relations, symbols, i)
+                for rule in stratum_rules
+                for i, (pred, _) in enumerate(rule[2])
+                if pred in stratum_preds
+            ]
+            while delta and delta_plans:
+                delta = self.apply_plans(delta_plans, relations, rederived, delta, pool)
+                yield delta
+
+    # Run plans once and merge what they produce into relations
+    # Returns the tuples that were not already known: the next round's delta
+    # Big rounds go to `pool` (a WorkerPool), which deduplicates in the workers
+    def apply_plans(self, plans, relations, rederived, delta=None, pool=None):
+        new_tuples = {}
+
+        # Skip plans whose delta literal did not change last round
+        if delta is not None:
+            plans = [plan for plan in plans if plan.steps[0][1] in delta]
+
+        if pool is not None and pool.worth(plans, relations, delta):
+            return self.apply_plans_parallel(plans, rederived, delta, pool)
+
+        for plan, results in zip(plans, self.run_plans(plans, relations, delta)):
+            head_predicate = plan.head_predicate
+            if not results:
+                continue
+            arity = len(results[0])
+            known = relations.get(head_predicate)
+            fresh = new_tuples.get(head_predicate)
+            if fresh is None:
+                fresh = new_tuples[head_predicate] = Relation(arity)
+            if fresh.arity != arity or (known is not None and known.arity != arity):
+                continue  # Head arity clashes with other clauses: ignore the rule
+            base = self.facts.relations.get(head_predicate)
+            for result in results:
+                # Skip nonsense results where X == Y
+                if plan.filter_reflexive and arity >= 2 and result[0] == result[1]:
+                    continue
+                if known is None or result not in known:
+                    fresh.add(result)
+                elif base is not None and result in base:
+                    rederived.setdefault(head_predicate, set()).add(result)
+
+        # Merge new tuples so the next round sees them
+        new_tuples = {pred: tuples for pred, tuples in new_tuples.items() if len(tuples)}
+        for pred, tuples in new_tuples.items():
+            target = relations.get(pred)
+            if target is None:
+                target = relations[pred] = Relation(tuples.arity)
+            for row in tuples:
+                target.add(row)
+        return new_tuples
+
+    # One round on the worker pool; with metrics on, the round's wall time is
+    # split evenly between its rules (the workers overlap)
+    def apply_plans_parallel(self, plans, rederived, delta, pool):
+        start = time.perf_counter()
+        new_tuples, examined, produced = pool.run_round(plans, delta, rederived, metrics.enabled)
+        if metrics.enabled:
+            elapsed = (time.perf_counter() - start) / len(plans) if plans else 0.0
+            for plan, candidates, count in zip(plans, examined, produced):
+                label = rule_label(plan.rule)
+                metrics.observe("rule_seconds", elapsed, rule=label)
+                metrics.inc("rule_candidates", candidates, rule=label)
+                metrics.inc("rule_produced", count, rule=label)
+        return new_tuples
+
+    # Run each plan once and return their results in order
+    # With metrics on, per-rule timings and counts are recorded as well
+    def run_plans(self, plans, relations, delta=None):
+        if metrics.enabled:
+            return self.run_plans_measured(plans, relations, delta)
+        return [plan.run(relations, delta) for plan in plans]
+
+    # run_plans recording rule_seconds / rule_candidates / rule_produced per rule
+    def run_plans_measured(self, plans, relations, delta):
+        counts = [[0] for _ in plans]
+        results, seconds = [], []
+        for plan, count in zip(plans, counts):
+            start = time.perf_counter()
+            results.append(plan.run(relations, delta, stats=count))
+            seconds.append(time.perf_counter() - start)
+
+        for plan, result, count, elapsed in zip(plans, results, counts, seconds):
+            label = rule_label(plan.rule)
+            metrics.observe("rule_seconds", elapsed, rule=label)
+            metrics.inc("rule_candidates", count[0], rule=label)
+            metrics.inc("rule_produced", len(result), rule=label)
+        return results
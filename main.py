@@ -1,35 +1,72 @@
-from inference_graph import compiled_graph, InferenceState
+import argparse
+import logging
+import os
+from metrics import metrics
+from server import DEFAULT_HOST, DEFAULT_PORT, clean_facts
+
+# Default question (what we want the system to solve)
+QUESTION = "Define family relationships like uncle, aunt, cousin, grandparent."
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Derive facts from the KB with LLM-written rules.")
+    parser.add_argument("question", nargs="?", default=QUESTION)
+    parser.add_argument("--serve", action="store_true",
+                        help="keep the graph, KB and LLM client warm and answer JSON requests")
+    parser.add_argument("--connect", action="store_true",
+                        help="send the question to a running server instead of solving here")
+    parser.add_argument("--socket", help="Unix socket path for --serve / --connect")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    return parser.parse_args()
 
 def main():
-    # Define the input question (what we want the system to solve)
-    question = "Define family relationships like uncle, aunt, cousin, grandparent."
-    
-    # Create an initial state object with the question
-    state = InferenceState(question)
-    
-    # Run the state through the compiled graph (workflow pipeline)
-    final_state = compiled_graph.invoke(state)
+    args = parse_args()
+
+    # Log level from LOG_LEVEL (e.g. DEBUG dumps every parsed fact and rule)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper())
+
+    if args.serve:
+        from server import serve
+        serve(args.socket, args.host, args.port)
+        return
+
+    if args.connect:
+        # A warm server does the work; only its JSON reply is handled here
+        from server import ask
+        reply = ask({"question": args.question}, args.socket, args.host, args.port)
+        clean_facts_list = [(pred, tuple(fact_args)) for pred, fact_args in reply["facts"]]
+    else:
+        # langgraph / langchain are only imported on this path
+        from inference_graph import get_compiled_graph, InferenceState
+
+        # Create an initial state object with the question
+        state = InferenceState(args.question)
+
+        # Run the state through the compiled graph (workflow pipeline)
+        final_state = get_compiled_graph().invoke(state)
+
+        # Clean the facts: drop any that contain '?' (unknown placeholders),
+        # deduplicate and sort them alphabetically
+        clean_facts_list = clean_facts(final_state.get("final_solution"))
 
     print("\nFinal Derived Facts:")
-    
-    # Check if the graph produced a final solution
-    if final_state.get("final_solution"):
-        # Clean the facts: remove any that contain '?' (unknown placeholders)
-        clean_facts = [
-            (pred, args) for pred, args in final_state["final_solution"]
-            if '?' not in args
-        ]
-        # Deduplicate results and sort them alphabetically
-        clean_facts = sorted(set(clean_facts))
 
+    # Check if the graph produced a final solution
+    if clean_facts_list:
         # Print each fact in standard Prolog style
-        for pred, args in clean_facts:
-            print(f"{pred}({', '.join(args)})")
+        for pred, fact_args in clean_facts_list:
+            print(f"{pred}({', '.join(fact_args)})")
     else:
         # If no solution, print fallback message
         print("No solution was found.")
 
+    # Metrics (LOGIC_METRICS=1), as JSON or Prometheus text (LOGIC_METRICS_FORMAT=prometheus)
+    if metrics.enabled:
+        if os.getenv("LOGIC_METRICS_FORMAT", "json") == "prometheus":
+            print(metrics.to_prometheus())
+        else:
+            print(metrics.to_json())
+
 
 if __name__ == "__main__":
     main()
-
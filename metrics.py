@@ -0,0 +1,176 @@
+#metrics.py
+
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+# Counters and timings for the solver, the LLM calls and the graph nodes.
+#
+# Everything goes through the shared `metrics` object. It is off by default
+# (set LOGIC_METRICS=1 or call metrics.enable()); when off, every call returns
+# straight away, and hot loops check `metrics.enabled` before doing any work.
+#
+# Recorded names:
+#   node_seconds{node}                     wall time per StateGraph node
+#   refine_retries{pipeline}               LLM refinement round-trips
+#   refine_saved{pipeline}                 round-trips avoided by local repair
+#   speculative_candidates{outcome}        speculative generations: valid / invalid / cancelled
+#   llm_seconds{model}                     latency of LLM calls (cache misses)
+#   llm_prompt_tokens / llm_completion_tokens{model}
+#                                          estimated tokens (4 chars per token)
+#   solver_seconds{phase}                  parse / evaluate time in LogicSolver
+#   rule_seconds{rule}                     join time per rule
+#   rule_candidates{rule}                  rows examined by the rule's joins
+#   rule_produced{rule}                    tuples the rule produced (before dedup)
+#   solve_cache{result}                    solve_cache hits and misses
+
+# Prometheus metric names get this prefix
+PROMETHEUS_PREFIX = "logic_"
+
+
+# Times a block and records it with Metrics.observe
+class Timer:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Metrics:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.counters = {}  # (name, labels) → total
+        self.timings = {}   # (name, labels) → [count, total seconds, max seconds]
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.timings.clear()
+
+    # Add `value` to a counter
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    # Record one duration (seconds)
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            timing = self.timings.get(key)
+            if timing is None:
+                self.timings[key] = [1, seconds, seconds]
+            else:
+                timing[0] += 1
+                timing[1] += seconds
+                timing[2] = max(timing[2], seconds)
+
+    # `with metrics.timer("name", label=value):` times the block
+    def timer(self, name, **labels):
+        if not self.enabled:
+            return nullcontext()
+        return Timer(self, name, labels)
+
+    # Wrap a StateGraph node function so its wall time is recorded
+    def node(self, name, function):
+        @functools.wraps(function)
+        def timed_node(state):
+            if not self.enabled:
+                return function(state)
+            with Timer(self, "node_seconds", {"node": name}):
+                return function(state)
+        return timed_node
+
+    # Record one LLM call (token counts are estimates: the clients only return text)
+    def record_llm(self, model, prompt, response, seconds):
+        if not self.enabled:
+            return
+        from kb_context import estimate_tokens
+        self.observe("llm_seconds", seconds, model=model)
+        self.inc("llm_prompt_tokens", estimate_tokens(prompt), model=model)
+        self.inc("llm_completion_tokens", estimate_tokens(response or ""), model=model)
+
+    # Everything recorded so far as plain data
+    def snapshot(self):
+        with self.lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self.counters.items())
+            ]
+            timings = [
+                {"name": name, "labels": dict(labels), "count": count,
+                 "total_seconds": total, "max_seconds": longest}
+                for (name, labels), (count, total, longest) in sorted(self.timings.items())
+            ]
+        return {"counters": counters, "timings": timings}
+
+    def to_json(self, indent=2):
+        return json.dumps(self.snapshot(), indent=indent)
+
+    # Prometheus text exposition format: counters as counters, timings as
+    # summaries (_count and _sum) plus a _max gauge
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for counter in snapshot["counters"]:
+            name = PROMETHEUS_PREFIX + counter["name"] + "_total"
+            declare(name, "counter")
+            lines.append(f"{name}{format_labels(counter['labels'])} {counter['value']}")
+        for timing in snapshot["timings"]:
+            name = PROMETHEUS_PREFIX + timing["name"]
+            labels = format_labels(timing["labels"])
+            declare(name, "summary")
+            lines.append(f"{name}_count{labels} {timing['count']}")
+            lines.append(f"{name}_sum{labels} {timing['total_seconds']:.6f}")
+        for timing in snapshot["timings"]:
+            name = PROMETHEUS_PREFIX + timing["name"] + "_max"
+            declare(name, "gauge")
+            lines.append(f"{name}{format_labels(timing['labels'])} {timing['max_seconds']:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+# {"rule": 'a(X) :- b(X)'} → {rule="a(X) :- b(X)"}
+def format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in sorted(labels.items()):
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+# Shared instance used by every module
+metrics = Metrics(enabled=os.getenv("LOGIC_METRICS", "") not in ("", "0"))
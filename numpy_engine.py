@@ -0,0 +1,304 @@
+#numpy_engine.py
+
+from array import array
+
+import numpy as np
+
+from fact_store import Relation
+from logic_utils import is_variable, stratify
+
+# Vectorised evaluation for LogicSolver(engine="numpy").
+#
+# Same semantics as the tuple-at-a-time JoinPlan path (stratified, semi-naive),
+# but every relation is a list of int64 NumPy columns over the interned symbol
+# ids, and a rule body is evaluated a literal at a time on whole columns:
+#   - constants and repeated variables (p(X, X)) are boolean-mask selections
+#   - shared variables are a sort-merge join (np.argsort + np.searchsorted)
+#   - the uncle(X, X) filter is `columns[0] != columns[1]`
+#   - dedup and "already known?" checks use one packed key per row
+# Only head relations are rebuilt as fact_store.Relation objects at the end,
+# so derived_facts(), query() and incremental updates work unchanged.
+
+# Packed row keys must fit in an int64
+MAX_PACKED = 1 << 62
+
+
+# One relation as NumPy columns, plus its row keys sorted (for membership)
+class ArrayRelation:
+    __slots__ = ("arity", "columns", "size", "keys")
+
+    def __init__(self, arity, columns, size, base):
+        self.arity = arity
+        self.columns = columns
+        self.size = size
+        self.keys = np.sort(row_keys(columns, size, base))
+
+    @classmethod
+    def from_relation(cls, relation, base):
+        if relation.dead:
+            relation = relation.copy()  # Live rows only
+        size = len(relation)
+        columns = [np.frombuffer(column, dtype=np.int32).astype(np.int64) for column in relation.columns]
+        return cls(relation.arity, columns, size, base)
+
+    # Rows (given as columns) that are not in this relation yet
+    def missing(self, columns, size, base):
+        keys = row_keys(columns, size, base)
+        return ~contains(self.keys, keys)
+
+    # Append rows known to be new
+    def extend(self, columns, size, base):
+        self.columns = [np.concatenate([old, new]) for old, new in zip(self.columns, columns)]
+        self.size += size
+        self.keys = np.sort(np.concatenate([self.keys, row_keys(columns, size, base)]))
+
+    # Back to a (column-wise, int32) fact_store.Relation
+    def to_relation(self):
+        if not self.arity:
+            return Relation(0, [()] if self.size else [])
+        columns = []
+        for column in self.columns:
+            buffer = array('i')
+            buffer.frombytes(column.astype(np.int32).tobytes())
+            columns.append(buffer)
+        return Relation.from_buffers(self.arity, columns, self.size)
+
+
+# One key per row: the ids packed into an int64 when they fit (base = number
+# of symbols), otherwise the row's bytes as a fixed-size void value
+# Either kind sorts and compares consistently, which is all that is needed.
+def row_keys(columns, size, base):
+    if not columns:
+        return np.zeros(min(size, 1), dtype=np.int64)
+    if base ** len(columns) < MAX_PACKED:
+        keys = columns[0].copy()
+        for column in columns[1:]:
+            keys *= base
+            keys += column
+        return keys
+    rows = np.ascontiguousarray(np.stack(columns, axis=1))
+    return rows.view(np.dtype((np.void, rows.itemsize * len(columns)))).ravel()
+
+
+# Membership of `keys` in the sorted array `known`
+def contains(known, keys):
+    if not len(known) or not len(keys):
+        return np.zeros(len(keys), dtype=bool)
+    positions = np.searchsorted(known, keys)
+    positions[positions == len(known)] = 0
+    return known[positions] == keys
+
+
+# Row indexes (left, right) of every pair with equal keys
+def merge_join(left_keys, right_keys):
+    order = np.argsort(right_keys, kind="stable")
+    ordered = right_keys[order]
+    low = np.searchsorted(ordered, left_keys, side="left")
+    high = np.searchsorted(ordered, left_keys, side="right")
+    counts = high - low
+    total = int(counts.sum())
+    left = np.repeat(np.arange(len(left_keys)), counts)
+    # Position within each left row's run of matches
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    right = order[np.repeat(low, counts) + np.arange(total) - starts]
+    return left, right
+
+
+# Evaluate one rule body; returns (bindings, size) where bindings maps each
+# variable to its column. `delta_position` reads that literal from `delta`.
+class RuleJoin:
+    def __init__(self, rule, symbols, delta_position=None):
+        _, head_args, body_preds, _ = rule
+        self.body = body_preds
+        self.delta_position = delta_position
+        # Constants are interned up front, so the symbol count cannot change mid-join
+        self.constants = {arg: symbols.intern(arg)
+                          for _, args in body_preds for arg in args if not is_variable(arg)}
+        self.head = [(arg, symbols.intern('?' if is_variable(arg) else arg))
+                     for arg in head_args]
+
+    # Literal order: the delta literal first, then greedily the smallest
+    # relation, preferring literals that share a bound variable (no cross products)
+    def order(self, sizes):
+        remaining = list(range(len(self.body)))
+        order = []
+        bound = set()
+        if self.delta_position is not None:
+            order.append(self.delta_position)
+            remaining.remove(self.delta_position)
+            bound.update(self.body[self.delta_position][1])
+        while remaining:
+            best = min(remaining, key=lambda i: (
+                not (bound & set(self.body[i][1])) and bool(bound),
+                sizes[i],
+            ))
+            order.append(best)
+            remaining.remove(best)
+            bound.update(self.body[best][1])
+        return order
+
+    def run(self, relations, delta, base):
+        sources = []
+        for i, (pred, args) in enumerate(self.body):
+            source = delta.get(pred) if i == self.delta_position else relations.get(pred)
+            if source is None or source.arity != len(args) or not source.size:
+                return {}, 0  # Nothing (or nothing of this arity) to match
+            sources.append(source)
+
+        bindings = {}  # variable → column
+        size = 1       # Rows of bindings (one empty binding to start)
+        for i in self.order([source.size for source in sources]):
+            _, args = self.body[i]
+            source = sources[i]
+
+            # Step 1: selections on this literal (constants, p(X, X) repeats)
+            mask = None
+            first_seen = {}
+            for pos, arg in enumerate(args):
+                if arg == '_':
+                    continue
+                if not is_variable(arg):
+                    test = source.columns[pos] == self.constants[arg]
+                elif arg in first_seen:
+                    test = source.columns[pos] == source.columns[first_seen[arg]]
+                else:
+                    first_seen[arg] = pos
+                    continue
+                mask = test if mask is None else mask & test
+            if mask is None:
+                rows = None
+                count = source.size
+            else:
+                rows = np.flatnonzero(mask)
+                count = len(rows)
+
+            def column(pos):
+                return source.columns[pos] if rows is None else source.columns[pos][rows]
+
+            # Step 2: join with the bindings so far on the shared variables
+            shared = [var for var in first_seen if var in bindings]
+            new = [var for var in first_seen if var not in bindings]
+            if not source.arity:
+                continue  # Non-empty zero-arity fact: true, binds nothing
+            if shared:
+                left_keys = row_keys([bindings[var] for var in shared], size, base)
+                right_keys = row_keys([column(first_seen[var]) for var in shared], count, base)
+                left, right = merge_join(left_keys, right_keys)
+            else:
+                # No shared variables: every binding with every row
+                left = np.repeat(np.arange(size), count)
+                right = np.tile(np.arange(count), size)
+            bindings = {var: values[left] for var, values in bindings.items()}
+            for var in new:
+                bindings[var] = column(first_seen[var])[right]
+            size = len(left)
+            if not size:
+                return {}, 0
+        return bindings, size
+
+    # Head columns for the bindings (unbound head variables become '?')
+    def head_columns(self, bindings, size):
+        return [bindings[arg] if arg in bindings else np.full(size, symbol, dtype=np.int64)
+                for arg, symbol in self.head]
+
+
+# Run rule joins once; returns {head predicate: ArrayRelation of new rows}
+# and records head rows that are also stored facts in `rederived`
+def apply_joins(joins, relations, base_relations, rederived, base, delta=None):
+    produced = {}  # head → list of column lists
+    for rule, join in joins:
+        if delta is not None and rule[2][join.delta_position][0] not in delta:
+            continue  # The delta literal did not change last round
+        bindings, size = join.run(relations, delta or {}, base)
+        if not size:
+            continue
+        columns = join.head_columns(bindings, size)
+        known = relations.get(rule[0])
+        if known is not None and known.arity != len(columns):
+            continue  # Head arity clashes with other clauses: ignore the rule
+        # Skip nonsense results where X == Y
+        if rule[3] and len(columns) >= 2:
+            keep = columns[0] != columns[1]
+            columns = [column[keep] for column in columns]
+        pending = produced.setdefault(rule[0], [])
+        if pending and len(pending[0]) != len(columns):
+            continue
+        pending.append(columns)
+
+    new_relations = {}
+    for pred, parts in produced.items():
+        arity = len(parts[0])
+        columns = [np.concatenate([part[p] for part in parts]) for p in range(arity)]
+        size = len(columns[0]) if arity else sum(1 for part in parts)
+        if not size:
+            continue
+        # Dedup within this round
+        keys = row_keys(columns, size, base)
+        _, first = np.unique(keys, return_index=True)
+        columns = [column[first] for column in columns]
+        size = len(first)
+
+        # Facts that rules derive again are remembered as rederived
+        stored = base_relations.get(pred)
+        if stored is not None and stored.arity == arity:
+            again = ~stored.missing(columns, size, base)
+            if again.any():
+                rows = zip(*[column[again].tolist() for column in columns]) if arity else [()]
+                rederived.setdefault(pred, set()).update(rows)
+
+        known = relations.get(pred)
+        if known is not None:
+            fresh = known.missing(columns, size, base)
+            columns = [column[fresh] for column in columns]
+            size = int(fresh.sum())
+        if size:
+            new_relations[pred] = ArrayRelation(arity, columns, size, base)
+
+    # Merge new rows so the next round sees them
+    for pred, fresh in new_relations.items():
+        known = relations.get(pred)
+        if known is None:
+            relations[pred] = ArrayRelation(fresh.arity, list(fresh.columns), fresh.size, base)
+        else:
+            known.extend(fresh.columns, fresh.size, base)
+    return new_relations
+
+
+# Evaluate compiled rules over a FactStore; returns (relations, rederived) in
+# the form LogicSolver.materialize keeps them
+def evaluate(compiled_rules, facts):
+    symbols = facts.symbols
+
+    # Step 1: intern every rule constant (and '?'), then fix the key base
+    joins_for = {}
+    for rule in compiled_rules:
+        joins_for[id(rule)] = RuleJoin(rule, symbols)
+    base = max(len(symbols), 1)
+
+    # Step 2: load every stored relation as columns (zero-copy view, then int64)
+    heads = {rule[0] for rule in compiled_rules}
+    base_relations = {pred: ArrayRelation.from_relation(relation, base)
+                      for pred, relation in facts.relations.items()}
+    relations = {pred: (ArrayRelation(rel.arity, list(rel.columns), rel.size, base) if pred in heads else rel)
+                 for pred, rel in base_relations.items()}
+    rederived = {}
+
+    # Step 3: strata in dependency order, each semi-naive to its fixpoint
+    for stratum_preds, stratum_rules in stratify(compiled_rules):
+        joins = [(rule, joins_for[id(rule)]) for rule in stratum_rules]
+        delta = apply_joins(joins, relations, base_relations, rederived, base)
+        delta_joins = [
+            (rule, RuleJoin(rule, symbols, i))
+            for rule in stratum_rules
+            for i, (pred, _) in enumerate(rule[2])
+            if pred in stratum_preds
+        ]
+        while delta and delta_joins:
+            delta = apply_joins(delta_joins, relations, base_relations, rederived, base, delta)
+
+    # Step 4: head relations back into fact_store form; the rest stay as stored
+    result = dict(facts.relations)
+    for pred in heads:
+        if pred in relations:
+            result[pred] = relations[pred].to_relation()
+    return result, rederived
@@ -0,0 +1,282 @@
+#parallel_eval.py
+
+import multiprocessing
+import os
+import traceback
+from array import array
+
+from fact_store import Relation
+
+# Rounds whose driving relations hold fewer rows than this run in-process:
+# shipping the round to the workers would cost more than the join itself
+PARALLEL_MIN_ROWS = 20000
+
+# (relations, stored facts) of the evaluation being started
+# Set just before the workers fork, so they inherit the relations (and their
+# indexes) through copy-on-write memory instead of receiving pickled copies.
+_inherit = None
+
+
+# Parallel evaluation needs the "fork" start method (Linux, most Unixes)
+def fork_available():
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+# CPUs this process may use
+def available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+# Worker processes to use for `workers` (1 = evaluate in-process): more
+# workers than CPUs would only take turns on the same cores
+def parallel_workers(workers):
+    if not workers or workers < 2 or not fork_available() or available_cpus() < workers:
+        return 1
+    return workers
+
+
+# Rows a round will start from (used to decide whether to go parallel)
+def driving_rows(plans, relations, delta):
+    total = 0
+    for plan in plans:
+        first = plan.steps[0]
+        source = delta.get(first[1]) if delta is not None and first[0] == plan.delta_position \
+            else relations.get(first[1])
+        if source is not None:
+            total += len(source)
+    return total
+
+
+# Relation → (arity, row count, [column bytes]): cheap to pickle
+def pack_relation(relation):
+    if relation.dead:
+        relation = relation.copy()
+    return relation.arity, len(relation), [memoryview(column).cast('B').tobytes() for column in relation.columns]
+
+
+def unpack_columns(packed):
+    arity, count, blobs = packed
+    columns = []
+    for blob in blobs:
+        column = array('i')
+        column.frombytes(blob)
+        columns.append(column)
+    return arity, count, columns
+
+
+def unpack_relation(packed):
+    arity, count, columns = unpack_columns(packed)
+    relation = Relation(arity)
+    relation.extend(columns, count)
+    return relation
+
+
+# Rows (tuples of ids) → packed columns, like pack_relation
+def pack_rows(arity, rows):
+    columns = [array('i') for _ in range(arity)]
+    for position, column in enumerate(columns):
+        column.extend([row[position] for row in rows])
+    return arity, len(rows), [memoryview(column).cast('B').tobytes() for column in columns]
+
+
+def unpack_rows(packed):
+    arity, count, columns = unpack_columns(packed)
+    return list(zip(*columns)) if arity else [()] * count
+
+
+# Worker owning head rows whose first id falls in its hash partition
+def owner(row, parts):
+    return row[0] % parts if row else 0
+
+
+# Worker process: keeps its own copy of the relations (inherited at fork and
+# brought up to date each round) and answers two requests per round:
+#   "join":  run every plan over partition `index` of its first literal and
+#            send the head rows back grouped by the worker that owns them
+#   "dedup": drop the owned rows that are already known, and report which of
+#            them are stored facts derived again
+def worker_main(index, parts, connection):
+    relations, base = _inherit
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        try:
+            if message[0] == "join":
+                _, pending, plans, packed_delta, counting = message
+                for pred, chunks in pending.items():
+                    target = relations.get(pred)
+                    for packed in chunks:
+                        arity, count, columns = unpack_columns(packed)
+                        if target is None:
+                            target = relations[pred] = Relation(arity)
+                        target.extend(columns, count)
+                delta = None if packed_delta is None else \
+                    {pred: unpack_relation(packed) for pred, packed in packed_delta.items()}
+
+                outgoing = [{} for _ in range(parts)]  # owner → {plan index: packed rows}
+                examined, produced = [], []
+                for i, plan in enumerate(plans):
+                    stats = [0] if counting else None
+                    rows = plan.run(relations, delta, (index, parts), stats)
+                    examined.append(stats[0] if counting else 0)
+                    produced.append(len(rows))
+                    if not rows:
+                        continue
+                    if plan.filter_reflexive and len(rows[0]) >= 2:
+                        rows = [row for row in rows if row[0] != row[1]]
+                    grouped = [[] for _ in range(parts)]
+                    for row in rows:
+                        grouped[owner(row, parts)].append(row)
+                    for target, group in zip(outgoing, grouped):
+                        if group:
+                            target[i] = pack_rows(len(group[0]), group)
+                connection.send(("joined", outgoing, examined, produced))
+
+            elif message[0] == "dedup":
+                _, heads, incoming = message
+                fresh, again = {}, {}
+                for batch in incoming:
+                    for i, packed in batch.items():
+                        head_predicate, arity = heads[i]
+                        if packed[0] != arity:
+                            continue  # Head arity clashes with other clauses: ignore the rule
+                        known = relations.get(head_predicate)
+                        stored = base.get(head_predicate)
+                        new = fresh.get(head_predicate)
+                        if new is None:
+                            new = fresh[head_predicate] = Relation(arity)
+                        for row in unpack_rows(packed):
+                            if known is None or row not in known:
+                                new.add(row)
+                            elif stored is not None and row in stored:
+                                again.setdefault(head_predicate, []).append(row)
+                connection.send((
+                    "deduped",
+                    {pred: pack_relation(rows) for pred, rows in fresh.items() if len(rows)},
+                    {pred: pack_rows(len(rows[0]), rows) for pred, rows in again.items()},
+                ))
+        except Exception:
+            connection.send(("error", traceback.format_exc()))
+
+
+# Worker processes for one evaluation (LogicSolver.evaluate), forked the
+# first time a round is big enough and kept until close(). Each round:
+#   1. every worker joins its partition of the plans' first literals
+#   2. head rows are shuffled to the worker owning their hash partition, which
+#      deduplicates them against its copy of the relations
+#   3. the parent appends the owners' fresh rows as they are (the partitions
+#      are disjoint, so nothing is checked again)
+# Rows added to the relations in between (rounds run here, closures) are
+# passed to sync() and sent along with the next round.
+class WorkerPool:
+    def __init__(self, workers, relations, base):
+        self.workers = workers
+        self.relations = relations
+        self.base = base
+        self.connections = None
+        self.processes = []
+        self.pending = {}  # predicate → packed rows the workers have not seen yet
+
+    # Whether a round is worth sending to the workers
+    def worth(self, plans, relations, delta):
+        joined = [plan for plan in plans if plan.steps]
+        return bool(joined) and driving_rows(joined, relations, delta) >= PARALLEL_MIN_ROWS
+
+    def start(self):
+        global _inherit
+        context = multiprocessing.get_context("fork")
+        _inherit = (self.relations, self.base)
+        self.connections = []
+        try:
+            for index in range(self.workers):
+                parent_end, child_end = context.Pipe()
+                process = context.Process(target=worker_main, args=(index, self.workers, child_end), daemon=True)
+                process.start()
+                child_end.close()
+                self.connections.append(parent_end)
+                self.processes.append(process)
+        finally:
+            _inherit = None
+        self.pending = {}  # The workers start from the relations as they are now
+
+    # Rows just added to the relations (one round's new tuples)
+    def sync(self, new_tuples):
+        if self.connections is None:
+            return
+        for pred, relation in new_tuples.items():
+            if len(relation):
+                self.pending.setdefault(pred, []).append(pack_relation(relation))
+
+    def receive(self, connection):
+        reply = connection.recv()
+        if reply[0] == "error":
+            raise RuntimeError(f"Parallel evaluation worker failed:\n{reply[1]}")
+        return reply
+
+    # Run one round; returns ({predicate: Relation of new tuples}, rows
+    # examined per plan, rows produced per plan). New tuples are appended to
+    # self.relations and stored facts derived again go into `rederived`.
+    def run_round(self, plans, delta, rederived, counting=False):
+        if self.connections is None:
+            self.start()
+        relations = self.relations
+
+        # Head arity per plan: the stored relation's, else the first clause's
+        arities = {}
+        for plan in plans:
+            known = relations.get(plan.head_predicate)
+            arities.setdefault(plan.head_predicate, known.arity if known is not None else len(plan.head))
+        heads = [(plan.head_predicate, arities[plan.head_predicate]) for plan in plans]
+
+        # Step 1: joins
+        packed_delta = None
+        if delta is not None:
+            used = {plan.steps[0][1] for plan in plans if plan.steps}
+            packed_delta = {pred: pack_relation(rows) for pred, rows in delta.items() if pred in used}
+        pending, self.pending = self.pending, {}
+        for connection in self.connections:
+            connection.send(("join", pending, plans, packed_delta, counting))
+        joined = [self.receive(connection) for connection in self.connections]
+        examined = [sum(reply[2][i] for reply in joined) for i in range(len(plans))]
+        produced = [sum(reply[3][i] for reply in joined) for i in range(len(plans))]
+
+        # Step 2: shuffle to the owners and deduplicate there
+        for part, connection in enumerate(self.connections):
+            connection.send(("dedup", heads, [reply[1][part] for reply in joined]))
+        deduped = [self.receive(connection) for connection in self.connections]
+
+        # Step 3: concatenate
+        new_tuples = {}
+        for _, fresh, again in deduped:
+            for pred, packed in fresh.items():
+                arity, count, columns = unpack_columns(packed)
+                new = new_tuples.get(pred)
+                if new is None:
+                    new = new_tuples[pred] = Relation(arity)
+                new.extend(columns, count)
+                target = relations.get(pred)
+                if target is None:
+                    target = relations[pred] = Relation(arity)
+                target.extend(columns, count)
+            for pred, packed in again.items():
+                rederived.setdefault(pred, set()).update(unpack_rows(packed))
+        return new_tuples, examined, produced
+
+    def close(self):
+        if self.connections is None:
+            return
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+            connection.close()
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.connections = None
+        self.processes = []
@@ -0,0 +1,228 @@
+#retriever.py
+
+import math
+import re
+
+from kb_context import build_kb_context
+from kb_loader import load_kb
+from logic_parser import iter_clauses
+from logic_utils import is_variable
+
+# Local replacement for the embedding retriever LogicLMChain used to build:
+# facts and rules of the compiled KB are indexed by predicate name and
+# constant, and a description gets the clauses mentioning its words, ranked
+# with BM25. Building the index is one pass over the KB (no embeddings, no
+# network), and when kb.txt changes only the facts that changed are
+# re-indexed.
+
+# BM25 parameters (the usual defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Documents returned per query
+DEFAULT_K = 10
+
+# Removed documents are compacted away once they make up this share of the index
+COMPACT_RATIO = 0.5
+
+WORD = re.compile(r"[a-z0-9_]+")
+
+
+# What invoke() returns: the same shape as a LangChain Document
+class Document:
+    __slots__ = ("page_content", "metadata")
+
+    def __init__(self, page_content, metadata=None):
+        self.page_content = page_content
+        self.metadata = metadata or {}
+
+    def __repr__(self):
+        return f"Document({self.page_content!r})"
+
+
+# Index terms of a clause: its predicate names and constants (lowercased)
+def clause_terms(literals):
+    terms = []
+    for predicate, args in literals:
+        terms.append(predicate.lower())
+        for arg in args:
+            if arg != "_" and not is_variable(arg):
+                terms.append(arg.strip("'\"").lower())
+    return terms
+
+
+# BM25 inverted index over KB clauses
+# Documents are fact keys (predicate, (arg, ...)) or rule strings; their ids
+# are positions in `docs`. A removed document keeps its id (its slot becomes
+# None) until compact() renumbers everything.
+class KBIndex:
+    def __init__(self):
+        self.docs = []        # doc id → fact key / rule text, None once removed
+        self.lengths = []     # doc id → number of terms
+        self.postings = {}    # term → {doc id: term frequency}
+        self.ids = {}         # fact key / rule text → doc id
+        self.total_length = 0
+        self.removed = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, key, terms):
+        if key in self.ids:
+            return
+        doc_id = len(self.docs)
+        self.docs.append(key)
+        self.lengths.append(len(terms))
+        self.ids[key] = doc_id
+        self.total_length += len(terms)
+        postings = self.postings
+        for term in terms:
+            entry = postings.get(term)
+            if entry is None:
+                postings[term] = {doc_id: 1}
+            else:
+                entry[doc_id] = entry.get(doc_id, 0) + 1
+
+    def remove(self, key, terms):
+        doc_id = self.ids.pop(key, None)
+        if doc_id is None:
+            return
+        for term in set(terms):
+            entry = self.postings.get(term)
+            if entry is not None:
+                entry.pop(doc_id, None)
+                if not entry:
+                    del self.postings[term]
+        self.total_length -= self.lengths[doc_id]
+        self.docs[doc_id] = None
+        self.removed += 1
+
+    # Renumber documents without the holes left by remove()
+    def compact(self, terms_of):
+        live = [key for key in self.docs if key is not None]
+        self.__init__()
+        for key in live:
+            self.add(key, terms_of(key))
+
+    # Query words as index terms ("uncles" → "uncle" when only that is indexed)
+    def terms_for(self, text):
+        terms = []
+        for word in WORD.findall(text.lower()):
+            if word not in self.postings and word.endswith("s") and word[:-1] in self.postings:
+                word = word[:-1]
+            if word in self.postings and word not in terms:
+                terms.append(word)
+        return terms
+
+    # Top k (doc id, score) for a text, best first
+    def search(self, text, k):
+        count = len(self.ids)
+        if not count:
+            return []
+        average = self.total_length / count
+        lengths = self.lengths
+        scores = {}
+        for term in self.terms_for(text):
+            entry = self.postings[term]
+            idf = math.log(1 + (count - len(entry) + 0.5) / (len(entry) + 0.5))
+            for doc_id, tf in entry.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_id] / average)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:k]
+
+
+# Retriever over a KB file with the interface LogicLMChain uses:
+# invoke(description) → list of Documents (facts and rules, one per line)
+# The KB goes through kb_loader.load_kb, so a changed kb.txt is noticed with a
+# stat() and re-indexed on the next query.
+class KBRetriever:
+    def __init__(self, kb_path, k=DEFAULT_K):
+        self.kb_path = kb_path
+        self.k = k
+        self.kb = None
+        self.index = KBIndex()
+        self.refresh()
+
+    # Bring the index in line with the KB on disk
+    def refresh(self):
+        kb = load_kb(self.kb_path)
+        if kb is self.kb:
+            return
+        if self.kb is None:
+            self.build(kb)
+        elif kb.source_hash != self.kb.source_hash:
+            self.update(kb)
+        self.kb = kb
+
+    # Step 1: full build, one pass over every relation and rule
+    def build(self, kb):
+        index = self.index
+        names = kb.facts.symbols.names
+        for predicate, relation in kb.facts.relations.items():
+            term = predicate.lower()
+            for row in relation:
+                args = tuple(names[v] for v in row)
+                index.add((predicate, args), [term] + [arg.strip("'\"").lower() for arg in args])
+        for rule in kb.rules:
+            index.add(rule, self.terms_of(rule))
+
+    # Step 2: the KB changed, re-index only the facts and rules that differ
+    def update(self, kb):
+        new_keys = set(self.clause_keys(kb))
+        old_keys = set(key for key in self.index.docs if key is not None)
+        for key in old_keys - new_keys:
+            self.index.remove(key, self.terms_of(key))
+        for key in new_keys - old_keys:
+            self.index.add(key, self.terms_of(key))
+        if self.index.removed > COMPACT_RATIO * len(self.index.docs):
+            self.index.compact(self.terms_of)
+
+    # Every fact key and rule of a compiled KB
+    def clause_keys(self, kb):
+        names = kb.facts.symbols.names
+        for predicate, relation in kb.facts.relations.items():
+            for row in relation:
+                yield predicate, tuple(names[v] for v in row)
+        yield from kb.rules
+
+    # Index terms of a fact key or rule text
+    def terms_of(self, key):
+        if isinstance(key, tuple):
+            return clause_terms([key])
+        literals = []
+        for clause in iter_clauses(key + ".", on_error=lambda e: None):
+            if clause[0] == "rule":
+                literals.append(clause[2])
+                literals.extend(clause[3])
+        return clause_terms(literals)
+
+    # Clause text of a fact key or rule text
+    def render(self, key):
+        if isinstance(key, tuple):
+            predicate, args = key
+            return f"{predicate}({', '.join(args)})."
+        return key.rstrip(".") + "."
+
+    # Facts and rules mentioning the predicates and constants in `description`
+    # If nothing matches, the KB summary from kb_context is returned instead,
+    # so the LLM still learns which predicates exist
+    def invoke(self, description, k=None):
+        self.refresh()
+        index = self.index
+        hits = index.search(description, k or self.k)
+        if not hits:
+            return [Document(build_kb_context(self.kb), {"source": self.kb_path, "summary": True})]
+        return [
+            Document(self.render(index.docs[doc_id]), {"source": self.kb_path, "score": score})
+            for doc_id, score in hits
+        ]
+
+    # Older LangChain retriever name
+    def get_relevant_documents(self, description):
+        return self.invoke(description)
+
+
+# Build a retriever over the KB at kb_path (what LogicLMChain calls)
+def create_retriever_from_kb(kb_path, k=DEFAULT_K):
+    return KBRetriever(kb_path, k)
@@ -0,0 +1,216 @@
+#server.py
+
+import http.client
+import json
+import logging
+import os
+import socket
+import socketserver
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Long-running query server: the compiled graph, the loaded KB (and its
+# indexes), the LLM client with its HTTP connection pool, the LLM cache and
+# the solve cache are set up once and shared by every request, so a question
+# only pays for the LLM call and the solve itself.
+#
+# JSON over HTTP, on a TCP port or a Unix socket:
+#   POST /solve   {"question": "..."}  run the inference graph
+#                 {"logic": "..."}     solve a program on the KB (no LLM)
+#   GET  /health  KB size and uptime
+#   GET  /metrics Prometheus text (when metrics are enabled)
+#
+#   python main.py --serve --socket /tmp/logic.sock
+#   python main.py --connect --socket /tmp/logic.sock "question"
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Largest request body accepted (bytes)
+MAX_BODY = 16 << 20
+
+
+# Derived facts in a stable, JSON-friendly order, without '?' placeholders
+def clean_facts(solution):
+    facts = {(pred, tuple(args)) for pred, args in solution or () if '?' not in args}
+    return sorted(facts)
+
+
+# Load everything a request needs, so the first one is not slower than the rest
+def warm_up():
+    from inference_graph import KB_PATH, get_compiled_graph, get_llm
+    from kb_loader import load_kb
+    started = time.perf_counter()
+    kb = load_kb(KB_PATH)
+    get_compiled_graph()
+    get_llm()
+    logger.info("Warmed up in %.3fs (%d KB facts)", time.perf_counter() - started, len(kb.facts))
+
+
+# Run one /solve request
+def solve_request(payload):
+    from inference_graph import KB_PATH, InferenceState, get_compiled_graph
+    from kb_loader import load_kb
+    from logic_utils import check_logic_validity
+    from solve_cache import get_default_solve_cache
+
+    started = time.perf_counter()
+    if payload.get("logic") is not None:
+        # A ready-made program: validate and solve on the warm KB
+        logic = payload["logic"]
+        errors = check_logic_validity(logic)
+        solution = None if errors else get_default_solve_cache().solve(logic, kb=load_kb(KB_PATH))
+        retry_count = 0
+    elif payload.get("question"):
+        final_state = get_compiled_graph().invoke(InferenceState(payload["question"]))
+        logic = final_state.get("logic_rule")
+        errors = final_state.get("errors")
+        solution = final_state.get("final_solution")
+        retry_count = final_state.get("retry_count", 0)
+    else:
+        raise ValueError("Request needs a 'question' or a 'logic' field.")
+
+    return {
+        "facts": [[pred, list(args)] for pred, args in clean_facts(solution)],
+        "logic": logic,
+        "errors": errors or [],
+        "retry_count": retry_count,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so clients can reuse connections
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_text(self, status, text):
+        data = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            from inference_graph import KB_PATH
+            from kb_loader import load_kb
+            self.send_json(200, {
+                "status": "ok",
+                "kb_facts": len(load_kb(KB_PATH).facts),
+                "uptime_seconds": time.time() - self.server.started,
+            })
+        elif self.path == "/metrics":
+            from metrics import metrics
+            self.send_text(200, metrics.to_prometheus())
+        else:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/solve":
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            self.send_json(413, {"error": "Request body too large."})
+            self.close_connection = True
+            return
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(payload, dict):
+                raise ValueError("Request body must be a JSON object.")
+        except ValueError as e:
+            self.send_json(400, {"error": f"Bad request: {e}"})
+            return
+        try:
+            self.send_json(200, solve_request(payload))
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+        except Exception as e:
+            logger.exception("Request failed")
+            self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+    # Unix socket clients have no (host, port) address
+    def address_string(self):
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "unix"
+
+    def log_message(self, format, *args):
+        logger.debug("%s %s", self.address_string(), format % args)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        # A socket file left behind by an earlier run would make bind() fail
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        super().server_bind()
+
+
+# Build (but do not start) a server on a Unix socket or a TCP port
+def make_server(socket_path=None, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    if socket_path:
+        server = UnixHTTPServer(socket_path, RequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.started = time.time()
+    return server
+
+
+# Warm up, then serve until interrupted
+def serve(socket_path=None, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    warm_up()
+    server = make_server(socket_path, host, port)
+    logger.warning("Serving on %s", socket_path or f"http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+# HTTP connection over a Unix socket
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+# Send one request to a running server and return its JSON reply
+# (raises RuntimeError with the server's message on an error status)
+def ask(payload, socket_path=None, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=None):
+    if socket_path:
+        connection = UnixHTTPConnection(socket_path, timeout)
+    else:
+        connection = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        connection.request("POST", "/solve", json.dumps(payload),
+                           {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        body = json.loads(response.read() or b"{}")
+    finally:
+        connection.close()
+    if response.status != 200:
+        raise RuntimeError(body.get("error", f"HTTP {response.status}"))
+    return body
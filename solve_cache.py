@@ -0,0 +1,175 @@
+#solve_cache.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from logic_parser import iter_clauses
+from logic_utils import LogicSolver, is_variable
+from metrics import metrics
+
+# Persist results here when set (off by default: results can be large)
+SOLVE_CACHE_PATH_ENV = "SOLVE_CACHE_PATH"
+
+
+# Rewrite a rule's variables as V0, V1, ... in order of first appearance, so
+# rules that differ only in variable names get the same text
+def rename_variables(head, body):
+    names = {}
+
+    def rename(arg):
+        if arg == "_" or not is_variable(arg):
+            return arg
+        if arg not in names:
+            names[arg] = f"V{len(names)}"
+        return names[arg]
+
+    def literal(pred, args):
+        return f"{pred}({', '.join(rename(arg) for arg in args)})"
+
+    head_text = literal(*head)
+    return f"{head_text} :- {', '.join(literal(pred, args) for pred, args in body)}"
+
+
+# Canonical form of a logic program: one clause per line, spacing normalised,
+# variables alpha-renamed, duplicates dropped, clauses sorted.
+# Clauses with syntax errors are left out, as parse_logic would skip them.
+def canonicalize_program(logic_text):
+    clauses = set()
+    for clause in iter_clauses(logic_text, on_error=lambda e: None):
+        if clause[0] == "rule":
+            _, _, head, body = clause
+            clauses.add(rename_variables(head, body) + ".")
+        else:
+            _, predicate, args = clause
+            clauses.add(f"{predicate}({', '.join(args)}).")
+    return "\n".join(sorted(clauses))
+
+
+# Cache key = hash of (KB source hash, canonical KB rules + program)
+def make_solve_key(logic_text, kb=None):
+    kb_hash = kb.source_hash if kb is not None else ""
+    kb_rules = "\n".join(rule + "." for rule in kb.rules) if kb is not None else ""
+    program = canonicalize_program(kb_rules + "\n" + logic_text)
+    payload = json.dumps({"kb": kb_hash, "program": program})
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Cache of derived facts per (KB, canonical program)
+#   - in-memory LRU of up to max_entries results
+#   - optional SQLite file (path, or the SOLVE_CACHE_PATH environment variable)
+#     keeping up to max_disk_entries results across runs
+# Results are returned as frozensets of (predicate, (arg, ...)), so a cached
+# result cannot be changed by whoever receives it.
+class SolveCache:
+    def __init__(self, path=None, max_entries=64, max_disk_entries=1000):
+        self.path = path or os.getenv(SOLVE_CACHE_PATH_ENV)
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.memory = OrderedDict()  # key → frozenset of derived facts, most recent last
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.db = None
+        if self.path:
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY, facts TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            self.db.commit()
+
+    # Cached result for a key, or None
+    def get(self, key):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return self.memory[key]
+            if self.db is not None:
+                row = self.db.execute("SELECT facts FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self.db.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+                    self.db.commit()
+                    result = frozenset((pred, tuple(args)) for pred, args in json.loads(row[0]))
+                    self.remember(key, result)
+                    self.hits += 1
+                    return result
+            self.misses += 1
+            return None
+
+    # Store a result (in memory, and on disk if persistence is on)
+    def put(self, key, derived_facts):
+        result = frozenset(derived_facts)
+        with self.lock:
+            self.remember(key, result)
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO results (key, facts, last_used) VALUES (?, ?, ?)",
+                    (key, json.dumps(sorted(result)), time.time()),
+                )
+                self.evict()
+                self.db.commit()
+        return result
+
+    # Add to memory, dropping the least recently used result if full
+    def remember(self, key, result):
+        self.memory[key] = result
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    # Drop the least recently used rows beyond the disk cap
+    def evict(self):
+        (count,) = self.db.execute("SELECT COUNT(*) FROM results").fetchone()
+        if count > self.max_disk_entries:
+            self.db.execute(
+                "DELETE FROM results WHERE key IN ("
+                " SELECT key FROM results ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_disk_entries,),
+            )
+
+    # Solve logic_text (on top of a compiled KB, if given), or return the
+    # cached result of an equivalent program on the same KB
+    def solve(self, logic_text, kb=None):
+        key = make_solve_key(logic_text, kb)
+        result = self.get(key)
+        if result is not None:
+            metrics.inc("solve_cache", result="hit")
+            return result
+        metrics.inc("solve_cache", result="miss")
+        return self.put(key, LogicSolver().solve_logic(logic_text, kb=kb))
+
+    # Empty both tiers
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            if self.db is not None:
+                self.db.execute("DELETE FROM results")
+                self.db.commit()
+
+    # Hit/miss counters
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+        }
+
+
+# One shared cache per process, created on first use
+_default_cache = None
+
+
+def get_default_solve_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = SolveCache()
+    return _default_cache
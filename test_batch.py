@@ -0,0 +1,99 @@
+#test_batch.py
+
+# solve_many / run_batch with delayed stand-ins for the LLM (no network)
+
+import asyncio
+import time
+
+from batch import LLMThrottle, TokenBucket, run_batch, solve_many
+from langchain_llm import StubChatModel
+from logic_lm import LogicLMModel
+
+
+# Pipeline whose "LLM call" for a question sleeps for a given time inside the
+# throttle; records how many calls were in flight at once
+class DelayedPipeline:
+    def __init__(self, delays):
+        self.delays = delays
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def asolve(self, question, throttle=None, executor=None):
+        async with throttle:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(self.delays[question])
+            self.in_flight -= 1
+        if question == "fail":
+            raise ValueError(question)
+        return question.upper()
+
+
+def test_concurrency_limit():
+    pipeline = DelayedPipeline({f"q{i}": 0.02 for i in range(10)})
+    results = run_batch(pipeline, [f"q{i}" for i in range(10)], concurrency=3, workers=0)
+    assert results == [f"Q{i}" for i in range(10)]
+    assert pipeline.max_in_flight == 3
+
+
+def test_results_stream_in_finishing_order():
+    delays = {"slow": 0.15, "medium": 0.08, "fast": 0.01}
+    pipeline = DelayedPipeline(delays)
+
+    async def collect():
+        return [(index, question, result)
+                async for index, question, result in solve_many(pipeline, list(delays), workers=0)]
+
+    assert asyncio.run(collect()) == [
+        (2, "fast", "FAST"),
+        (1, "medium", "MEDIUM"),
+        (0, "slow", "SLOW"),
+    ]
+
+
+def test_failures_are_returned_not_raised():
+    results = run_batch(DelayedPipeline({"ok": 0, "fail": 0}), ["ok", "fail"], workers=0)
+    assert results[0] == "OK"
+    assert isinstance(results[1], ValueError)
+
+
+def test_token_bucket_limits_rate():
+    async def take(count):
+        bucket = TokenBucket(rate=50, burst=1)
+        started = time.monotonic()
+        for _ in range(count):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    # One token right away, then one every 1/50 s
+    assert asyncio.run(take(6)) >= 5 / 50 * 0.9
+
+
+def test_throttle_rate_applies_to_requests():
+    async def run():
+        throttle = LLMThrottle(concurrency=10, rate=50, burst=2)
+        started = time.monotonic()
+
+        async def request():
+            async with throttle:
+                pass
+
+        await asyncio.gather(*(request() for _ in range(7)))
+        return time.monotonic() - started
+
+    # Two tokens of burst, the other five at 1/50 s each
+    assert asyncio.run(run()) >= 5 / 50 * 0.9
+
+
+def test_logic_lm_model_with_stub_llm():
+    stub = StubChatModel(
+        "parent(ann, bob).\nparent(bob, cal).\ngrandparent(X, Y) :- parent(X, Z), parent(Z, Y).",
+        latency=0.05,
+    )
+    model = LogicLMModel(llm=stub)
+    model.llm.cache = False
+    started = time.monotonic()
+    results = run_batch(model, ["a", "b", "c", "d"], concurrency=4, workers=0)
+    assert all(result == {("grandparent", ("ann", "cal"))} for result in results)
+    # The four delayed calls overlap instead of running one after another
+    assert time.monotonic() - started < 4 * 0.05
@@ -0,0 +1,79 @@
+#test_llm_cache.py
+
+# LLMCache tiers and LangChainLLM's use of it, with StubChatModel (no network)
+
+from langchain_llm import LangChainLLM, StubChatModel
+from llm_cache import LLMCache, make_key
+
+
+def test_memory_hit_skips_the_model(tmp_path):
+    stub = StubChatModel("answer.")
+    llm = LangChainLLM(llm=stub, cache=LLMCache(str(tmp_path / "cache.sqlite")))
+    assert llm.query("prompt") == "answer."
+    assert llm.query("prompt") == "answer."
+    assert stub.calls == 1
+    assert llm.cache.stats()["hits_memory"] == 1
+
+
+def test_disk_hit_across_cache_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    first = StubChatModel("answer.")
+    LangChainLLM(llm=first, cache=LLMCache(path)).query("prompt")
+
+    second = StubChatModel("other.")
+    cache = LLMCache(path)
+    assert LangChainLLM(llm=second, cache=cache).query("prompt") == "answer."
+    assert second.calls == 0
+    assert cache.stats()["hits_disk"] == 1
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = LLMCache(":memory:", max_memory_entries=2)
+    for name in ("a", "b", "c"):
+        cache.put(name, name.upper())
+    cache.get("b")  # b is now more recent than c
+    cache.put("d", "D")
+    assert list(cache.memory) == ["b", "d"]
+    assert cache.get("a") == "A"  # Still on disk
+    assert cache.stats()["hits_disk"] == 1
+
+
+def test_disk_tier_evicts_least_recently_used():
+    cache = LLMCache(":memory:", max_memory_entries=0, max_disk_entries=2)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    cache.get("a")
+    cache.put("c", "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.get("c") == "C"
+
+
+def test_expired_rows_are_misses():
+    cache = LLMCache(":memory:", max_memory_entries=0, max_age_seconds=-1)
+    cache.put("a", "A")
+    assert cache.get("a") is None
+
+
+def test_cache_false_bypasses_the_cache():
+    stub = StubChatModel("answer.")
+    llm = LangChainLLM(llm=stub, cache=False)
+    llm.query("prompt")
+    llm.query("prompt")
+    assert stub.calls == 2
+    assert llm.cached_reply("prompt") is None
+
+
+def test_key_depends_on_model_params_and_prompt():
+    key = make_key("m", {"temperature": 0}, "p")
+    assert key == make_key("m", {"temperature": 0}, "p")
+    assert key != make_key("n", {"temperature": 0}, "p")
+    assert key != make_key("m", {"temperature": 1}, "p")
+    assert key != make_key("m", {"temperature": 0}, "q")
+
+
+def test_injected_models_do_not_share_entries():
+    cache = LLMCache(":memory:")
+    LangChainLLM(llm=StubChatModel("stub reply.", model_name="stub-a"), cache=cache).query("prompt")
+    other = StubChatModel("other reply.", model_name="stub-b")
+    assert LangChainLLM(llm=other, cache=cache).query("prompt") == "other reply."
@@ -0,0 +1,67 @@
+#test_logic_parser.py
+
+# ClauseReader fed in pieces of any size, and iter_clauses' error reporting
+
+import pytest
+
+from logic_parser import ClauseReader, ParseError, iter_clauses
+
+PROGRAM = """parent(tom, bob). % tom is bob's parent
+% a whole-line comment
+uncle(X, Y) :-
+    parent(Z, Y),
+    sibling(X, Z).
+likes('Ann', 'bob').
+said('it''s', x).
+"""
+
+EXPECTED = [
+    ("fact", "parent", ["tom", "bob"]),
+    ("rule", "uncle(X, Y) :- parent(Z, Y), sibling(X, Z)",
+     ("uncle", ["X", "Y"]), [("parent", ["Z", "Y"]), ("sibling", ["X", "Z"])]),
+    ("fact", "likes", ["'Ann'", "bob"]),  # 'bob' is a plain atom: quotes dropped
+    ("fact", "said", ["'it''s'", "x"]),
+]
+
+
+def read_in_pieces(text, size):
+    reader = ClauseReader()
+    clauses = []
+    for start in range(0, len(text), size):
+        clauses.extend(reader.feed(text[start:start + size]))
+    clauses.extend(reader.close())
+    return clauses
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 16, len(PROGRAM)])
+def test_clauses_split_across_chunks(size):
+    assert read_in_pieces(PROGRAM, size) == EXPECTED
+
+
+def test_iter_clauses_matches_the_reader():
+    assert list(iter_clauses(PROGRAM, chunk_size=5)) == EXPECTED
+    assert list(iter_clauses(PROGRAM.splitlines(keepends=True))) == EXPECTED
+
+
+def test_block_comment_across_lines():
+    assert list(iter_clauses("a(x). /* skip\n b(z). */ b(y).")) == [
+        ("fact", "a", ["x"]),
+        ("fact", "b", ["y"]),
+    ]
+
+
+def test_last_clause_without_newline():
+    assert read_in_pieces("a(x).\nb(y).", 4) == [("fact", "a", ["x"]), ("fact", "b", ["y"])]
+
+
+def test_missing_period_is_reported_and_reading_goes_on():
+    errors = []
+    clauses = list(iter_clauses("a(x)\nb(y).", on_error=errors.append))
+    assert clauses == [("fact", "a", ["x"]), ("fact", "b", ["y"])]
+    assert [(e.message, e.line) for e in errors] == [("Missing period at end.", 1)]
+
+
+def test_errors_raise_without_a_handler():
+    with pytest.raises(ParseError) as error:
+        list(iter_clauses("a(x).\nb('y).\n"))
+    assert error.value.line == 2
@@ -0,0 +1,77 @@
+#test_logic_repair.py
+
+# repair_logic on the usual defects of LLM output, and RuleRepairer streaming
+
+from logic_repair import RuleRepairer, repair_logic
+from logic_utils import check_logic_validity
+
+UNCLE = "uncle(X, Y) :- parent(Z, Y), sibling(X, Z)."
+
+
+def test_code_fences_are_removed():
+    repaired, fixes = repair_logic(f"```prolog\n{UNCLE}\n```")
+    assert repaired == UNCLE
+    assert fixes == ["Line 1: removed code fence", "Line 3: removed code fence"]
+
+
+def test_surrounding_prose_is_dropped():
+    repaired, fixes = repair_logic(f"Here are the rules:\n{UNCLE}\nThese define uncles.")
+    assert repaired == UNCLE
+    assert len(fixes) == 2 and all("dropped non-clause line" in fix for fix in fixes)
+
+
+def test_bullets_and_labels_are_removed():
+    repaired, _ = repair_logic(f"1. Uncle: {UNCLE}\n- parent(ann, bob).")
+    assert repaired == f"{UNCLE}\nparent(ann, bob)."
+
+
+def test_missing_period_is_added():
+    repaired, fixes = repair_logic("uncle(X, Y) :- parent(Z, Y), sibling(X, Z)\nparent(ann, bob).")
+    assert repaired == f"{UNCLE}\nparent(ann, bob)."
+    assert fixes == ["Line 1: added missing period"]
+
+
+def test_trailing_separator_becomes_a_period():
+    repaired, fixes = repair_logic("g(X) :- p(X),\nh(X) :- q(X).")
+    assert repaired == "g(X) :- p(X).\nh(X) :- q(X)."
+    assert fixes == ["Line 1: replaced trailing separator with a period"]
+
+
+def test_missing_closing_parenthesis_is_added():
+    repaired, fixes = repair_logic("uncle(X, Y) :- parent(Z, Y), sibling(X, Z")
+    assert repaired == UNCLE
+    assert "Line 1: added missing ')'" in fixes
+
+
+def test_extra_closing_parenthesis_mid_clause_is_removed():
+    repaired, fixes = repair_logic("uncle(X, Y) :- parent(Z, Y)), sibling(X, Z).")
+    assert repaired == UNCLE
+    assert fixes == ["Line 1: removed extra ')'"]
+
+
+def test_extra_closing_parenthesis_at_the_end_is_removed():
+    repaired, _ = repair_logic("parent(ann, bob)).")
+    assert repaired == "parent(ann, bob)."
+
+
+def test_parentheses_in_quotes_are_not_counted():
+    repaired, fixes = repair_logic("says(ann, ')').")
+    assert repaired == "says(ann, ')')."
+    assert fixes == []
+
+
+def test_multi_line_rule_is_kept_whole():
+    text = "grandparent(X, Y) :-\n    parent(X, Z),\n    parent(Z, Y)"
+    repaired, _ = repair_logic(text)
+    assert not check_logic_validity(repaired)
+    assert repaired.endswith("parent(Z, Y).")
+
+
+def test_streamed_pieces_match_whole_text():
+    text = "```\nHere you go:\nuncle(X, Y) :- parent(Z, Y)), sibling(X, Z)\nparent(ann, bob),\n```"
+    repairer = RuleRepairer()
+    lines = []
+    for start in range(0, len(text), 4):
+        lines.extend(repairer.feed(text[start:start + 4]))
+    lines.extend(repairer.close())
+    assert ("\n".join(lines).strip("\n"), repairer.fixes) == repair_logic(text)
@@ -0,0 +1,91 @@
+#test_retriever.py
+
+# KBRetriever: BM25 ranking over a KB file and re-indexing when it changes
+
+import os
+
+from retriever import KBIndex, KBRetriever
+
+KB = """parent(ann, bob).
+parent(bob, cal).
+parent(bob, dan).
+sibling(cal, dan).
+likes(ann, tea).
+sibling(X, Y) :- sibling(Y, X).
+"""
+
+
+def write_kb(path, text):
+    path.write_text(text)
+    # Make sure the change is seen even within the file system's mtime resolution
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def contents(documents):
+    return [document.page_content for document in documents]
+
+
+def test_ranks_rarer_terms_higher():
+    index = KBIndex()
+    index.add("a", ["parent", "ann", "bob"])
+    index.add("b", ["parent", "bob", "cal"])
+    index.add("c", ["likes", "ann", "tea"])
+    # "tea" occurs once, "parent" twice: the likes document comes first
+    assert [index.docs[doc_id] for doc_id, _ in index.search("tea parent", 3)] == ["c", "a", "b"]
+
+
+def test_more_matching_terms_rank_higher():
+    index = KBIndex()
+    index.add("a", ["parent", "ann", "bob"])
+    index.add("b", ["parent", "bob", "cal"])
+    ranked = index.search("parent of cal", 2)
+    assert index.docs[ranked[0][0]] == "b"
+    assert ranked[0][1] > ranked[1][1]
+
+
+def test_invoke_returns_matching_clauses(tmp_path):
+    path = tmp_path / "kb.txt"
+    write_kb(path, KB)
+    retriever = KBRetriever(str(path), k=3)
+    found = contents(retriever.invoke("Who are Dan's siblings?"))
+    assert found[0] == "sibling(cal, dan)."
+    assert "sibling(X, Y) :- sibling(Y, X)." in found
+    assert all("sibling" in text or "dan" in text for text in found)
+
+
+def test_plural_words_match_predicates(tmp_path):
+    path = tmp_path / "kb.txt"
+    write_kb(path, KB)
+    assert "likes(ann, tea)." in contents(KBRetriever(str(path)).invoke("teas"))
+
+
+def test_no_match_returns_the_kb_summary(tmp_path):
+    path = tmp_path / "kb.txt"
+    write_kb(path, KB)
+    documents = KBRetriever(str(path)).invoke("weather forecast")
+    assert len(documents) == 1 and documents[0].metadata["summary"]
+
+
+def test_changed_kb_is_reindexed(tmp_path):
+    path = tmp_path / "kb.txt"
+    write_kb(path, KB)
+    retriever = KBRetriever(str(path))
+    assert "likes(ann, tea)." in contents(retriever.invoke("tea"))
+
+    write_kb(path, KB.replace("likes(ann, tea).", "likes(ann, coffee)."))
+    assert retriever.invoke("tea")[0].metadata.get("summary")
+    assert contents(retriever.invoke("coffee")) == ["likes(ann, coffee)."]
+    # Only the changed fact was swapped: one removed slot, one new document
+    assert retriever.index.removed == 1
+    assert len(retriever.index) == KB.count("\n")
+
+
+def test_many_removals_compact_the_index(tmp_path):
+    path = tmp_path / "kb.txt"
+    write_kb(path, KB)
+    retriever = KBRetriever(str(path))
+    write_kb(path, "likes(eve, tea).\n")
+    assert contents(retriever.invoke("tea")) == ["likes(eve, tea)."]
+    assert retriever.index.removed == 0
+    assert retriever.index.docs == [("likes", ("eve", "tea"))]
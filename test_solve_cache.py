@@ -0,0 +1,66 @@
+#test_solve_cache.py
+
+# canonicalize_program and SolveCache keyed on (KB, canonical program)
+
+from kb_loader import load_kb
+from solve_cache import SolveCache, canonicalize_program, make_solve_key
+
+PROGRAM = """parent(ann, bob).
+parent(bob, cal).
+grandparent(X, Y) :- parent(X, Z), parent(Z, Y)."""
+
+
+def test_variables_are_alpha_renamed():
+    assert canonicalize_program("g(X, Y) :- p(X, Z), p(Z, Y).") == \
+        canonicalize_program("g(A, B) :- p(A, Mid), p(Mid, B).") == \
+        "g(V0, V1) :- p(V0, V2), p(V2, V1)."
+
+
+def test_renaming_keeps_distinct_variables_apart():
+    assert canonicalize_program("s(X, Y) :- p(X, Y).") != canonicalize_program("s(X, X) :- p(X, X).")
+
+
+def test_clause_order_spacing_and_duplicates_do_not_matter():
+    shuffled = """grandparent(A,B):-parent(A,C),parent(C,B).
+parent(bob,   cal).
+parent(ann, bob).
+parent(ann, bob)."""
+    assert canonicalize_program(shuffled) == canonicalize_program(PROGRAM)
+
+
+def test_constants_are_not_renamed():
+    assert canonicalize_program("p(X) :- q(X, tom).") != canonicalize_program("p(X) :- q(X, bob).")
+
+
+def test_equivalent_program_is_a_hit():
+    cache = SolveCache()
+    first = cache.solve(PROGRAM)
+    assert ("grandparent", ("ann", "cal")) in first
+    renamed = "parent(bob, cal).\nparent(ann, bob).\ngrandparent(P, Q) :- parent(P, R), parent(R, Q)."
+    assert cache.solve(renamed) is first
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_different_program_is_a_miss():
+    cache = SolveCache()
+    cache.solve(PROGRAM)
+    cache.solve(PROGRAM + "\nparent(cal, dan).")
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_key_depends_on_the_kb(tmp_path):
+    path = tmp_path / "kb.txt"
+    path.write_text("parent(ann, bob).\n")
+    before = make_solve_key(PROGRAM, load_kb(str(path), use_snapshot=False))
+    path.write_text("parent(ann, bob).\nparent(bob, cal).\n")
+    after = make_solve_key(PROGRAM, load_kb(str(path), use_snapshot=False))
+    assert before != after
+    assert before != make_solve_key(PROGRAM)
+
+
+def test_results_persist_on_disk(tmp_path):
+    path = str(tmp_path / "solve.sqlite")
+    result = SolveCache(path).solve(PROGRAM)
+    cache = SolveCache(path)
+    assert cache.get(make_solve_key(PROGRAM)) == result
+    assert cache.hits == 1
@@ -0,0 +1,158 @@
+#test_solver_equivalence.py
+
+# Randomized checks that every fast path of LogicSolver gives the same
+# derived facts as a plain full solve of the same program:
+#   - assert_fact / retract_fact (DRed maintenance)
+#   - query() (magic sets)
+#   - the linear-closure operator (closure.LinearClosure)
+#   - fork() of a materialised solver (and the symbols it adds)
+#   - the NumPy engine (skipped without NumPy)
+
+import random
+
+import pytest
+
+import logic_utils
+from logic_utils import LogicSolver
+
+# Programs over the base predicates e/2 and f/2; random facts also go into
+# t/2, so some rule heads have stored facts too
+PROGRAMS = [
+    # Right-linear transitive closure
+    "t(X, Y) :- e(X, Y).\nt(X, Y) :- e(X, Z), t(Z, Y).",
+    # Left-linear closure over two edge predicates
+    "t(X, Y) :- e(X, Y).\nt(X, Y) :- f(X, Y).\nt(X, Y) :- t(X, Z), e(Z, Y).\nt(X, Y) :- t(X, Z), f(Z, Y).",
+    # Closure whose steps are not all first steps (not handled by the operator)
+    "t(X, Y) :- e(X, Y).\nt(X, Y) :- f(X, Z), t(Z, Y).",
+    # Non-linear recursion
+    "t(X, Y) :- e(X, Y).\nt(X, Y) :- t(X, Z), t(Z, Y).",
+    # Symmetry, and rules on top of a symmetric relation
+    "e(X, Y) :- e(Y, X).\ns(X, Y) :- f(Z, X), e(Z, Y).",
+    # Several strata, a rule head that also has stored facts
+    "t(X, Y) :- e(X, Y).\nt(X, Y) :- e(X, Z), t(Z, Y).\nf(X, Y) :- t(X, Y), e(Y, X).\nu(X, Y) :- f(X, Z), f(Z, Y).",
+]
+
+TRIALS = 60
+
+
+def random_facts(rng, nodes, count):
+    facts = []
+    for _ in range(count):
+        pred = rng.choice(("e", "e", "f", "t"))
+        facts.append((pred, [f"n{rng.randrange(nodes)}", f"n{rng.randrange(nodes)}"]))
+    return facts
+
+
+def program_text(facts, rules):
+    lines = [f"{pred}({', '.join(args)})." for pred, args in facts]
+    return "\n".join(lines) + "\n" + rules
+
+
+def full_solve(facts, rules):
+    return LogicSolver().solve_logic(program_text(facts, rules))
+
+
+def trials():
+    rng = random.Random(6)
+    for trial in range(TRIALS):
+        nodes = rng.randint(2, 8)
+        yield rng, nodes, random_facts(rng, nodes, rng.randint(0, 14)), PROGRAMS[trial % len(PROGRAMS)]
+
+
+def test_assert_retract_match_full_solve():
+    for rng, nodes, facts, rules in trials():
+        solver = LogicSolver()
+        solver.solve_logic(program_text(facts, rules))
+        stored = {(pred, tuple(args)) for pred, args in facts}
+        for _ in range(6):
+            if stored and rng.random() < 0.5:
+                fact = rng.choice(sorted(stored))
+                assert solver.retract_fact((fact[0], list(fact[1])))
+                stored.discard(fact)
+            else:
+                pred, args = random_facts(rng, nodes, 1)[0]
+                solver.assert_fact((pred, args))
+                stored.add((pred, tuple(args)))
+            expected = full_solve([(pred, list(args)) for pred, args in sorted(stored)], rules)
+            assert solver.derived_facts() == expected, rules
+
+
+def test_query_matches_full_solve():
+    for rng, nodes, facts, rules in trials():
+        derived = full_solve(facts, rules)
+        head = rules.split("\n")[-1].split("(")[0]
+        constant = f"n{rng.randrange(nodes)}"
+        for goal, keep in (
+            (f"{head}({constant}, Y)", lambda args: args[0] == constant),
+            (f"{head}(X, {constant})", lambda args: args[1] == constant),
+            (f"{head}(X, Y)", lambda args: True),
+        ):
+            solver = LogicSolver()
+            solver.parse_logic(program_text(facts, rules))
+            expected = {args for pred, args in derived if pred == head and keep(args)}
+            answers = {args for args in solver.query(goal) if keep(args)}
+            # query() also answers with stored facts of the head predicate
+            stored = {tuple(args) for pred, args in facts if pred == head and keep(args)}
+            assert answers - stored == expected - stored, goal
+
+
+def test_linear_closure_matches_generic_evaluation(monkeypatch):
+    results = []
+    for _, _, facts, rules in trials():
+        results.append(full_solve(facts, rules))
+    monkeypatch.setattr(logic_utils.LinearClosure, "detect", classmethod(lambda cls, preds, rules: None))
+    for (_, _, facts, rules), expected in zip(trials(), results):
+        assert full_solve(facts, rules) == expected, rules
+
+
+def test_fork_leaves_base_unchanged():
+    for rng, nodes, facts, rules in trials():
+        base = LogicSolver()
+        base.solve_logic(program_text(facts, rules))
+        before = base.derived_facts()
+        fork = base.fork()
+        extra = random_facts(rng, nodes, 3)
+        for pred, args in extra:
+            fork.assert_fact((pred, args))
+        fork.add_rule("w(X, Y) :- e(X, Y), f(Y, X)")
+        assert base.derived_facts() == before
+        assert fork.derived_facts() == full_solve(facts + extra, rules + "\nw(X, Y) :- e(X, Y), f(Y, X).")
+
+
+def test_fork_keeps_new_names_to_itself():
+    base = LogicSolver()
+    base.solve_logic("e(a, b).\nt(X, Y) :- e(X, Y).")
+    size = len(base.facts.symbols)
+    first, second = base.fork(), base.fork()
+    first.assert_fact(("e", ("b", "new1")))
+    second.assert_fact(("e", ("b", "new2")))
+    third = first.fork()
+    third.assert_fact(("e", ("new1", "new3")))
+    assert len(base.facts.symbols) == size
+    assert ("t", ("b", "new1")) in first.derived_facts()
+    assert ("t", ("b", "new2")) in second.derived_facts()
+    assert ("t", ("b", "new2")) not in first.derived_facts()
+    assert {("t", ("b", "new1")), ("t", ("new1", "new3"))} <= third.derived_facts()
+    assert len(first.facts.symbols) == size + 1
+
+
+def test_numpy_engine_matches_python_engine():
+    pytest.importorskip("numpy")
+    for _, _, facts, rules in trials():
+        solver = LogicSolver(engine="numpy")
+        assert solver.solve_logic(program_text(facts, rules)) == full_solve(facts, rules), rules
+
+
+def test_worker_pool_matches_in_process(monkeypatch):
+    import parallel_eval
+    if not parallel_eval.fork_available():
+        pytest.skip("parallel evaluation needs fork")
+    # Every round goes to the workers, however small (and however many CPUs)
+    monkeypatch.setattr(parallel_eval, "available_cpus", lambda: 8)
+    monkeypatch.setattr(parallel_eval, "PARALLEL_MIN_ROWS", 0)
+    for trial, (_, _, facts, rules) in enumerate(trials()):
+        if trial % 4:
+            continue  # Forking is slow: a sample is enough
+        solver = LogicSolver(workers=3)
+        assert solver.workers == 3
+        assert solver.solve_logic(program_text(facts, rules)) == full_solve(facts, rules), rules